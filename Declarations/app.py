@@ -1,24 +1,77 @@
+# Création de l'application
+# Les extensions (base de données, utilisateurs, cache) sont créées ici sans application : create_app() construit une
+# application, lui applique une configuration, branche les extensions, puis importe et enregistre les blueprints
+# listés dans BLUEPRINTS (un par entité, voir routes/). Importer ce module ne charge donc ni les routes ni les
+# modèles : chaque processus (serveur de développement, commandes flask, worker gunicorn, tests) crée l'application
+# dont il a besoin, avec sa propre base de données s'il le faut. Le point d'entrée WSGI est wsgi.py.
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+import importlib
 import os
-from .constantes import SECRET_KEY
+from .configuration import configurer
+from .moteur import BaseDeDonnees
+from .instrumentation import installer_compteur, installer_mesures
+from .cache import Cache
 
 chemin_actuel = os.path.dirname(os.path.abspath(__file__))
 templates = os.path.join(chemin_actuel, "templates")
 statics = os.path.join(chemin_actuel, "static")
 
 
-app = Flask("Application", template_folder=templates, static_folder=statics)
-# On configure le secret
-app.config['SECRET_KEY'] = SECRET_KEY
-# on configure la base de données
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///db.sqlite"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-# On met en place l'extension
-db = SQLAlchemy(app)
+# On crée les extensions, liées à chaque application par create_app()
+db = BaseDeDonnees()
+login = LoginManager()
+cache = Cache()
 
-# On met en place la gestion des utilisateurs
-login = LoginManager(app)
 
-from .routes import generic
\ No newline at end of file
+def create_app(config=None):
+    """
+    Fonction qui crée et configure une application
+    :param config: dictionnaire de configuration qui remplace les autres sources (ex : {"BASE_DE_DONNEES":
+                   "sqlite:////tmp/essai.sqlite", "TESTING": True}), ou None
+    :returns: application Flask
+    """
+    app = Flask("Application", template_folder=templates, static_folder=statics)
+    # On charge la configuration (constantes.py, fichier DECLARATIONS_CONFIG, variables d'environnement DECLARATIONS_*)
+    configurer(app, config)
+    # On met en place l'extension (pool de connexions, base des lectures pour les requêtes GET)
+    db.init_app(app)
+    # On règle chaque nouvelle connexion SQLite (journal WAL, busy_timeout...)
+    db.installer_pragmas(app)
+    # On compte les requêtes SELECT de chaque page
+    installer_compteur(app, *db.moteurs(app))
+    # On mesure chaque requête : SQL, rendu des templates, taille (Server-Timing, /metrics, requêtes lentes)
+    installer_mesures(app, *db.moteurs(app))
+
+    # On met en place la gestion des utilisateurs
+    login.init_app(app)
+    login.login_view = "utilisateurs.connexion"
+
+    # On met en place le cache des pages publiques
+    cache.init_app(app)
+
+    # On enregistre les routes et les commandes en ligne de commande (flask import...)
+    enregistrer_blueprints(app)
+
+    # On met à jour le schéma de la base de données (index, nouvelles colonnes) si nécessaire
+    from .modeles.migrations import appliquer_migrations
+    with app.app_context():
+        appliquer_migrations()
+    # les connexions ouvertes pendant la création ne doivent pas passer aux processus créés ensuite (workers de
+    # gunicorn --preload) : chacun ouvrira les siennes
+    for moteur in db.moteurs(app):
+        moteur.dispose()
+    return app
+
+
+def enregistrer_blueprints(app):
+    """
+    Fonction qui importe les modules de routes listés dans la configuration BLUEPRINTS et enregistre leurs blueprints
+    (chaque module de routes/ définit un blueprint qui porte son nom), puis celui des commandes
+    :param app: application Flask
+    """
+    for nom in app.config["BLUEPRINTS"]:
+        module = importlib.import_module("{}.routes.{}".format(__package__, nom))
+        app.register_blueprint(getattr(module, nom))
+    from .commandes import commandes
+    app.register_blueprint(commandes)
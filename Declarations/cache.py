@@ -0,0 +1,203 @@
+# Cache des pages publiques
+# Les pages consultables sans compte ne changent que lorsqu'un utilisateur connecté modifie la base par les méthodes
+# ajout_*, modification_* et suppression_* des modèles. On conserve donc le HTML rendu de ces pages, identifié par le
+# chemin de l'URL et ses paramètres, et on le renvoie tel quel aux visiteurs anonymes sans interroger la base ni
+# rendre les templates. Après chaque écriture, les méthodes des modèles invalident les chemins des pages concernées.
+#
+# Deux stockages sont disponibles (paramètre CACHE_TYPE de l'application) :
+# - "memoire" : dictionnaire propre à chaque processus, avec éviction LRU et durée de vie (TTL) ;
+# - "fichiers" : un fichier par page dans CACHE_REPERTOIRE, partagé par tous les processus de l'application.
+# Avec plusieurs processus et le stockage en mémoire, seule la mémoire du processus qui a traité la modification est
+# invalidée : les autres pages expirent au bout de CACHE_DUREE secondes.
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import quote, unquote, urlencode
+
+from flask import request, session, make_response
+from flask_login import current_user
+
+
+def correspond(chemin, chemins):
+    """
+    Fonction qui indique si un chemin fait partie des chemins à invalider. Un chemin terminé par * désigne tous les
+    chemins qui commencent par ce qui précède (ex : "/salles/*")
+    :param chemin: chemin d'une page en cache
+    :param chemins: chemins à invalider
+    :returns: booléen
+    """
+    for motif in chemins:
+        if motif.endswith("*"):
+            if chemin.startswith(motif[:-1]):
+                return True
+        elif chemin == motif:
+            return True
+    return False
+
+
+class CacheMemoire:
+    """ Stockage des pages dans la mémoire du processus, avec éviction des pages les moins récemment lues """
+
+    def __init__(self, taille=500, duree=300):
+        self.taille = taille
+        self.duree = duree
+        self.entrees = OrderedDict()
+        self.verrou = threading.Lock()
+
+    def lire(self, chemin, parametres):
+        with self.verrou:
+            entree = self.entrees.get((chemin, parametres))
+            if entree is None:
+                return None
+            expiration, page = entree
+            if expiration < time.time():
+                del self.entrees[(chemin, parametres)]
+                return None
+            self.entrees.move_to_end((chemin, parametres))
+            return page
+
+    def ecrire(self, chemin, parametres, page):
+        with self.verrou:
+            self.entrees[(chemin, parametres)] = (time.time() + self.duree, page)
+            self.entrees.move_to_end((chemin, parametres))
+            while len(self.entrees) > self.taille:
+                self.entrees.popitem(last=False)
+
+    def invalider(self, chemins):
+        with self.verrou:
+            for cle in [cle for cle in self.entrees if correspond(cle[0], chemins)]:
+                del self.entrees[cle]
+
+    def vider(self):
+        with self.verrou:
+            self.entrees.clear()
+
+
+class CacheFichiers:
+    """ Stockage des pages dans un répertoire, un fichier par page, partagé entre les processus """
+
+    def __init__(self, repertoire=None, taille=5000, duree=300):
+        self.repertoire = repertoire or os.path.join(tempfile.gettempdir(), "declarations-cache")
+        self.taille = taille
+        self.duree = duree
+        os.makedirs(self.repertoire, exist_ok=True)
+
+    def fichier(self, chemin, parametres):
+        # le chemin encodé en tête du nom de fichier permet d'invalider sans ouvrir les fichiers
+        empreinte = hashlib.sha1(parametres.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.repertoire, "{}@{}".format(quote(chemin, safe=""), empreinte))
+
+    def lire(self, chemin, parametres):
+        fichier = self.fichier(chemin, parametres)
+        try:
+            with open(fichier, "rb") as f:
+                expiration, page = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expiration < time.time():
+            self.supprimer(fichier)
+            return None
+        # la date de modification du fichier sert de date de dernière lecture pour l'éviction
+        os.utime(fichier)
+        return page
+
+    def ecrire(self, chemin, parametres, page):
+        fichier = self.fichier(chemin, parametres)
+        # écriture dans un fichier temporaire puis renommage, pour qu'un autre processus ne lise pas un fichier partiel
+        descripteur, temporaire = tempfile.mkstemp(dir=self.repertoire, prefix=".")
+        with os.fdopen(descripteur, "wb") as f:
+            pickle.dump((time.time() + self.duree, page), f)
+        os.replace(temporaire, fichier)
+        noms = [nom for nom in os.listdir(self.repertoire) if not nom.startswith(".")]
+        if len(noms) > self.taille:
+            fichiers = sorted((os.path.join(self.repertoire, nom) for nom in noms), key=self.date_lecture)
+            for ancien in fichiers[:len(noms) - self.taille]:
+                self.supprimer(ancien)
+
+    def invalider(self, chemins):
+        for nom in os.listdir(self.repertoire):
+            if "@" in nom and correspond(unquote(nom.rsplit("@", 1)[0]), chemins):
+                self.supprimer(os.path.join(self.repertoire, nom))
+
+    def vider(self):
+        for nom in os.listdir(self.repertoire):
+            self.supprimer(os.path.join(self.repertoire, nom))
+
+    @staticmethod
+    def date_lecture(fichier):
+        try:
+            return os.path.getmtime(fichier)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def supprimer(fichier):
+        try:
+            os.remove(fichier)
+        except OSError:
+            pass
+
+
+class Cache:
+    """ Extension Flask qui met en cache les pages publiques et les invalide après les modifications """
+
+    def __init__(self, app=None):
+        self.stockage = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        type_cache = app.config.get("CACHE_TYPE")
+        duree = app.config.get("CACHE_DUREE", 300)
+        if type_cache == "memoire":
+            self.stockage = CacheMemoire(taille=app.config.get("CACHE_TAILLE", 500), duree=duree)
+        elif type_cache == "fichiers":
+            self.stockage = CacheFichiers(repertoire=app.config.get("CACHE_REPERTOIRE"),
+                                          taille=app.config.get("CACHE_TAILLE", 5000), duree=duree)
+        else:
+            self.stockage = None
+
+    def page(self, vue):
+        """
+        Décorateur des routes dont la page peut être mise en cache. Seules les requêtes GET des visiteurs anonymes
+        sans message flash en attente sont servies depuis le cache ou enregistrées dans le cache.
+        """
+        @wraps(vue)
+        def vue_en_cache(*args, **kwargs):
+            if self.stockage is None or request.method != "GET" or current_user.is_authenticated \
+                    or session.get("_flashes"):
+                return vue(*args, **kwargs)
+
+            parametres = urlencode(sorted(request.args.items(multi=True)))
+            page = self.stockage.lire(request.path, parametres)
+            if page is not None:
+                corps, type_contenu = page
+                reponse = make_response(corps)
+                reponse.content_type = type_contenu
+                reponse.headers["X-Cache"] = "HIT"
+                return reponse
+
+            reponse = make_response(vue(*args, **kwargs))
+            if reponse.status_code == 200 and not session.get("_flashes"):
+                self.stockage.ecrire(request.path, parametres, (reponse.get_data(), reponse.content_type))
+                reponse.headers["X-Cache"] = "MISS"
+            return reponse
+        return vue_en_cache
+
+    def invalider(self, *chemins):
+        """
+        Fonction qui retire du cache les pages des chemins donnés (toutes les variantes de paramètres)
+        :param chemins: chemins exacts ("/objets_voles/3") ou préfixes terminés par * ("/salles/*")
+        """
+        if self.stockage is not None:
+            self.stockage.invalider(chemins)
+
+    def vider(self):
+        """ Fonction qui retire toutes les pages du cache """
+        if self.stockage is not None:
+            self.stockage.vider()
@@ -0,0 +1,174 @@
+# Commandes en ligne de commande de l'application (flask <commande>, avec FLASK_APP=run.py)
+import os
+
+import click
+from flask import Blueprint
+
+
+# blueprint sans route : ses commandes sont ajoutées directement à la commande flask
+commandes = Blueprint("commandes", __name__, cli_group=None)
+
+
+@commandes.cli.command("import")
+@click.argument("chemin", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "format_fichier", type=click.Choice(["csv", "json"]), default=None,
+              help="Format du fichier (par défaut, déduit de l'extension).")
+@click.option("--lot", "taille_lot", type=click.IntRange(min=1), default=None,
+              help="Nombre de procès-verbaux insérés par transaction.")
+@click.option("--differer", is_flag=True, help="Ajoute l'import à la file d'attente de flask worker.")
+def commande_import(chemin, format_fichier, taille_lot, differer):
+    """ Importe des procès-verbaux depuis un fichier CSV ou JSON. """
+    from .modeles.importation import importer, TAILLE_LOT
+
+    if format_fichier is None:
+        extension = os.path.splitext(chemin)[1].lower()
+        format_fichier = "json" if extension in (".json", ".jsonl", ".ndjson") else "csv"
+
+    if differer:
+        from .app import db
+        from .modeles.taches import differer as differer_tache
+        id = differer_tache("import", chemin=os.path.abspath(chemin), format_fichier=format_fichier,
+                            taille_lot=taille_lot)
+        db.session.commit()
+        click.echo("Tâche {} ajoutée à la file d'attente.".format(id))
+        return
+
+    with open(chemin, encoding="utf-8-sig", newline="") as fichier:
+        rapport = importer(fichier, format_fichier=format_fichier, taille_lot=taille_lot or TAILLE_LOT)
+
+    for numero, erreurs in rapport.erreurs:
+        for erreur in erreurs:
+            click.echo("Ligne {} : {}".format(numero, erreur), err=True)
+    click.echo("{} lignes lues, {} procès-verbaux ajoutés, {} déjà présents, {} lignes en erreur."
+               .format(rapport.lues, rapport.inserees, rapport.doublons, len(rapport.erreurs)))
+    click.echo("Durée : {:.2f} s ({:.0f} lignes par seconde).".format(rapport.duree, rapport.debit))
+
+
+@commandes.cli.command("export")
+@click.argument("entite", type=click.Choice(["proces_verbal", "personne", "adresse", "source", "objet", "theatre"]))
+@click.option("--format", "format_export", type=click.Choice(["csv", "ndjson", "xml"]), default="csv",
+              help="Format de l'export.")
+@click.option("--sortie", type=click.File("w", encoding="utf-8"), default="-",
+              help="Fichier de sortie (par défaut, la sortie standard).")
+@click.option("--debut", default=None, help="Date minimale des procès-verbaux (AAAA-MM-JJ).")
+@click.option("--fin", default=None, help="Date maximale des procès-verbaux (AAAA-MM-JJ).")
+@click.option("--theatre", "id_theatre", type=int, default=None, help="Id du théâtre.")
+@click.option("--commissaire", "id_commissaire", type=int, default=None, help="Id du commissaire.")
+def commande_export(entite, format_export, sortie, debut, fin, id_theatre, id_commissaire):
+    """ Exporte une table de la base en CSV, JSON Lines ou XML. """
+    from .modeles.exportation import exporter
+
+    # une date invalide arrête la commande plutôt que d'exporter toute la table
+    try:
+        morceaux = exporter(entite, format_export, debut=debut, fin=fin, id_theatre=id_theatre,
+                            id_commissaire=id_commissaire)
+    except ValueError as erreur:
+        raise click.UsageError(str(erreur))
+    for morceau in morceaux:
+        sortie.write(morceau)
+
+
+@commandes.cli.command("geocoder")
+@click.argument("chemin", type=click.Path(exists=True, dir_okay=False))
+def commande_geocoder(chemin):
+    """ Enregistre les coordonnées des adresses depuis un fichier CSV (rue, quartier, latitude, longitude). """
+    from .modeles.importation import geocoder
+
+    with open(chemin, encoding="utf-8-sig", newline="") as fichier:
+        rapport = geocoder(fichier)
+
+    for numero, erreurs in rapport.erreurs:
+        for erreur in erreurs:
+            click.echo("Ligne {} : {}".format(numero, erreur), err=True)
+    click.echo("{} lignes lues, {} adresses localisées, {} lignes en erreur."
+               .format(rapport.lues, rapport.inserees, len(rapport.erreurs)))
+
+
+@commandes.cli.command("statistiques")
+def commande_statistiques():
+    """ Recalcule les compteurs et les agrégats des statistiques à partir des tables. """
+    from .app import db, cache
+    from .modeles.statistiques import recompter, recalculer_agregats
+
+    recompter()
+    recalculer_agregats()
+    db.session.commit()
+    cache.vider()
+    click.echo("Compteurs et agrégats recalculés.")
+
+
+@commandes.cli.command("doublons")
+@click.option("--seuil", type=click.FloatRange(0, 1), default=None,
+              help="Similarité minimale des noms et prénoms (entre 0 et 1).")
+@click.option("--recalculer", is_flag=True, help="Recalcule les clés phonétiques de toutes les personnes.")
+def commande_doublons(seuil, recalculer):
+    """ Affiche les groupes de doublons probables parmi les personnes. """
+    from .app import db
+    from .modeles.rapprochement import completer_cles, grappes, SEUIL_SIMILARITE
+
+    # les personnes ajoutées directement dans la base n'ont pas encore de clé phonétique
+    if completer_cles(toutes=recalculer):
+        db.session.commit()
+    resultat = grappes(SEUIL_SIMILARITE if seuil is None else seuil)
+    for grappe in resultat:
+        click.echo(" | ".join("{} : {} {}{}".format(id, prenom or "", nom, ", " + qualite if qualite else "")
+                              for id, nom, prenom, qualite in grappe))
+    click.echo("{} groupes de doublons probables.".format(len(resultat)))
+
+
+@commandes.cli.command("fusion")
+@click.argument("id_personne", type=int)
+@click.argument("doublons", type=int, nargs=-1, required=True)
+def commande_fusion(id_personne, doublons):
+    """ Fusionne les personnes DOUBLONS dans la personne ID_PERSONNE. """
+    from .modeles.donnees import Personne
+
+    statut, informations = Personne.fusion_personnes(id=id_personne, ids_doublons=doublons)
+    if statut is not True:
+        raise click.ClickException(", ".join(informations))
+    click.echo("{} personnes fusionnées dans {} {} ({}).".format(len(doublons), informations.prenom, informations.nom,
+                                                                   informations.id))
+
+
+@commandes.cli.command("worker")
+@click.option("--fils", type=click.IntRange(1), default=None,
+              help="Nombre de fils d'exécution ou de processus (par défaut TACHES_FILS).")
+@click.option("--processus/--threads", default=None,
+              help="Processus plutôt que fils d'exécution (par défaut TACHES_PROCESSUS).")
+@click.option("--une-fois", is_flag=True, help="S'arrête quand la file d'attente est vide.")
+def commande_worker(fils, processus, une_fois):
+    """ Exécute les tâches de la file d'attente jusqu'à Ctrl+C (voir /admin/jobs). """
+    from flask import current_app
+    from .modeles.taches import lancer_worker
+
+    app = current_app._get_current_object()
+    fils = fils or app.config["TACHES_FILS"]
+    processus = app.config["TACHES_PROCESSUS"] if processus is None else processus
+    click.echo("Worker lancé : {} {}.".format(fils, "processus" if processus else "fils d'exécution"))
+    lancer_worker(app, fils, processus=processus, une_fois=une_fois)
+
+
+@commandes.cli.command("tache")
+@click.argument("nom")
+@click.argument("parametres", default="{}")
+@click.option("--cle", default=None, help="Clé de la tâche : elle n'est pas ajoutée si une tâche de même clé attend.")
+def commande_tache(nom, parametres, cle):
+    """ Ajoute la tâche NOM à la file d'attente, avec ses PARAMETRES en JSON (ex : '{"chemin": "/tmp/pv.csv"}'). """
+    import json
+    from .app import db
+    from .modeles.taches import differer, TACHES
+
+    if nom not in TACHES:
+        raise click.ClickException("Tâche inconnue, choisir parmi : " + ", ".join(sorted(TACHES)))
+    try:
+        parametres = json.loads(parametres)
+    except ValueError as erreur:
+        raise click.ClickException("Paramètres JSON invalides : {}".format(erreur))
+    if not isinstance(parametres, dict):
+        raise click.ClickException("Les paramètres doivent être un objet JSON.")
+    id = differer(nom, cle=cle, **parametres)
+    db.session.commit()
+    if id is None:
+        click.echo("Une tâche de même clé est déjà en attente.")
+    else:
+        click.echo("Tâche {} ajoutée à la file d'attente.".format(id))
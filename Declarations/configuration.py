@@ -0,0 +1,80 @@
+# Chargement de la configuration
+# La configuration de l'application est lue dans cet ordre, chaque source remplaçant les valeurs de la précédente :
+# 1. les valeurs par défaut de constantes.py ;
+# 2. le fichier Python dont le chemin est donné par la variable d'environnement DECLARATIONS_CONFIG (mêmes noms que
+#    dans constantes.py, ex : BASE_DE_DONNEES = "sqlite:////srv/declarations/db.sqlite") ;
+# 3. les variables d'environnement préfixées par DECLARATIONS_ (ex : DECLARATIONS_SECRET_KEY=...,
+#    DECLARATIONS_POOL_TAILLE=10, DECLARATIONS_SQLITE_PRAGMAS='{"busy_timeout": 10000}'). Leur valeur est lue en JSON
+#    quand c'est possible (nombres, booléens, null, dictionnaires), sinon comme une chaîne de caractères ;
+# 4. le dictionnaire passé à create_app() (tests, scripts).
+import json
+import os
+from warnings import warn
+
+from . import constantes
+
+
+# préfixe des variables d'environnement et variable qui donne le chemin du fichier de configuration
+PREFIXE = "DECLARATIONS_"
+VARIABLE_FICHIER = "DECLARATIONS_CONFIG"
+# secret livré avec le code, qui doit être remplacé en production
+SECRET_PAR_DEFAUT = "C'est la clef secrète !"
+
+
+def lire_valeur(valeur):
+    """
+    Fonction qui convertit la valeur d'une variable d'environnement
+    :param valeur: chaîne de caractères
+    :returns: valeur JSON décodée, ou la chaîne elle-même si ce n'est pas du JSON
+    """
+    try:
+        return json.loads(valeur)
+    except ValueError:
+        return valeur
+
+
+def configurer(app, config=None):
+    """
+    Fonction qui charge la configuration de l'application (constantes.py, fichier, variables d'environnement,
+    dictionnaire) et en déduit celle de Flask-SQLAlchemy
+    :param app: application Flask
+    :param config: dictionnaire de configuration prioritaire, ou None
+    """
+    app.config.from_object(constantes)
+    if os.environ.get(VARIABLE_FICHIER):
+        app.config.from_envvar(VARIABLE_FICHIER)
+    for nom, valeur in os.environ.items():
+        if nom.startswith(PREFIXE) and nom != VARIABLE_FICHIER:
+            app.config[nom[len(PREFIXE):]] = lire_valeur(valeur)
+    if config:
+        app.config.from_mapping(config)
+
+    if app.config["SECRET_KEY"] == SECRET_PAR_DEFAUT:
+        warn("Le secret par défaut n'a pas été changé, vous devriez le faire", Warning)
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = app.config["BASE_DE_DONNEES"]
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_POOL_SIZE"] = app.config["POOL_TAILLE"]
+    app.config["SQLALCHEMY_MAX_OVERFLOW"] = app.config["POOL_DEBORDEMENT"]
+    app.config["SQLALCHEMY_POOL_TIMEOUT"] = app.config["POOL_ATTENTE"]
+    lecture = uri_lecture(app)
+    app.config["SQLALCHEMY_BINDS"] = {"lecture": lecture} if lecture else None
+
+
+def uri_lecture(app):
+    """
+    Fonction qui renvoie l'URI de la base des lectures : BASE_DE_DONNEES_LECTURE si elle est configurée, sinon le
+    fichier SQLite de la base principale ouvert en lecture seule (mode=ro)
+    :param app: application Flask
+    :returns: URI SQLAlchemy, ou None si les lectures ne sont pas séparées
+    """
+    if not app.config["LECTURE_SEULE_GET"]:
+        return None
+    if app.config["BASE_DE_DONNEES_LECTURE"]:
+        return app.config["BASE_DE_DONNEES_LECTURE"]
+    principale = app.config["BASE_DE_DONNEES"]
+    if not principale.startswith("sqlite:///") or principale in ("sqlite:///", "sqlite:///:memory:"):
+        return None
+    # chemin relatif : Flask-SQLAlchemy le résout par rapport au répertoire racine de l'application
+    chemin = os.path.join(app.root_path, principale[len("sqlite:///"):])
+    return "sqlite:///file:{}?mode=ro&uri=true".format(chemin)
@@ -1,8 +1,71 @@
-from warnings import warn
-
+# Valeurs par défaut de la configuration : elles peuvent être remplacées par un fichier de configuration ou par des
+# variables d'environnement (voir configuration.py)
 RESULTATS_PAR_PAGE = 10
 
-SECRET_KEY = "C'est la clef secrète !"
+# nombre maximal de requêtes SELECT par page, vérifié en mode debug et en mode test (voir instrumentation.py)
+NB_MAX_SELECT = 10
+
+# cache des pages publiques (voir cache.py) : "memoire", "fichiers" ou None pour le désactiver
+CACHE_TYPE = "memoire"
+# durée de vie d'une page en cache, en secondes
+CACHE_DUREE = 300
+# nombre maximal de pages en cache
+CACHE_TAILLE = 500
+# répertoire du cache "fichiers" (None : répertoire temporaire du système)
+CACHE_REPERTOIRE = None
+
+# base de données principale (lectures et écritures)
+BASE_DE_DONNEES = "sqlite:///db.sqlite"
+# base de données des lectures des requêtes GET et HEAD (copie répliquée, par exemple) ; None : le fichier de la base
+# principale ouvert en lecture seule
+BASE_DE_DONNEES_LECTURE = None
+# envoyer les lectures des requêtes GET et HEAD à la base de lecture (voir moteur.py)
+LECTURE_SEULE_GET = True
+# PRAGMA appliqués à chaque nouvelle connexion SQLite : journal WAL (les lecteurs ne bloquent pas l'écrivain),
+# synchronisation allégée (sûre en mode WAL), fichier projeté en mémoire (en octets), cache de pages (négatif : en
+# Kio) et attente d'un verrou (en millisecondes) au lieu de l'erreur "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,
+    "cache_size": -20000,
+    "busy_timeout": 5000,
+}
+# pool de connexions : nombre de connexions gardées ouvertes, connexions supplémentaires autorisées et attente
+# maximale d'une connexion libre (en secondes)
+POOL_TAILLE = 5
+POOL_DEBORDEMENT = 10
+POOL_ATTENTE = 30
+
+# mesures des requêtes (voir instrumentation.py) : en-tête Server-Timing, page /metrics (réservée aux adresses IP de
+# la liste, la machine locale par défaut ; None : toutes les adresses) et journal des requêtes plus lentes que le
+# seuil (en millisecondes, None : désactivé)
+SERVER_TIMING = True
+METRIQUES = True
+METRIQUES_ADRESSES = ["127.0.0.1", "::1"]
+SEUIL_REQUETE_LENTE = 500
 
-if SECRET_KEY == "C'est la clef secrète !":
-    warn("Le secret par défaut n'a pas été changé, vous devriez le faire", Warning)
+# nombre d'éléments au-delà duquel un champ de formulaire propose des suggestions pendant la saisie au lieu d'un menu
+# déroulant (voir templates/partials/reference.html)
+SEUIL_MENU_DEROULANT = 50
+
+# file d'attente des tâches de maintenance (voir modeles/taches.py) : nombre de fils ou de processus de flask worker,
+# processus plutôt que fils, attente quand la file est vide (en secondes), nombre d'essais d'une tâche, délai avant le
+# deuxième essai (doublé ensuite, en secondes), délai après lequel une tâche en cours immobile est reprise (en
+# secondes) et répertoire des fichiers produits (None : répertoire temporaire du système)
+TACHES_FILS = 2
+TACHES_PROCESSUS = False
+TACHES_ATTENTE = 1
+TACHES_TENTATIVES = 3
+TACHES_DELAI_REESSAI = 30
+TACHES_EXPIRATION = 600
+TACHES_REPERTOIRE = None
+# retirer les pages modifiées du cache "fichiers" par une tâche de flask worker plutôt que pendant la requête de
+# l'éditeur (voir invalider_pages() dans modeles/donnees.py)
+TACHES_DIFFEREES = False
+
+# modules de routes/ dont les blueprints sont enregistrés par create_app() (voir app.py)
+BLUEPRINTS = ["generic", "utilisateurs", "proces_verbaux", "theatres", "personnes", "objets", "sources", "adresses",
+              "api", "admin"]
+
+SECRET_KEY = "C'est la clef secrète !"
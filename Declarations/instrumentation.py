@@ -0,0 +1,221 @@
+# Instrumentation des requêtes HTTP
+# On compte les requêtes SELECT envoyées à la base de données pendant le traitement de chaque page, grâce aux
+# événements du moteur SQLAlchemy. En mode debug, une page qui dépasse NB_MAX_SELECT requêtes est signalée dans le
+# journal de l'application ; en mode test (app.testing), elle lève une exception pour faire échouer le test : c'est le
+# signe qu'une relation est chargée à la demande dans une boucle (problème N+1).
+#
+# installer_mesures() mesure aussi, pour chaque requête HTTP, le nombre et la durée totale des instructions SQL, le
+# temps de rendu des templates Jinja, la durée totale et la taille de la réponse. Ces mesures sont :
+# - envoyées au navigateur dans l'en-tête Server-Timing (onglet "Réseau" des outils de développement) ;
+# - cumulées par route dans la page /metrics, au format texte de Prometheus ;
+# - détaillées dans le journal quand la requête dépasse SEUIL_REQUETE_LENTE millisecondes, avec ses instructions SQL
+#   les plus longues.
+# Les cumuls de /metrics sont propres à chaque processus : avec plusieurs workers, chacun a les siens.
+import threading
+import time
+
+from flask import g, has_request_context, request, abort, Response
+from jinja2 import Template
+from sqlalchemy import event
+
+
+class TropDeRequetes(Exception):
+    """ Exception levée en mode test quand une page envoie trop de requêtes SELECT """
+
+
+def installer_compteur(app, *engines):
+    """
+    Fonction qui branche le compteur de requêtes SELECT sur les moteurs et l'application
+    :param app: application Flask
+    :param engines: moteurs SQLAlchemy à observer (base principale et base des lectures)
+    """
+    def compter_requete(connexion, curseur, instruction, parametres, contexte, executemany):
+        if has_request_context() and instruction.lstrip().upper().startswith("SELECT"):
+            g.nb_select = g.get("nb_select", 0) + 1
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", compter_requete)
+
+    @app.after_request
+    def verifier_nombre_requetes(reponse):
+        maximum = app.config.get("NB_MAX_SELECT")
+        nb_select = g.get("nb_select", 0)
+        if maximum and (app.debug or app.testing) and nb_select > maximum:
+            message = "{} requêtes SELECT pour {} {} (maximum : {})".format(nb_select, request.method, request.path,
+                                                                           maximum)
+            if app.testing:
+                raise TropDeRequetes(message)
+            app.logger.warning(message)
+        return reponse
+
+
+# bornes (en secondes) de l'histogramme des durées des requêtes de /metrics
+BORNES_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# nombre d'instructions SQL conservées par requête pour le journal des requêtes lentes, nombre d'instructions écrites
+# dans le journal et longueur maximale de chacune
+INSTRUCTIONS_CONSERVEES = 200
+INSTRUCTIONS_JOURNAL = 5
+LONGUEUR_INSTRUCTION = 300
+# préfixe des noms des métriques
+PREFIXE_METRIQUES = "declarations_"
+
+
+class TemplateMesure(Template):
+    """ Template Jinja dont le rendu est chronométré et ajouté au temps de rendu de la requête en cours """
+
+    def render(self, *args, **kwargs):
+        debut = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            if has_request_context():
+                g.duree_rendu = g.get("duree_rendu", 0) + time.perf_counter() - debut
+
+
+class Mesures:
+    """ Cumuls des mesures des requêtes par route, méthode et statut, pour /metrics """
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        # (route, méthode, statut) -> [requêtes, instructions SQL, durée SQL, durée de rendu, octets]
+        self.totaux = {}
+        # (route, méthode) -> [nombre par borne de BORNES_DUREE et au-delà, somme des durées]
+        self.durees = {}
+
+    def enregistrer(self, route, methode, statut, duree, nb_sql, duree_sql, duree_rendu, taille):
+        """
+        Fonction qui ajoute les mesures d'une requête aux cumuls
+        :param route: nom de l'endpoint
+        :param methode: méthode HTTP
+        :param statut: code de la réponse
+        :param duree: durée totale, en secondes
+        :param nb_sql: nombre d'instructions SQL
+        :param duree_sql: durée des instructions SQL, en secondes
+        :param duree_rendu: durée du rendu des templates, en secondes
+        :param taille: taille de la réponse en octets (0 si elle est envoyée au fur et à mesure)
+        """
+        with self.verrou:
+            totaux = self.totaux.setdefault((route, methode, statut), [0, 0, 0.0, 0.0, 0])
+            totaux[0] += 1
+            totaux[1] += nb_sql
+            totaux[2] += duree_sql
+            totaux[3] += duree_rendu
+            totaux[4] += taille
+            durees = self.durees.setdefault((route, methode), [0] * (len(BORNES_DUREE) + 1) + [0.0])
+            for position, borne in enumerate(BORNES_DUREE):
+                if duree <= borne:
+                    durees[position] += 1
+                    break
+            else:
+                durees[len(BORNES_DUREE)] += 1
+            durees[-1] += duree
+
+    def prometheus(self):
+        """
+        Fonction qui écrit les cumuls au format texte de Prometheus
+        :returns: chaîne de caractères
+        """
+        with self.verrou:
+            totaux = sorted(self.totaux.items())
+            durees = sorted((cle, list(valeurs)) for cle, valeurs in self.durees.items())
+        lignes = []
+        compteurs = [
+            ("requetes_total", "Nombre de requêtes HTTP traitées", 0),
+            ("sql_instructions_total", "Nombre d'instructions SQL envoyées", 1),
+            ("sql_duree_secondes_total", "Durée des instructions SQL", 2),
+            ("rendu_duree_secondes_total", "Durée du rendu des templates", 3),
+            ("reponse_octets_total", "Taille des réponses (hors réponses envoyées au fur et à mesure)", 4),
+        ]
+        for nom, description, position in compteurs:
+            lignes.append("# HELP {}{} {}".format(PREFIXE_METRIQUES, nom, description))
+            lignes.append("# TYPE {}{} counter".format(PREFIXE_METRIQUES, nom))
+            for (route, methode, statut), valeurs in totaux:
+                lignes.append('{}{}{{route="{}",methode="{}",statut="{}"}} {}'.format(
+                    PREFIXE_METRIQUES, nom, route, methode, statut, valeurs[position]))
+        nom = PREFIXE_METRIQUES + "requete_duree_secondes"
+        lignes.append("# HELP {} Durée des requêtes HTTP".format(nom))
+        lignes.append("# TYPE {} histogram".format(nom))
+        for (route, methode), valeurs in durees:
+            etiquettes = 'route="{}",methode="{}"'.format(route, methode)
+            cumul = 0
+            for borne, nombre in zip(BORNES_DUREE + ("+Inf",), valeurs):
+                cumul += nombre
+                lignes.append('{}_bucket{{{},le="{}"}} {}'.format(nom, etiquettes, borne, cumul))
+            lignes.append("{}_sum{{{}}} {}".format(nom, etiquettes, valeurs[-1]))
+            lignes.append("{}_count{{{}}} {}".format(nom, etiquettes, cumul))
+        return "\n".join(lignes) + "\n"
+
+
+def installer_mesures(app, *engines):
+    """
+    Fonction qui branche les mesures des requêtes (SQL, rendu, taille) sur les moteurs et l'application, et ajoute
+    l'en-tête Server-Timing, la page /metrics et le journal des requêtes lentes selon la configuration
+    :param app: application Flask
+    :param engines: moteurs SQLAlchemy à observer (base principale et base des lectures)
+    """
+    mesures = Mesures()
+    app.extensions["mesures"] = mesures
+    # chaque template chargé par l'application chronomètre son rendu
+    app.jinja_env.template_class = TemplateMesure
+
+    # le début de chaque instruction est rangé dans son contexte d'exécution : une instruction en erreur, qui n'atteint
+    # pas after_cursor_execute, n'en laisse pas de trace pour les suivantes
+    def debut_instruction(connexion, curseur, instruction, parametres, contexte, executemany):
+        if contexte is not None:
+            contexte._debut_mesure = time.perf_counter()
+
+    def fin_instruction(connexion, curseur, instruction, parametres, contexte, executemany):
+        debut = getattr(contexte, "_debut_mesure", None)
+        if debut is None:
+            return
+        duree = time.perf_counter() - debut
+        if has_request_context():
+            g.nb_sql = g.get("nb_sql", 0) + 1
+            g.duree_sql = g.get("duree_sql", 0) + duree
+            instructions = g.setdefault("instructions_sql", [])
+            if len(instructions) < INSTRUCTIONS_CONSERVEES:
+                instructions.append((duree, instruction))
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", debut_instruction)
+        event.listen(engine, "after_cursor_execute", fin_instruction)
+
+    @app.before_request
+    def demarrer_chronometre():
+        g.debut_requete = time.perf_counter()
+
+    @app.after_request
+    def mesurer_requete(reponse):
+        if "debut_requete" not in g:
+            return reponse
+        duree = time.perf_counter() - g.debut_requete
+        nb_sql, duree_sql, duree_rendu = g.get("nb_sql", 0), g.get("duree_sql", 0), g.get("duree_rendu", 0)
+        # une réponse envoyée au fur et à mesure (export) n'a pas de taille connue à ce stade
+        taille = 0 if reponse.is_streamed else reponse.calculate_content_length() or 0
+        mesures.enregistrer(request.endpoint or "inconnue", request.method, reponse.status_code, duree, nb_sql,
+                            duree_sql, duree_rendu, taille)
+
+        if app.config.get("SERVER_TIMING"):
+            reponse.headers.add("Server-Timing", 'sql;dur={:.1f};desc="{} instructions SQL", rendu;dur={:.1f}, '
+                                                 'total;dur={:.1f}'.format(duree_sql * 1000, nb_sql,
+                                                                           duree_rendu * 1000, duree * 1000))
+
+        seuil = app.config.get("SEUIL_REQUETE_LENTE")
+        if seuil is not None and duree * 1000 > seuil:
+            lentes = sorted(g.get("instructions_sql", []), key=lambda mesure: mesure[0], reverse=True)
+            details = "".join("\n  {:.1f} ms : {}".format(duree_instruction * 1000,
+                                                         " ".join(instruction.split())[:LONGUEUR_INSTRUCTION])
+                              for duree_instruction, instruction in lentes[:INSTRUCTIONS_JOURNAL])
+            app.logger.warning("Requête lente : %s %s en %.1f ms (SQL : %d instructions, %.1f ms ; rendu : %.1f ms ; "
+                               "%d octets)%s", request.method, request.full_path.rstrip("?"), duree * 1000, nb_sql,
+                               duree_sql * 1000, duree_rendu * 1000, taille, details)
+        return reponse
+
+    def metriques():
+        adresses = app.config.get("METRIQUES_ADRESSES")
+        if adresses is not None and request.remote_addr not in adresses:
+            abort(404)
+        return Response(mesures.prometheus(), mimetype="text/plain; version=0.0.4")
+
+    if app.config.get("METRIQUES"):
+        app.add_url_rule("/metrics", "metriques", metriques)
@@ -0,0 +1,253 @@
+# Analyses en colonnes des procès-verbaux
+# Pour les questions de recherche (saisonnalité des vols, objets volés par commissaire, victimes volées plusieurs
+# fois...), un Instantane copie la table proces_verbal en colonnes compactes : un array d'entiers 32 bits par colonne
+# (id et clés étrangères, 0 pour une valeur absente) et la date sous forme de numéro de jour (date.toordinal(), 0 pour
+# une date absente). Les fonctions de regroupement, de tableau croisé et d'histogramme parcourent ces colonnes
+# directement, sans passer par l'ORM ni par la base : un notebook peut enchaîner des milliers d'agrégations.
+#
+# L'instantané se met à jour par morceaux avec actualiser() :
+# - rien n'est relu si la version de la table proces_verbal (modeles/versions.py) n'a pas changé ;
+# - les procès-verbaux ajoutés sont ceux dont l'id dépasse le plus grand id de l'instantané ;
+# - les procès-verbaux modifiés sont ceux dont une modification est enregistrée dans authorship depuis la dernière
+#   mise à jour ;
+# - les suppressions sont détectées par le compteur de la table (modeles/statistiques.py) : dans ce cas seulement,
+#   la liste des id est relue.
+# Une modification faite directement dans la base (sans trace dans authorship) n'est vue qu'après charger().
+#
+# Exemple :
+#     corpus = Instantane()
+#     corpus.grouper("mois")                                  # saisonnalité
+#     corpus.croiser("id_objet", "id_commissaire")            # objets volés par commissaire
+#     corpus.recurrence("id_victime")                         # nombre de victimes volées 1, 2, 3... fois
+#     corpus.histogramme("date", [datetime.date(1775, 1, 1).toordinal(), datetime.date(1780, 1, 1).toordinal()])
+import bisect
+import datetime
+from array import array
+from collections import Counter
+
+from ..app import db
+from .statistiques import compteur
+from .versions import versions
+
+
+# colonnes de l'instantané, dans l'ordre de la requête
+COLONNES = ("id", "date", "id_theatre", "id_source", "id_commissaire", "id_victime", "id_objet")
+# type des arrays : entier signé de 32 bits
+TYPE_COLONNE = "i"
+# numéro du jour (date.toordinal()) calculé par SQLite : julianday() compte les jours depuis -4713
+REQUETE = "SELECT id, coalesce(CAST(julianday(date_pv) - 1721424.5 AS INTEGER), 0), coalesce(id_theatre, 0), " \
+          "coalesce(id_source, 0), coalesce(id_commissaire, 0), coalesce(id_victime, 0), coalesce(id_objet, 0) " \
+          "FROM proces_verbal"
+# colonnes calculées à partir de la date : nom -> fonction appliquée à la date (0 si la date est absente)
+DERIVEES = {
+    "annee": lambda date: date.year,
+    "mois": lambda date: date.month,
+    "jour_semaine": lambda date: date.isoweekday(),
+}
+# libellés des valeurs des colonnes : requête SQL qui renvoie (id, libellé)
+LIBELLES = {
+    "id_theatre": "SELECT id, institution FROM theatre",
+    "id_source": "SELECT id, cote FROM source",
+    "id_commissaire": "SELECT id, coalesce(prenom || ' ', '') || nom FROM personne",
+    "id_victime": "SELECT id, coalesce(prenom || ' ', '') || nom FROM personne",
+    "id_objet": "SELECT id, type FROM objet",
+}
+
+
+class Instantane:
+    """ Copie en colonnes (arrays d'entiers) de la table proces_verbal, mise à jour par morceaux """
+
+    def __init__(self):
+        self.charger()
+
+    def charger(self):
+        """ Fonction qui relit toute la table """
+        self.colonnes = {nom: array(TYPE_COLONNE) for nom in COLONNES}
+        self.positions = {}
+        self.derivees = {}
+        self.version = versions(["proces_verbal"])[0][0]
+        self.date_modification = self.derniere_modification()
+        self.ajouter_lignes(db.session.execute(REQUETE))
+
+    @staticmethod
+    def derniere_modification():
+        """
+        Fonction qui renvoie la date de la dernière modification de procès-verbal enregistrée dans authorship
+        :returns: chaîne de caractères (date SQLite) ou None
+        """
+        return db.session.execute("SELECT max(date) FROM authorship WHERE id_proces_verbal IS NOT NULL").scalar()
+
+    def __len__(self):
+        return len(self.colonnes["id"])
+
+    def ajouter_lignes(self, lignes):
+        """
+        Fonction qui ajoute des procès-verbaux à l'instantané, ou remplace ceux qui y sont déjà
+        :param lignes: tuples dans l'ordre de COLONNES
+        :returns: nombre de lignes lues
+        """
+        nombre = 0
+        for ligne in lignes:
+            nombre += 1
+            position = self.positions.get(ligne[0])
+            if position is None:
+                self.positions[ligne[0]] = len(self)
+                for nom, valeur in zip(COLONNES, ligne):
+                    self.colonnes[nom].append(valeur)
+            else:
+                for nom, valeur in zip(COLONNES, ligne):
+                    self.colonnes[nom][position] = valeur
+        if nombre:
+            self.derivees = {}
+        return nombre
+
+    def retirer(self, ids):
+        """
+        Fonction qui retire des procès-verbaux de l'instantané (les colonnes sont recopiées sans eux)
+        :param ids: ensemble des id à retirer
+        """
+        gardees = [position for position, id in enumerate(self.colonnes["id"]) if id not in ids]
+        self.colonnes = {nom: array(TYPE_COLONNE, (colonne[position] for position in gardees))
+                         for nom, colonne in self.colonnes.items()}
+        self.positions = {id: position for position, id in enumerate(self.colonnes["id"])}
+        self.derivees = {}
+
+    def actualiser(self):
+        """
+        Fonction qui répercute dans l'instantané les ajouts, modifications et suppressions de procès-verbaux faits
+        depuis la dernière mise à jour
+        :returns: nombre de procès-verbaux relus ou retirés
+        """
+        version = versions(["proces_verbal"])[0][0]
+        if version == self.version:
+            return 0
+        dernier = max(self.colonnes["id"]) if len(self) else 0
+        nombre = self.ajouter_lignes(db.session.execute(REQUETE + " WHERE id > :dernier", {"dernier": dernier}))
+
+        date_modification = self.derniere_modification()
+        if date_modification is not None and date_modification != self.date_modification:
+            condition = "date > :date" if self.date_modification else "1"
+            nombre += self.ajouter_lignes(db.session.execute(
+                REQUETE + " WHERE id IN (SELECT id_proces_verbal FROM authorship WHERE {})".format(condition),
+                {"date": self.date_modification}))
+        self.date_modification = date_modification
+
+        if len(self) != compteur("proces_verbal"):
+            existants = {id for id, in db.session.execute("SELECT id FROM proces_verbal")}
+            supprimes = set(self.positions) - existants
+            self.retirer(supprimes)
+            nombre += len(supprimes)
+        self.version = version
+        return nombre
+
+    def colonne(self, nom):
+        """
+        Fonction qui renvoie une colonne de l'instantané, ou une colonne calculée à partir de la date (DERIVEES)
+        :param nom: nom de la colonne
+        :returns: array d'entiers
+        """
+        if nom in self.colonnes:
+            return self.colonnes[nom]
+        if nom not in DERIVEES:
+            raise KeyError("Colonne inconnue : {}. Colonnes disponibles : {}."
+                           .format(nom, ", ".join(COLONNES + tuple(DERIVEES))))
+        if nom not in self.derivees:
+            fonction = DERIVEES[nom]
+            # les dates sont peu nombreuses (une par jour) : chaque date n'est convertie qu'une fois
+            valeurs = {jour: fonction(datetime.date.fromordinal(jour)) if jour else 0
+                       for jour in set(self.colonnes["date"])}
+            self.derivees[nom] = array(TYPE_COLONNE, (valeurs[jour] for jour in self.colonnes["date"]))
+        return self.derivees[nom]
+
+    def selection(self, debut=None, fin=None, **egalites):
+        """
+        Fonction qui renvoie les positions des procès-verbaux qui répondent aux conditions
+        :param debut: date minimale (datetime.date, incluse)
+        :param fin: date maximale (datetime.date, incluse)
+        :param egalites: conditions colonne=valeur (ex : id_theatre=1) ou colonne=ensemble de valeurs
+        :returns: array des positions
+        """
+        conditions = []
+        if debut is not None or fin is not None:
+            premier = debut.toordinal() if debut else 1
+            dernier = fin.toordinal() if fin else datetime.date.max.toordinal()
+            conditions.append((self.colonne("date"), range(premier, dernier + 1)))
+        for nom, valeur in egalites.items():
+            valeurs = set(valeur) if isinstance(valeur, (set, frozenset, list, tuple)) else {valeur}
+            conditions.append((self.colonne(nom), valeurs))
+        positions = range(len(self))
+        for colonne, valeurs in conditions:
+            positions = [position for position in positions if colonne[position] in valeurs]
+        return array(TYPE_COLONNE, positions)
+
+    def valeurs(self, nom, positions=None):
+        """
+        Fonction qui renvoie les valeurs d'une colonne, éventuellement limitées à une sélection
+        :param nom: nom de la colonne
+        :param positions: positions renvoyées par selection(), ou None pour tous les procès-verbaux
+        :returns: itérable d'entiers
+        """
+        colonne = self.colonne(nom)
+        if positions is None:
+            return colonne
+        return (colonne[position] for position in positions)
+
+    def grouper(self, *noms, positions=None):
+        """
+        Fonction qui compte les procès-verbaux par valeur d'une ou de plusieurs colonnes
+        :param noms: noms des colonnes
+        :param positions: positions renvoyées par selection(), ou None pour tous les procès-verbaux
+        :returns: Counter valeur (ou tuple de valeurs) -> nombre de procès-verbaux
+        """
+        if len(noms) == 1:
+            return Counter(self.valeurs(noms[0], positions))
+        return Counter(zip(*(self.valeurs(nom, positions) for nom in noms)))
+
+    def croiser(self, ligne, colonne, positions=None):
+        """
+        Fonction qui construit le tableau croisé de deux colonnes
+        :param ligne: nom de la colonne dont les valeurs forment les lignes
+        :param colonne: nom de la colonne dont les valeurs forment les colonnes
+        :param positions: positions renvoyées par selection(), ou None pour tous les procès-verbaux
+        :returns: tuple (valeurs des lignes triées, valeurs des colonnes triées, dictionnaire
+                  {valeur de ligne: {valeur de colonne: nombre}})
+        """
+        tableau = {}
+        for (valeur_ligne, valeur_colonne), nombre in self.grouper(ligne, colonne, positions=positions).items():
+            tableau.setdefault(valeur_ligne, {})[valeur_colonne] = nombre
+        colonnes = sorted({valeur for cellules in tableau.values() for valeur in cellules})
+        return sorted(tableau), colonnes, tableau
+
+    def histogramme(self, nom, bornes, positions=None):
+        """
+        Fonction qui compte les procès-verbaux par intervalle de valeurs d'une colonne
+        :param nom: nom de la colonne
+        :param bornes: bornes croissantes des intervalles ; l'intervalle i contient les valeurs comprises entre
+                       bornes[i - 1] (incluse) et bornes[i] (exclue)
+        :param positions: positions renvoyées par selection(), ou None pour tous les procès-verbaux
+        :returns: liste de len(bornes) + 1 nombres (le premier compte les valeurs inférieures à bornes[0], le dernier
+                  les valeurs supérieures ou égales à la dernière borne)
+        """
+        nombres = [0] * (len(bornes) + 1)
+        for valeur, nombre in self.grouper(nom, positions=positions).items():
+            nombres[bisect.bisect_right(bornes, valeur)] += nombre
+        return nombres
+
+    def recurrence(self, nom, positions=None):
+        """
+        Fonction qui compte les valeurs d'une colonne selon leur nombre de procès-verbaux (ex : nombre de victimes
+        volées une, deux, trois fois...)
+        :param nom: nom de la colonne
+        :param positions: positions renvoyées par selection(), ou None pour tous les procès-verbaux
+        :returns: Counter nombre de procès-verbaux -> nombre de valeurs (les valeurs absentes, 0, sont ignorées)
+        """
+        return Counter(nombre for valeur, nombre in self.grouper(nom, positions=positions).items() if valeur)
+
+    @staticmethod
+    def libelles(nom):
+        """
+        Fonction qui renvoie les libellés des valeurs d'une colonne de clé étrangère (institution, cote, nom...)
+        :param nom: nom de la colonne (clé de LIBELLES)
+        :returns: dictionnaire id -> libellé
+        """
+        return dict(db.session.execute(LIBELLES[nom]).fetchall())
@@ -0,0 +1,136 @@
+# Données de la carte
+# La carte (/carte) ne reçoit plus les marqueurs dans son HTML : elle demande à /carte/geojson les points de la zone
+# affichée (bbox) pour son niveau de zoom. Les points proches les uns des autres à ce niveau de zoom sont regroupés
+# côté serveur sur une grille de cellules de TAILLE_CELLULE pixels : le navigateur ne reçoit qu'un marqueur par
+# cellule, quel que soit le nombre de points de la base. Chaque point porte le nombre de procès-verbaux qui lui sont
+# rattachés.
+#
+# Chaque couche de la carte est une fonction qui renvoie les points d'une zone ; on ajoute une couche (adresses des
+# victimes, hôtels des commissaires...) en l'ajoutant au dictionnaire COUCHES.
+import math
+
+from flask import url_for
+from sqlalchemy import func, Float
+
+from ..app import db
+from .donnees import SalleTheatre, ProcesVerbal
+from .geographie import adresses_zone
+
+
+# taille d'une cellule de la grille de regroupement, en pixels de la carte
+TAILLE_CELLULE = 60
+# zoom minimal et maximal acceptés
+ZOOM_MIN = 0
+ZOOM_MAX = 20
+
+
+def points_salles(ouest, sud, est, nord):
+    """
+    Fonction qui renvoie les salles de théâtre situées dans une zone, avec le nombre de procès-verbaux rédigés pendant
+    leur occupation (une seule requête : jointure sur l'intervalle d'occupation et regroupement)
+    :param ouest: longitude minimale
+    :param sud: latitude minimale
+    :param est: longitude maximale
+    :param nord: latitude maximale
+    :returns: liste de dictionnaires (id, nom, latitude, longitude, nombre de procès-verbaux, url)
+    """
+    latitude = func.cast(SalleTheatre.latitude, Float)
+    longitude = func.cast(SalleTheatre.longitude, Float)
+    lignes = db.session.query(SalleTheatre.id, SalleTheatre.nom_salle, latitude, longitude,
+                              func.count(ProcesVerbal.id))\
+        .outerjoin(SalleTheatre.proces_verbaux)\
+        .filter(latitude.between(sud, nord), longitude.between(ouest, est))\
+        .group_by(SalleTheatre.id).all()
+    return [{"id": id, "nom": nom, "latitude": lat, "longitude": lon, "proces_verbaux": nombre,
+             "url": url_for("theatres.salle_theatre", id=id)}
+            for id, nom, lat, lon, nombre in lignes]
+
+
+def points_adresses(ouest, sud, est, nord):
+    """
+    Fonction qui renvoie les adresses localisées dans une zone (index spatial R*Tree), avec le nombre de
+    procès-verbaux dont la victime ou le commissaire y habite
+    :param ouest: longitude minimale
+    :param sud: latitude minimale
+    :param est: longitude maximale
+    :param nord: latitude maximale
+    :returns: liste de dictionnaires (id, nom, latitude, longitude, nombre de procès-verbaux, url)
+    """
+    points = {id: {"id": id, "latitude": latitude, "longitude": longitude, "proces_verbaux": 0,
+                   "url": url_for("api.detail", ressource="adresses", id=id, inclure="personnes")}
+              for id, latitude, longitude in adresses_zone(sud, nord, ouest, est)}
+    if not points:
+        return []
+    lignes = db.session.execute(
+        "SELECT adresse.id, adresse.rue, count(DISTINCT proces_verbal.id) FROM adresse "
+        "LEFT JOIN habite ON habite.id_adresse = adresse.id "
+        "LEFT JOIN proces_verbal ON proces_verbal.id_victime = habite.id_personne "
+        "OR proces_verbal.id_commissaire = habite.id_personne "
+        "WHERE adresse.id IN ({}) GROUP BY adresse.id".format(", ".join(str(id) for id in points)))
+    for id, rue, nombre in lignes:
+        points[id].update(nom=rue, proces_verbaux=nombre)
+    return list(points.values())
+
+
+# couches disponibles : nom -> fonction qui renvoie les points d'une zone
+COUCHES = {
+    "salles": points_salles,
+    "adresses": points_adresses,
+}
+
+
+def pixels(latitude, longitude, zoom):
+    """
+    Fonction qui projette un point en coordonnées de pixels de la carte (projection Web Mercator de Leaflet)
+    :param latitude: latitude en degrés
+    :param longitude: longitude en degrés
+    :param zoom: niveau de zoom
+    :returns: tuple (x, y) en pixels
+    """
+    taille = 256 * 2 ** zoom
+    sinus = math.sin(math.radians(max(min(latitude, 85.0511), -85.0511)))
+    x = (longitude + 180) / 360 * taille
+    y = (0.5 - math.log((1 + sinus) / (1 - sinus)) / (4 * math.pi)) * taille
+    return x, y
+
+
+def regrouper(points, zoom):
+    """
+    Fonction qui regroupe les points d'une même cellule de la grille et les transforme en objets GeoJSON. Un point
+    seul reste un point ; un groupe est placé au barycentre de ses points et porte leur nombre
+    :param points: liste de dictionnaires renvoyés par une couche
+    :param zoom: niveau de zoom de la carte
+    :returns: liste de "features" GeoJSON
+    """
+    cellules = {}
+    for point in points:
+        x, y = pixels(point["latitude"], point["longitude"], zoom)
+        cellules.setdefault((int(x // TAILLE_CELLULE), int(y // TAILLE_CELLULE)), []).append(point)
+
+    objets = []
+    for groupe in cellules.values():
+        if len(groupe) == 1:
+            point = groupe[0]
+            proprietes = {cle: valeur for cle, valeur in point.items() if cle not in ("latitude", "longitude")}
+            latitude, longitude = point["latitude"], point["longitude"]
+        else:
+            proprietes = {"groupe": True, "nombre": len(groupe),
+                          "proces_verbaux": sum(point["proces_verbaux"] for point in groupe)}
+            latitude = sum(point["latitude"] for point in groupe) / len(groupe)
+            longitude = sum(point["longitude"] for point in groupe) / len(groupe)
+        objets.append({"type": "Feature", "properties": proprietes,
+                       "geometry": {"type": "Point", "coordinates": [round(longitude, 6), round(latitude, 6)]}})
+    return objets
+
+
+def geojson(couche, bbox, zoom):
+    """
+    Fonction qui construit la collection GeoJSON d'une couche pour une zone et un niveau de zoom
+    :param couche: nom de la couche (clé de COUCHES)
+    :param bbox: tuple (ouest, sud, est, nord)
+    :param zoom: niveau de zoom
+    :returns: dictionnaire GeoJSON (FeatureCollection)
+    """
+    zoom = min(max(zoom, ZOOM_MIN), ZOOM_MAX)
+    points = COUCHES[couche](*bbox)
+    return {"type": "FeatureCollection", "features": regrouper(points, zoom)}
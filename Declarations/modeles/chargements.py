@@ -0,0 +1,52 @@
+# Profils de chargement des relations
+# Par défaut, chaque relation déclarée dans donnees.py est chargée à la demande (lazy loading) : chaque accès à
+# proces_verbal.sources, proces_verbal.victimes, etc. envoie une nouvelle requête SELECT à la base. Les profils
+# ci-dessous regroupent les options joinedload()/selectinload() adaptées à chaque page, pour que toutes les données
+# affichées soient récupérées en une ou deux requêtes. On les utilise dans les routes avec :
+#     ProcesVerbal.query.options(*chargement("proces_verbal")).get_or_404(id)
+from sqlalchemy.orm import joinedload, selectinload, load_only
+
+from .donnees import ProcesVerbal, Personne, Theatre, Authorship
+
+
+PROFILS = {
+    # page individuelle d'un procès-verbal : les relations many-to-one sont jointes à la requête principale, y compris
+    # la salle, retrouvée par le théâtre et la date dans l'index ix_salle_theatre_occupation
+    "proces_verbal": (
+        joinedload(ProcesVerbal.sources),
+        joinedload(ProcesVerbal.victimes),
+        joinedload(ProcesVerbal.commissaires),
+        joinedload(ProcesVerbal.objets),
+        joinedload(ProcesVerbal.salles_theatre),
+        joinedload(ProcesVerbal.salle),
+    ),
+    # listes de procès-verbaux (index, pages d'une source, d'un objet, d'une salle) : seules la date et l'id sont
+    # affichés, on ne charge pas les autres colonnes
+    "liste_proces_verbaux": (
+        load_only("id", "date_pv"),
+    ),
+    # page individuelle d'une personne : adresses et procès-verbaux (comme commissaire ou comme victime)
+    "personne": (
+        selectinload(Personne.adresses),
+        selectinload(Personne.proces_verbaux_commissaires).load_only("id", "date_pv"),
+        selectinload(Personne.proces_verbaux_victimes).load_only("id", "date_pv"),
+    ),
+    # page individuelle d'une institution théâtrale : ses salles et ses procès-verbaux
+    "theatre": (
+        selectinload(Theatre.salles_theatre),
+        selectinload(Theatre.proces_verbaux).load_only("id", "date_pv"),
+    ),
+    # historique des modifications d'un enregistrement : le nom de l'utilisateur de chaque ligne est joint
+    "historique": (
+        joinedload(Authorship.user),
+    ),
+}
+
+
+def chargement(profil):
+    """
+    Fonction qui renvoie les options de chargement d'un profil, à passer à .options()
+    :param profil: nom du profil (clé du dictionnaire PROFILS)
+    :returns: tuple d'options SQLAlchemy
+    """
+    return PROFILS[profil]
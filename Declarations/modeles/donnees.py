@@ -1,5 +1,8 @@
 # on importe la base de données pour accéder aux données et établir les modèles
-from ..app import db
+from ..app import db, cache
+
+# configuration de l'application courante (tâches différées)
+from flask import current_app
 
 # Import qui permet d'enregistrer dans la table Authorship l'utilisateur courant qui fait
 # des modifications dans la base de données
@@ -7,6 +10,24 @@ from flask_login import current_user
 
 # permet d'enregistrer le moment précis où un utilisateur modifie la base de données depuis l'application
 import datetime
+# tampon des lignes d'audit, propre à chaque fil d'exécution (voir audit_groupe())
+import threading
+from contextlib import contextmanager
+
+# erreur levée par SQLite quand une écriture viole une contrainte d'unicité
+from sqlalchemy.exc import IntegrityError
+
+# recherches de proximité sur les adresses localisées (index spatial R*Tree)
+from .geographie import adresses_rayon, adresse_plus_proche
+# listes des formulaires gardées en mémoire, à invalider après les écritures
+from .references import invalider_references
+# clés phonétiques et doublons probables des personnes
+from .rapprochement import cle_phonetique, candidats
+# file d'attente des tâches exécutées par flask worker
+from .taches import differer
+# modèle User, cible de la relation Authorship.user : il doit être déclaré avant la configuration des relations, quels
+# que soient les modules de routes chargés
+from .utilisateurs import User
 
 
 # par une table de relation, on lie les individus aux adresses : on crée une relation many-to-many puisqu'un individu
@@ -23,10 +44,21 @@ Habite = db.Table("habite", db.Column("id", db.Integer, nullable=False, autoincr
 
 # on définit les classes, chacune correspondant à une table de la BDD
 class Personne(db.Model):
+    # index des clés de tri des index alphabétiques (migration 5), des clés phonétiques (migration 11) et index unique
+    # de la clé naturelle (migration 12)
+    __table_args__ = (
+        db.Index("ix_personne_nom_lower", db.func.lower(db.text("nom")), "id"),
+        db.Index("ix_personne_qualite_nom", "qualite", "nom", "id"),
+        db.Index("ix_personne_cle_phonetique", "cle_phonetique", "id"),
+        db.Index("ux_personne_nom_prenom_qualite", "nom", "prenom", db.func.ifnull(db.text("qualite"), ""),
+                 unique=True),
+    )
     id = db.Column(db.Integer, nullable=False, autoincrement=True, primary_key=True)
     nom = db.Column(db.Text, nullable=False)
     prenom = db.Column(db.Text)
     qualite = db.Column(db.Text)
+    # clé phonétique du nom, qui regroupe les graphies d'un même nom pour la recherche des doublons (rapprochement.py)
+    cle_phonetique = db.Column(db.Text)
     # .relationship() permet de définir des liens entre les tables, notamment par le référencement en clé étrangère
     proces_verbaux_commissaires = db.relationship("ProcesVerbal", back_populates="commissaires",
                                                   foreign_keys="ProcesVerbal.id_commissaire")
@@ -38,57 +70,85 @@ class Personne(db.Model):
     adresses = db.relationship("Adresse", secondary=Habite, back_populates="personnes")
     authorships = db.relationship("Authorship", back_populates="personne")
 
-    # fonction qui permet d'ajouter une nouvelle entrée dans la table
+    # chaque modèle indique les pages publiques qui affichent ses données : elles sont retirées du cache (cache.py)
+    # après chaque ajout, modification ou suppression
+    def chemins_pages(self):
+        """
+        Fonction qui renvoie les chemins des pages qui affichent la personne
+        :returns: liste de chemins (un chemin terminé par * désigne toutes les pages qui commencent ainsi)
+        """
+        return ["/personnes", "/commissaires", "/personnes/{}".format(self.id), "/proces_verbaux/*", "/recherche",
+                "/statistiques"]
+
+    # fonction qui vérifie les informations d'une nouvelle personne, utilisée pour l'ajout par le formulaire et par
+    # l'import en masse (importation.py)
     @staticmethod
-    def ajout_personne(ajout_personne_nom, ajout_personne_prenom, ajout_personne_qualite):
+    def verifier_personne(nom, prenom):
         """
-        Fonction qui permet d'ajouter une nouvelle personne à la base de données
-        :param ajout_personne_nom: nom de la personne
-        :param ajout_personne_prenom: prénom de la personne
-        :param ajout_personne_qualite : qualité/métier de la personne
-        :returns: tuple (booléen, liste/objet)
+        Fonction qui vérifie le nom et le prénom d'une personne à ajouter
+        :param nom: nom de la personne
+        :param prenom: prénom de la personne
+        :returns: liste des erreurs (vide si les informations sont valides)
         """
-        # on définit une liste vide pour les erreurs
         erreurs = []
-        # on définit des erreurs
-        if not ajout_personne_nom:
+        if not nom:
             erreurs.append(
                 "Veuillez renseigner le nom de la personne.")
-        if not ajout_personne_prenom:
+        if not prenom:
             erreurs.append(
                 "Veuillez renseigner le prénom de la personne.")
-        if (ajout_personne_nom and ajout_personne_prenom) and not (
-                ajout_personne_nom[0].isupper() and ajout_personne_prenom[0].isupper()):
+        if (nom and prenom) and not (nom[0].isupper() and prenom[0].isupper()):
             erreurs.append(
                 "Le nom et le prénom de la personne doivent commencer par une majuscule.")
+        return erreurs
 
-        # on définit une variable qui contient les informations pour la nouvelle personne à enregistrer
-        # chaque champ correspond à un paramètre du modèle
-        nouvelle_personne = Personne.query.filter(db.and_(Personne.nom == ajout_personne_nom,
-                                                          Personne.prenom == ajout_personne_prenom,
-                                                          Personne.qualite == ajout_personne_qualite)).count()
-
-        # on vérifie que la personne n'est pas déjà enregistrée
-        if nouvelle_personne > 0:
-            erreurs.append("Cette personne existe déjà dans la base de données.")
+    # fonction qui permet d'ajouter une nouvelle entrée dans la table
+    @staticmethod
+    def ajout_personne(ajout_personne_nom, ajout_personne_prenom, ajout_personne_qualite, confirmer=False):
+        """
+        Fonction qui permet d'ajouter une nouvelle personne à la base de données
+        :param ajout_personne_nom: nom de la personne
+        :param ajout_personne_prenom: prénom de la personne
+        :param ajout_personne_qualite : qualité/métier de la personne
+        :param confirmer: True pour ajouter la personne même si des personnes semblables sont déjà enregistrées
+        :returns: tuple (booléen, liste/objet)
+        """
+        # on définit la liste des erreurs de saisie
+        erreurs = Personne.verifier_personne(ajout_personne_nom, ajout_personne_prenom)
+
+        # on vérifie qu'elle ne ressemble pas à une personne déjà enregistrée sous une autre graphie (la même personne
+        # exactement est refusée par l'index unique lors de l'insertion)
+        if not erreurs and not confirmer:
+            semblables = candidats(ajout_personne_nom, ajout_personne_prenom)
+            if any((nom, prenom or "", qualite or "") == (ajout_personne_nom, ajout_personne_prenom,
+                                                          ajout_personne_qualite or "")
+                   for similarite, id, nom, prenom, qualite in semblables):
+                erreurs.append(MESSAGES_DOUBLON["personne"])
+            elif semblables:
+                erreurs.append("Des personnes semblables sont déjà enregistrées, vérifiez qu'il ne s'agit pas de la "
+                               "même personne avant de confirmer l'ajout.")
 
         # on vérifie s'il y a une erreur et on retourne l'erreur s'il y en a une
         if len(erreurs) > 0:
             return False, erreurs
 
-        # s'il n'y a pas d'erreur, on ajoute la nouvelle entrée dans la table Personne
+        # s'il n'y a pas d'erreur, on ajoute la nouvelle entrée dans la table Personne, sauf si elle existe déjà
         # chaque champ correpond aux paramètres du modèle
-        nouvelle_personne = Personne(nom=ajout_personne_nom,
-                                     prenom=ajout_personne_prenom,
-                                     qualite=ajout_personne_qualite)
-
-        # on lance l'ajout dans la BDD, ce dernier sera stoppé s'il y a une erreur
         try:
-            db.session.add(nouvelle_personne)
+            id = inserer_sans_doublon(Personne, nom=ajout_personne_nom, prenom=ajout_personne_prenom,
+                                      qualite=ajout_personne_qualite,
+                                      cle_phonetique=cle_phonetique(ajout_personne_nom))
+            if id is None:
+                db.session.rollback()
+                return False, [MESSAGES_DOUBLON["personne"]]
             db.session.commit()
+            nouvelle_personne = Personne.query.get(id)
+            invalider_pages(*nouvelle_personne.chemins_pages())
+            invalider_references("personne")
             return True, nouvelle_personne
 
         except Exception as erreur:
+            db.session.rollback()
             return False, [str(erreur)]
 
     # fonction pour permettre la modification d'une entrée dans la table Personne
@@ -129,14 +189,21 @@ class Personne(db.Model):
         update_personne.nom = update_nom
         update_personne.prenom = update_prenom
         update_personne.qualite = update_qualite
+        update_personne.cle_phonetique = cle_phonetique(update_nom)
 
         # on lance l'ajout dans la BDD, ce dernier sera stoppé s'il y a une erreur
         try:
             db.session.add(update_personne)
-            db.session.add(Authorship(id_personne=update_personne.id, id_user=current_user.id))
+            journaliser(id_personne=update_personne.id, id_user=current_user.id)
             db.session.commit()
+            invalider_pages(*update_personne.chemins_pages())
+            invalider_references("personne")
             return True, update_personne
 
+        except IntegrityError:
+            db.session.rollback()
+            return False, [MESSAGES_DOUBLON["personne"]]
+
         except Exception as erreur:
             return False, [str(erreur)]
 
@@ -152,15 +219,80 @@ class Personne(db.Model):
         # on récupère la personne avec son id
         delete_personne = Personne.query.get_or_404(id)
 
+        # on relève les pages à invalider avant que l'enregistrement ne soit supprimé
+        chemins = delete_personne.chemins_pages()
+
         # On supprime la personne s'il n'y a pas d'erreur
         try:
             db.session.delete(delete_personne)
             db.session.commit()
+            invalider_pages(*chemins)
+            invalider_references("personne")
             return True
 
         except Exception as erreur:
             return False, [str(erreur)]
 
+    # fonction pour réunir en une seule personne des doublons saisis sous plusieurs graphies
+    @staticmethod
+    def fusion_personnes(id, ids_doublons, id_user=None):
+        """
+        Fonction qui fusionne des personnes dans une personne conservée : leurs procès-verbaux, leurs domiciles et
+        leur historique passent à la personne conservée, puis elles sont supprimées, le tout dans une transaction
+        :param id: id de la personne conservée
+        :param ids_doublons: liste des id des personnes à fusionner dans la personne conservée
+        :param id_user: id de l'utilisateur qui fait la fusion, ou None (commande flask)
+        :returns: tuple (booléen, liste/objet)
+        """
+        erreurs = []
+        try:
+            ids_doublons = sorted({int(id_doublon) for id_doublon in ids_doublons})
+        except (TypeError, ValueError):
+            return False, ["Les personnes à fusionner doivent être désignées par leur identifiant."]
+        garde = Personne.query.get(id)
+        doublons = Personne.query.filter(Personne.id.in_(ids_doublons)).all() if ids_doublons else []
+
+        if garde is None:
+            erreurs.append("La personne à conserver n'existe pas.")
+        if not ids_doublons:
+            erreurs.append("Veuillez choisir au moins une personne à fusionner.")
+        elif id in ids_doublons:
+            erreurs.append("La personne conservée ne peut pas être fusionnée avec elle-même.")
+        elif len(doublons) != len(ids_doublons):
+            erreurs.append("Certaines des personnes à fusionner n'existent pas.")
+        if len(erreurs) > 0:
+            return False, erreurs
+
+        # on relève les pages à invalider avant que les doublons ne soient supprimés
+        chemins = garde.chemins_pages() + [chemin for doublon in doublons for chemin in doublon.chemins_pages()]
+        try:
+            # les procès-verbaux des doublons passent à la personne conservée (les triggers tiennent à jour les
+            # agrégats des statistiques)
+            ProcesVerbal.query.filter(ProcesVerbal.id_victime.in_(ids_doublons))\
+                .update({ProcesVerbal.id_victime: id}, synchronize_session=False)
+            ProcesVerbal.query.filter(ProcesVerbal.id_commissaire.in_(ids_doublons))\
+                .update({ProcesVerbal.id_commissaire: id}, synchronize_session=False)
+            # la personne conservée reçoit les domiciles des doublons qu'elle n'a pas déjà
+            domiciles = db.select([Habite.c.id_adresse]).where(Habite.c.id_personne == id)
+            db.session.execute(Habite.insert().from_select(
+                ["id_personne", "id_adresse"],
+                db.select([db.literal(id), Habite.c.id_adresse]).distinct()
+                .where(db.and_(Habite.c.id_personne.in_(ids_doublons), Habite.c.id_adresse.notin_(domiciles)))))
+            db.session.execute(Habite.delete().where(Habite.c.id_personne.in_(ids_doublons)))
+            # l'historique des doublons est conservé, rattaché à la personne conservée
+            Authorship.query.filter(Authorship.id_personne.in_(ids_doublons))\
+                .update({Authorship.id_personne: id}, synchronize_session=False)
+            Personne.query.filter(Personne.id.in_(ids_doublons)).delete(synchronize_session=False)
+            journaliser(id_personne=id, id_user=id_user)
+            db.session.commit()
+            invalider_pages(*chemins, "/carte*")
+            invalider_references("personne")
+            return True, garde
+
+        except Exception as erreur:
+            db.session.rollback()
+            return False, [str(erreur)]
+
     # fonction pour ajouter une adresse de domicile à la personne
     @staticmethod
     def lier_personne_adresse(id, adresse_id):
@@ -171,7 +303,12 @@ class Personne(db.Model):
         """
         erreurs = []
         personne = Personne.query.get(id) # on récupère la personne à partir de son id
-        adresse = Adresse.query.get(adresse_id) # on récupère l'adresse à partir de son id
+        adresse = Adresse.query.get(adresse_id) if str(adresse_id or "").isdigit() else None
+
+        # l'adresse saisie dans le champ à suggestions doit avoir été choisie dans la liste
+        if personne is None or adresse is None:
+            erreurs.append("Veuillez choisir une adresse dans la liste.")
+            return False, erreurs
 
         # si la relation personne-adresse n'existe pas, on l'ajoute dans la table de relation Habite avec la méthode
         # .append()
@@ -183,8 +320,9 @@ class Personne(db.Model):
             return False, erreurs
 
         try:
-            db.session.add(Authorship(id_adresse=adresse.id, id_personne=personne.id, id_user=current_user.id))
+            journaliser(id_adresse=adresse.id, id_personne=personne.id, id_user=current_user.id)
             db.session.commit()
+            invalider_pages("/personnes/{}".format(personne.id), "/carte*", "/statistiques")
             return True, ""
 
         except Exception as erreur:
@@ -205,8 +343,9 @@ class Personne(db.Model):
         personne.adresses.remove(adresse)
 
         try:
-            db.session.add(Authorship(id_adresse=adresse.id, id_personne=personne.id, id_user=current_user.id))
+            journaliser(id_adresse=adresse.id, id_personne=personne.id, id_user=current_user.id)
             db.session.commit()
+            invalider_pages("/personnes/{}".format(personne.id), "/carte*", "/statistiques")
             return True, ""
 
         except Exception as erreur:
@@ -214,22 +353,94 @@ class Personne(db.Model):
 
 
 class Adresse(db.Model):
+    __table_args__ = (
+        db.Index("ix_adresse_rue_lower", db.func.lower(db.text("rue")), "id"),
+        db.Index("ux_adresse_rue_quartier", "rue", db.func.ifnull(db.text("quartier"), ""), unique=True),
+    )
     id = db.Column(db.Integer, nullable=False, autoincrement=True, primary_key=True)
     rue = db.Column(db.Text)
     quartier = db.Column(db.Text)
+    # coordonnées de l'adresse (en degrés), rangées dans l'index spatial index_spatial_adresse (migration 8)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     personnes = db.relationship("Personne", secondary=Habite, back_populates='adresses')
     authorships = db.relationship("Authorship", back_populates="adresse")
 
+    def chemins_pages(self):
+        """
+        Fonction qui renvoie les chemins des pages qui affichent l'adresse
+        :returns: liste de chemins
+        """
+        return ["/adresses", "/personnes/*", "/carte*", "/statistiques"]
+
     @staticmethod
-    def ajout_adresse(ajout_adresse_rue, ajout_adresse_quartier):
+    def convertir_coordonnees(latitude, longitude):
+        """
+        Fonction qui convertit et vérifie les coordonnées saisies pour une adresse
+        :param latitude: latitude en degrés (chaîne de caractères ou nombre, facultative)
+        :param longitude: longitude en degrés (chaîne de caractères ou nombre, facultative)
+        :returns: tuple (booléen, liste des erreurs/tuple (latitude, longitude), None si aucune n'est saisie)
+        """
+        latitude = str(latitude).strip().replace(",", ".") if latitude is not None else ""
+        longitude = str(longitude).strip().replace(",", ".") if longitude is not None else ""
+        if not latitude and not longitude:
+            return True, (None, None)
+        try:
+            latitude, longitude = float(latitude), float(longitude)
+        except ValueError:
+            return False, ["Veuillez renseigner la latitude et la longitude en degrés décimaux (ex : 48.8630556)."]
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            return False, ["La latitude doit être comprise entre -90 et 90, la longitude entre -180 et 180."]
+        return True, (latitude, longitude)
+
+    @staticmethod
+    def proches(latitude, longitude, rayon, role=None, options=()):
+        """
+        Fonction qui renvoie les adresses situées à moins d'une certaine distance d'un point (index spatial)
+        :param latitude: latitude du point, en degrés
+        :param longitude: longitude du point, en degrés
+        :param rayon: distance maximale en mètres
+        :param role: "victime" ou "commissaire" pour ne garder que les adresses de ces personnes, ou None
+        :param options: options de chargement SQLAlchemy (relations à charger avec les adresses)
+        :returns: liste de tuples (adresse, distance en mètres), de la plus proche à la plus éloignée
+        """
+        distances = adresses_rayon(latitude, longitude, rayon, role=role)
+        adresses = {adresse.id: adresse for adresse in
+                    Adresse.query.options(*options).filter(Adresse.id.in_([id for id, ecart in distances]))} if distances else {}
+        return [(adresses[id], ecart) for id, ecart in distances]
+
+    @staticmethod
+    def plus_proche(latitude, longitude, role=None):
+        """
+        Fonction qui renvoie l'adresse la plus proche d'un point (index spatial)
+        :param latitude: latitude du point, en degrés
+        :param longitude: longitude du point, en degrés
+        :param role: "victime" ou "commissaire" pour ne chercher que parmi les adresses de ces personnes, ou None
+        :returns: tuple (adresse, distance en mètres), ou None si aucune adresse n'est trouvée
+        """
+        resultat = adresse_plus_proche(latitude, longitude, role=role)
+        if resultat is None:
+            return None
+        id, ecart = resultat
+        return Adresse.query.get(id), ecart
+
+    @staticmethod
+    def ajout_adresse(ajout_adresse_rue, ajout_adresse_quartier, ajout_adresse_latitude=None,
+                      ajout_adresse_longitude=None):
         """
             Fonction qui permet d'ajouter une nouvelle adresse à la base de données
             :param ajout_adresse_rue: nom de la rue
             :param ajout_adresse_quartier: nom qu quartier où est située la rue
+            :param ajout_adresse_latitude: latitude de l'adresse (facultative)
+            :param ajout_adresse_longitude: longitude de l'adresse (facultative)
             :returns: tuple (booléen, liste/objet)
         """
         erreurs = []
 
+        valides, coordonnees = Adresse.convertir_coordonnees(ajout_adresse_latitude, ajout_adresse_longitude)
+        if not valides:
+            erreurs += coordonnees
+
         if not ajout_adresse_rue:
             erreurs.append(
                 "Veuillez renseigner le nom de la rue.")
@@ -238,23 +449,53 @@ class Adresse(db.Model):
             erreurs.append(
                 "Veuillez renseigner le quartier où est située la rue.")
 
-        nouvelle_adresse = Adresse.query.filter(db.and_(Adresse.rue == ajout_adresse_rue),
-                                                (Adresse.quartier == ajout_adresse_quartier)).count()
-
-        if nouvelle_adresse > 0:
-            erreurs.append("Cette adresse existe déjà dans la base de données.")
-
         if len(erreurs) > 0:
             return False, erreurs
 
-        nouvelle_adresse = Adresse(rue=ajout_adresse_rue,
-                                   quartier=ajout_adresse_quartier)
-
+        # l'index unique (rue, quartier) refuse une adresse déjà enregistrée
         try:
-            db.session.add(nouvelle_adresse)
+            id = inserer_sans_doublon(Adresse, rue=ajout_adresse_rue, quartier=ajout_adresse_quartier,
+                                      latitude=coordonnees[0], longitude=coordonnees[1])
+            if id is None:
+                db.session.rollback()
+                return False, [MESSAGES_DOUBLON["adresse"]]
             db.session.commit()
+            nouvelle_adresse = Adresse.query.get(id)
+            invalider_pages(*nouvelle_adresse.chemins_pages())
+            invalider_references("adresse")
             return True, nouvelle_adresse
 
+        except Exception as erreur:
+            db.session.rollback()
+            return False, [str(erreur)]
+
+    @staticmethod
+    def localisation_adresse(id, latitude, longitude):
+        """
+        Fonction qui enregistre les coordonnées d'une adresse (l'index spatial est mis à jour par trigger)
+        :param id: id de l'adresse
+        :param latitude: latitude en degrés
+        :param longitude: longitude en degrés
+        :returns: tuple (booléen, liste/objet)
+        """
+        adresse = Adresse.query.get(id)
+        if adresse is None:
+            return False, ["L'adresse {} n'existe pas.".format(id)]
+
+        valides, coordonnees = Adresse.convertir_coordonnees(latitude, longitude)
+        if not valides:
+            return False, coordonnees
+
+        adresse.latitude, adresse.longitude = coordonnees
+
+        try:
+            db.session.add(adresse)
+            # la localisation peut être faite hors d'une requête (commande flask geocoder) : pas d'utilisateur
+            journaliser(id_adresse=adresse.id, id_user=getattr(current_user, "id", None))
+            db.session.commit()
+            invalider_pages(*adresse.chemins_pages())
+            return True, adresse
+
         except Exception as erreur:
             return False, [str(erreur)]
 
@@ -266,9 +507,14 @@ class Adresse(db.Model):
         """
         delete_adresse = Adresse.query.get_or_404(id)
 
+        # on relève les pages à invalider avant que l'enregistrement ne soit supprimé
+        chemins = delete_adresse.chemins_pages()
+
         try:
             db.session.delete(delete_adresse)
             db.session.commit()
+            invalider_pages(*chemins)
+            invalider_references("adresse")
             return True
 
         except Exception as erreur:
@@ -283,16 +529,90 @@ class Theatre(db.Model):
 
 
 class SalleTheatre(db.Model):
+    # index de l'intervalle d'occupation de chaque institution, pour retrouver la salle d'un procès-verbal
+    # (migration 7)
+    __table_args__ = (
+        db.Index("ix_salle_theatre_occupation", "id_institution", "debut_occupation", "fin_occupation"),
+    )
     id = db.Column(db.Integer, nullable=False, autoincrement=True, primary_key=True)
     nom_salle = db.Column(db.Text)
+    # dates d'occupation saisies sous la forme "1782-1789", et l'intervalle correspondant : du 1er janvier de la
+    # première année (inclus) au 1er janvier de la seconde (exclu)
     dates_occupation_salle = db.Column(db.Text)
+    debut_occupation = db.Column(db.Date)
+    fin_occupation = db.Column(db.Date)
     id_institution = db.Column(db.Integer, db.ForeignKey("theatre.id"))
     # la latitude et la longitude seront utiles pour établir une carte de localisation des salles parisiennes de la fin
     # du XVIIIe siècle
-    latitude = db.Column(db.Text)
-    longitude = db.Column(db.Text)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     theatres = db.relationship("Theatre", back_populates="salles_theatre")
     authorships = db.relationship("Authorship", back_populates="salle_theatre")
+    # procès-verbaux rédigés pendant l'occupation de la salle par son institution : la relation n'a pas de clé
+    # étrangère, elle est définie par le théâtre et l'intervalle de dates (lecture seule)
+    proces_verbaux = db.relationship("ProcesVerbal", primaryjoin="and_("
+                                     "foreign(ProcesVerbal.id_theatre) == SalleTheatre.id_institution, "
+                                     "ProcesVerbal.date_pv >= SalleTheatre.debut_occupation, "
+                                     "ProcesVerbal.date_pv < SalleTheatre.fin_occupation)",
+                                     viewonly=True, order_by="ProcesVerbal.date_pv", back_populates="salle")
+
+    def chemins_pages(self):
+        """
+        Fonction qui renvoie les chemins des pages qui affichent la salle
+        :returns: liste de chemins
+        """
+        return ["/salles/{}".format(self.id), "/theatres", "/theatres/{}".format(self.id_institution), "/carte*",
+                "/proces_verbaux/*", "/recherche"]
+
+    @staticmethod
+    def requete_proces_verbaux(id):
+        """
+        Fonction qui construit la requête des procès-verbaux rédigés pendant l'occupation d'une salle par son
+        institution, dans l'ordre chronologique. C'est une seule jointure : la salle est lue par sa clé primaire, puis
+        les procès-verbaux de son institution sont lus dans l'index (id_theatre, date_pv) sur l'intervalle
+        d'occupation
+        :param id: id de la salle
+        :returns: requête SQLAlchemy (à paginer ou à exécuter)
+        """
+        return ProcesVerbal.query.join(ProcesVerbal.salle).filter(SalleTheatre.id == id)\
+            .order_by(ProcesVerbal.date_pv.asc())
+
+    def adresses_proches(self, rayon, role=None):
+        """
+        Fonction qui renvoie les adresses situées à moins d'une certaine distance de la salle (ex : les victimes qui
+        habitent à moins de 500 m de la Comédie-Italienne)
+        :param rayon: distance maximale en mètres
+        :param role: "victime" ou "commissaire" pour ne garder que les adresses de ces personnes, ou None
+        :returns: liste de tuples (adresse, distance en mètres), vide si la salle n'est pas localisée
+        """
+        if self.latitude is None or self.longitude is None:
+            return []
+        return Adresse.proches(self.latitude, self.longitude, rayon, role=role)
+
+    def adresse_plus_proche(self, role=None):
+        """
+        Fonction qui renvoie l'adresse la plus proche de la salle (ex : l'hôtel du commissaire le plus proche)
+        :param role: "victime" ou "commissaire" pour ne chercher que parmi les adresses de ces personnes, ou None
+        :returns: tuple (adresse, distance en mètres), ou None
+        """
+        if self.latitude is None or self.longitude is None:
+            return None
+        return Adresse.plus_proche(self.latitude, self.longitude, role=role)
+
+    @staticmethod
+    def convertir_dates_occupation(dates):
+        """
+        Fonction qui convertit les dates d'occupation saisies ("1782-1789") en intervalle de dates
+        :param dates: chaîne de caractères AAAA-AAAA
+        :returns: tuple (début inclus, fin exclue) de datetime.date, ou None si les dates sont invalides
+        """
+        annees = (dates or "").split("-")
+        if len(annees) != 2 or not all(len(annee.strip()) == 4 and annee.strip().isdigit() for annee in annees):
+            return None
+        debut, fin = int(annees[0]), int(annees[1])
+        if fin < debut:
+            return None
+        return datetime.date(debut, 1, 1), datetime.date(fin, 1, 1)
 
     # pas de fonction d'ajout ou suppression pour les salles puisque toutes les salles sur la période sont ajoutées à
     # la BDD
@@ -314,6 +634,9 @@ class SalleTheatre(db.Model):
             erreurs.append("Veuillez renseigner le nom de la salle.")
         if not update_dates:
             erreurs.append("Veuillez renseigner les dates d'occupation.")
+        occupation = SalleTheatre.convertir_dates_occupation(update_dates)
+        if update_dates and occupation is None:
+            erreurs.append("Les dates d'occupation doivent prendre la forme suivante : AAAA-AAAA, ex : \"1782-1789\".")
         if update_salle.nom_salle == update_nom and update_salle.dates_occupation_salle == update_dates \
                 and update_salle.id_institution == id_institution:
             erreurs.append("Aucun changement n'a été effectué.")
@@ -321,23 +644,50 @@ class SalleTheatre(db.Model):
         if len(erreurs) > 0:
             return False, erreurs
 
+        # pages de la salle avant modification (ancienne institution), à invalider avec les nouvelles
+        chemins = update_salle.chemins_pages()
         update_salle.nom_salle = update_nom
         update_salle.dates_occupation_salle = update_dates
+        update_salle.debut_occupation, update_salle.fin_occupation = occupation
         update_salle.id_institution = id_institution
 
         try:
             db.session.add(update_salle)
-            db.session.add(Authorship(id_salle_theatre=update_salle.id, id_user=current_user.id))
+            journaliser(id_salle_theatre=update_salle.id, id_user=current_user.id)
             db.session.commit()
+            invalider_pages(*chemins, *update_salle.chemins_pages())
             return True, update_salle
 
         except Exception as erreur:
             return False, [str(erreur)]
 
 
+# colonnes des procès-verbaux qui désignent un autre enregistrement : colonne -> (table, libellé dans les messages)
+REFERENCES_PROCES_VERBAL = {
+    "id_theatre": ("theatre", "le théâtre"),
+    "id_source": ("source", "la source"),
+    "id_commissaire": ("personne", "le commissaire"),
+    "id_victime": ("personne", "la victime"),
+    "id_objet": ("objet", "l'objet"),
+}
+
+
 class ProcesVerbal(db.Model):
+    # index composites (clé étrangère, date) : ils servent à la fois au filtre sur l'entité liée et au tri
+    # chronologique des procès-verbaux, ils sont créés dans la base par la migration 1 (modeles/migrations.py)
+    __table_args__ = (
+        db.Index("ix_proces_verbal_date_pv", "date_pv"),
+        db.Index("ix_proces_verbal_source_date", "id_source", "date_pv"),
+        db.Index("ix_proces_verbal_objet_date", "id_objet", "date_pv"),
+        db.Index("ix_proces_verbal_theatre_date", "id_theatre", "date_pv"),
+        db.Index("ix_proces_verbal_commissaire_date", "id_commissaire", "date_pv"),
+        db.Index("ix_proces_verbal_victime_date", "id_victime", "date_pv"),
+        # clé naturelle d'un procès-verbal (migration 12)
+        db.Index("ux_proces_verbal_cle", "date_pv", "id_theatre", "id_source", "id_commissaire", "id_victime",
+                 "id_objet", unique=True),
+    )
     id = db.Column(db.Integer, nullable=False, autoincrement=True, primary_key=True)
-    date_pv = db.Column(db.String(10))
+    date_pv = db.Column(db.Date)
     id_theatre = db.Column(db.Integer, db.ForeignKey("theatre.id"))
     id_source = db.Column(db.Integer, db.ForeignKey("source.id"))
     id_commissaire = db.Column(db.Integer, db.ForeignKey("personne.id"))
@@ -350,6 +700,85 @@ class ProcesVerbal(db.Model):
     sources = db.relationship("Source", back_populates="proces_verbaux_sources")
     objets = db.relationship("Objet", back_populates="proces_verbaux_objets")
     authorships = db.relationship("Authorship", back_populates="proces_verbal")
+    # salle dans laquelle l'institution jouait à la date du procès-verbal (voir SalleTheatre.proces_verbaux)
+    salle = db.relationship("SalleTheatre", primaryjoin="and_("
+                            "foreign(ProcesVerbal.id_theatre) == remote(SalleTheatre.id_institution), "
+                            "ProcesVerbal.date_pv >= remote(SalleTheatre.debut_occupation), "
+                            "ProcesVerbal.date_pv < remote(SalleTheatre.fin_occupation))",
+                            viewonly=True, uselist=False, back_populates="proces_verbaux")
+
+    def chemins_pages(self):
+        """
+        Fonction qui renvoie les chemins des pages qui affichent le procès-verbal : sa page, les index et les pages
+        des entités qui lui sont liées
+        :returns: liste de chemins
+        """
+        return ["/", "/proces_verbaux", "/proces_verbaux/{}".format(self.id), "/sources/{}".format(self.id_source),
+                "/objets_voles", "/objets_voles/{}".format(self.id_objet), "/theatres/{}".format(self.id_theatre),
+                "/salles/*", "/personnes/{}".format(self.id_commissaire), "/personnes/{}".format(self.id_victime),
+                "/recherche", "/carte/geojson", "/statistiques"]
+
+    @staticmethod
+    def convertir_date(date_pv):
+        """
+        Fonction qui convertit une date saisie ou reçue dans l'URL en date Python, pour la colonne date_pv
+        :param date_pv: chaîne de caractères AAAA-MM-JJ (ou date déjà convertie)
+        :returns: datetime.date, ou None si la date est absente ou invalide
+        """
+        if isinstance(date_pv, datetime.date):
+            return date_pv
+        try:
+            return datetime.date.fromisoformat((date_pv or "").strip())
+        except ValueError:
+            return None
+
+    @staticmethod
+    def verifier_date(date_pv):
+        """
+        Fonction qui vérifie la date d'un procès-verbal, pour l'ajout et la modification par le formulaire et pour
+        l'import en masse
+        :param date_pv: date du procès-verbal (AAAA-MM-JJ)
+        :returns: liste des erreurs (vide si la date est valide)
+        """
+        erreurs = []
+        date_pv = date_pv or ""
+        if not date_pv:
+            erreurs.append(
+                "Veuillez renseigner la date du procès-verbal à enregistrer.")
+        if not len(date_pv) == 10:
+            erreurs.append("La cote doit prendre la forme suivante : AAAA-MM-JJ, ex :\"1784-04-06\" (10 caractères).")
+        if not (date_pv.startswith('177') or date_pv.startswith('178')):
+            erreurs.append(
+                "Veuillez renseigner une date valide (entre 1770 et 1789).")
+        if not erreurs and ProcesVerbal.convertir_date(date_pv) is None:
+            erreurs.append("La date \"{}\" n'existe pas.".format(date_pv))
+        return erreurs
+
+    @staticmethod
+    def verifier_references(**ids):
+        """
+        Fonction qui vérifie que les id reçus du formulaire désignent des enregistrements existants : un champ à
+        suggestions dont aucune suggestion n'a été choisie envoie un id vide
+        :param ids: colonnes de REFERENCES_PROCES_VERBAL -> id reçu (chaîne de caractères ou entier)
+        :returns: tuple (liste des erreurs, dictionnaire colonne -> id entier)
+        """
+        erreurs = []
+        valeurs = {}
+        for colonne, (table, libelle) in REFERENCES_PROCES_VERBAL.items():
+            try:
+                valeurs[colonne] = int(ids.get(colonne))
+            except (TypeError, ValueError):
+                erreurs.append("Veuillez choisir {} dans la liste.".format(libelle))
+        if valeurs:
+            # une seule requête pour tous les champs
+            existe = db.session.execute("SELECT " + ", ".join(
+                "EXISTS (SELECT 1 FROM {} WHERE id = :{})".format(REFERENCES_PROCES_VERBAL[colonne][0], colonne)
+                for colonne in valeurs), valeurs).first()
+            for colonne, present in zip(valeurs, existe):
+                if not present:
+                    erreurs.append("{} n'existe pas dans la base de données.".format(
+                        REFERENCES_PROCES_VERBAL[colonne][1].capitalize()))
+        return erreurs, valeurs
 
     @staticmethod
     def ajout_proces_verbal(ajout_proces_verbal_date, ajout_pv_id_theatre, ajout_pv_id_source, ajout_pv_id_commissaire,
@@ -363,43 +792,29 @@ class ProcesVerbal(db.Model):
         :param ajout_pv_id_victime: id de la victime du vol
         :param ajout_pv_id_objet: id de l'objet convoité
         """
-        erreurs = []
-        if not ajout_proces_verbal_date:
-            erreurs.append(
-                "Veuillez renseigner la date du procès-verbal à enregistrer.")
-        if not len(ajout_proces_verbal_date) == 10:
-            erreurs.append("La cote doit prendre la forme suivante : AAAA-MM-JJ, ex :\"1784-04-06\" (10 caractères).")
-        if not (ajout_proces_verbal_date.startswith('177') or ajout_proces_verbal_date.startswith('178')):
-            erreurs.append(
-                "Veuillez renseigner une date valide (entre 1770 et 1789).")
-
-        nouveau_proces_verbal = Source.query.filter(
-            ProcesVerbal.date_pv == ajout_proces_verbal_date,
-            ProcesVerbal.id_theatre == ajout_pv_id_theatre,
-            ProcesVerbal.id_source == ajout_pv_id_source,
-            ProcesVerbal.id_commissaire == ajout_pv_id_commissaire,
-            ProcesVerbal.id_victime == ajout_pv_id_victime,
-            ProcesVerbal.id_objet == ajout_pv_id_objet
-        ).count()
-        if nouveau_proces_verbal > 0:
-            erreurs.append("Ce procès-verbal existe déjà dans la base de données.")
+        erreurs = ProcesVerbal.verifier_date(ajout_proces_verbal_date)
+        ajout_proces_verbal_date = ProcesVerbal.convertir_date(ajout_proces_verbal_date)
+        erreurs_references, ids = ProcesVerbal.verifier_references(
+            id_theatre=ajout_pv_id_theatre, id_source=ajout_pv_id_source, id_commissaire=ajout_pv_id_commissaire,
+            id_victime=ajout_pv_id_victime, id_objet=ajout_pv_id_objet)
+        erreurs += erreurs_references
 
         if len(erreurs) > 0:
             return False, erreurs
 
-        nouveau_proces_verbal = ProcesVerbal(date_pv=ajout_proces_verbal_date,
-                                             id_theatre=ajout_pv_id_theatre,
-                                             id_source=ajout_pv_id_source,
-                                             id_commissaire=ajout_pv_id_commissaire,
-                                             id_victime=ajout_pv_id_victime,
-                                             id_objet=ajout_pv_id_objet)
-
+        # l'index unique ux_proces_verbal_cle refuse un procès-verbal déjà enregistré
         try:
-            db.session.add(nouveau_proces_verbal)
+            id = inserer_sans_doublon(ProcesVerbal, date_pv=ajout_proces_verbal_date, **ids)
+            if id is None:
+                db.session.rollback()
+                return False, [MESSAGES_DOUBLON["proces_verbal"]]
             db.session.commit()
+            nouveau_proces_verbal = ProcesVerbal.query.get(id)
+            invalider_pages(*nouveau_proces_verbal.chemins_pages())
             return True, nouveau_proces_verbal
 
         except Exception as erreur:
+            db.session.rollback()
             return False, [str(erreur)]
 
     @staticmethod
@@ -416,40 +831,42 @@ class ProcesVerbal(db.Model):
         :param update_id_objet: id de l'objet convoité
         """
         update_proces_verbal = ProcesVerbal.query.get_or_404(id)
-        erreurs = []
-
-        if not update_date:
-            erreurs.append(
-                "Veuillez renseigner la date du procès-verbal à enregistrer.")
-        if not len(update_date) == 10:
-            erreurs.append("La cote doit prendre la forme suivante : AAAA-MM-JJ, ex :\"1784-04-06\" (10 caractères).")
-        if not (update_date.startswith('177') or update_date.startswith('178')):
-            erreurs.append(
-                "Veuillez renseigner une date valide (entre 1770 et 1789).")
-
-        if update_proces_verbal.date_pv == update_date and update_proces_verbal.id_theatre == update_id_theatre \
-                and update_proces_verbal.id_source == update_id_source \
-                and update_proces_verbal.id_commissaire == update_id_commissaire \
-                and update_proces_verbal.id_victime == update_id_victime \
-                and update_proces_verbal.id_objet == update_id_objet:
+        erreurs = ProcesVerbal.verifier_date(update_date)
+        update_date = ProcesVerbal.convertir_date(update_date)
+        erreurs_references, ids = ProcesVerbal.verifier_references(
+            id_theatre=update_id_theatre, id_source=update_id_source, id_commissaire=update_id_commissaire,
+            id_victime=update_id_victime, id_objet=update_id_objet)
+        erreurs += erreurs_references
+
+        # les id reçus sont comparés une fois convertis en entiers
+        if not erreurs and update_proces_verbal.date_pv == update_date \
+                and all(getattr(update_proces_verbal, colonne) == valeur for colonne, valeur in ids.items()):
             erreurs.append("Aucun changement n'a été effectué.")
 
         if len(erreurs) > 0:
             return False, erreurs
 
+        # pages liées au procès-verbal avant modification (anciennes source, victime, etc.), à invalider avec les
+        # nouvelles
+        chemins = update_proces_verbal.chemins_pages()
         update_proces_verbal.date_pv = update_date
-        update_proces_verbal.id_theatre = update_id_theatre
-        update_proces_verbal.id_source = update_id_source
-        update_proces_verbal.id_commissaire = update_id_commissaire
-        update_proces_verbal.id_victime = update_id_victime
-        update_proces_verbal.id_objet = update_id_objet
+        update_proces_verbal.id_theatre = ids["id_theatre"]
+        update_proces_verbal.id_source = ids["id_source"]
+        update_proces_verbal.id_commissaire = ids["id_commissaire"]
+        update_proces_verbal.id_victime = ids["id_victime"]
+        update_proces_verbal.id_objet = ids["id_objet"]
 
         try:
             db.session.add(update_proces_verbal)
-            db.session.add(Authorship(id_proces_verbal=update_proces_verbal.id, id_user=current_user.id))
+            journaliser(id_proces_verbal=update_proces_verbal.id, id_user=current_user.id)
             db.session.commit()
+            invalider_pages(*chemins, *update_proces_verbal.chemins_pages())
             return True, update_proces_verbal
 
+        except IntegrityError:
+            db.session.rollback()
+            return False, [MESSAGES_DOUBLON["proces_verbal"]]
+
         except Exception as erreur:
             return False, [str(erreur)]
 
@@ -461,9 +878,13 @@ class ProcesVerbal(db.Model):
         """
         delete_proces_verbal = ProcesVerbal.query.get_or_404(id)
 
+        # on relève les pages à invalider avant que l'enregistrement ne soit supprimé
+        chemins = delete_proces_verbal.chemins_pages()
+
         try:
             db.session.delete(delete_proces_verbal)
             db.session.commit()
+            invalider_pages(*chemins)
             return True
 
         except Exception as erreur:
@@ -471,41 +892,63 @@ class ProcesVerbal(db.Model):
 
 
 class Source(db.Model):
+    __table_args__ = (
+        db.Index("ix_source_cote", "cote", "id"),
+    )
     id = db.Column(db.Integer, nullable=False, autoincrement=True, primary_key=True)
-    cote = db.Column(db.Text, nullable=False)
+    # la cote est unique dans la base depuis sa création
+    cote = db.Column(db.Text, nullable=False, unique=True)
     proces_verbaux_sources = db.relationship("ProcesVerbal", back_populates="sources")
     authorships = db.relationship("Authorship", back_populates="source")
 
+    def chemins_pages(self):
+        """
+        Fonction qui renvoie les chemins des pages qui affichent la source
+        :returns: liste de chemins
+        """
+        return ["/sources", "/sources/{}".format(self.id), "/proces_verbaux/*"]
+
     @staticmethod
-    def ajout_source(ajout_source_cote):
+    def verifier_cote(cote):
         """
-        Fonction pour ajouter une nouvelle source
-        :param ajout_source_cote: cote archivistique à ajouter
+        Fonction qui vérifie la cote d'une source, pour l'ajout par le formulaire et l'import en masse
+        :param cote: cote archivistique
+        :returns: liste des erreurs (vide si la cote est valide)
         """
         erreurs = []
-        if not ajout_source_cote:
+        cote = cote or ""
+        if not cote:
             erreurs.append(
                 "Veuillez renseigner la cote de cette source.")
-        if not (len(ajout_source_cote) == 8 or len(ajout_source_cote) == 7 and ajout_source_cote.startswith('Y ')):
+        if not (len(cote) == 8 or len(cote) == 7 and cote.startswith('Y ')):
             erreurs.append("La cote doit prendre la forme suivante : \"Y 11601A\" ou \"Y 15665\" (7 ou 8 caractères).")
+        return erreurs
 
-        nouvelle_source = Source.query.filter(
-            Source.cote == ajout_source_cote).count()
-
-        if nouvelle_source > 0:
-            erreurs.append("Cette cote existe déjà dans la base de données")
+    @staticmethod
+    def ajout_source(ajout_source_cote):
+        """
+        Fonction pour ajouter une nouvelle source
+        :param ajout_source_cote: cote archivistique à ajouter
+        """
+        erreurs = Source.verifier_cote(ajout_source_cote)
 
         if len(erreurs) > 0:
             return False, erreurs
 
-        nouvelle_source = Source(cote=ajout_source_cote)
-
+        # la contrainte UNIQUE de la colonne cote refuse une cote déjà enregistrée
         try:
-            db.session.add(nouvelle_source)
+            id = inserer_sans_doublon(Source, cote=ajout_source_cote)
+            if id is None:
+                db.session.rollback()
+                return False, [MESSAGES_DOUBLON["source"]]
             db.session.commit()
+            nouvelle_source = Source.query.get(id)
+            invalider_pages(*nouvelle_source.chemins_pages())
+            invalider_references("source")
             return True, nouvelle_source
 
         except Exception as erreur:
+            db.session.rollback()
             return False, [str(erreur)]
 
     @staticmethod
@@ -516,9 +959,14 @@ class Source(db.Model):
         """
         delete_source = Source.query.get_or_404(id)
 
+        # on relève les pages à invalider avant que l'enregistrement ne soit supprimé
+        chemins = delete_source.chemins_pages()
+
         try:
             db.session.delete(delete_source)
             db.session.commit()
+            invalider_pages(*chemins)
+            invalider_references("source")
             return True
 
         except Exception as erreur:
@@ -527,40 +975,60 @@ class Source(db.Model):
 
 class Objet(db.Model):
     id = db.Column(db.Integer, nullable=False, autoincrement=True, primary_key=True)
-    type = db.Column(db.Text, nullable=False)
+    # le type est unique dans la base depuis sa création
+    type = db.Column(db.Text, nullable=False, unique=True)
     proces_verbaux_objets = db.relationship("ProcesVerbal", back_populates="objets")
     authorships = db.relationship("Authorship", back_populates="objet")
 
+    def chemins_pages(self):
+        """
+        Fonction qui renvoie les chemins des pages qui affichent le type d'objet (dont les procès-verbaux)
+        :returns: liste de chemins
+        """
+        return ["/objets_voles", "/objets_voles/{}".format(self.id), "/proces_verbaux/*", "/recherche",
+                "/statistiques"]
+
     @staticmethod
-    def ajout_objet(ajout_objet_type):
+    def verifier_type(objet_type):
         """
-        Fonctionpour ajouter un objet à la base de données
-        :param ajout_objet_type: type de l'objet à ajouter
+        Fonction qui vérifie le type d'un objet, pour l'ajout par le formulaire et l'import en masse
+        :param objet_type: type de l'objet
+        :returns: liste des erreurs (vide si le type est valide)
         """
         erreurs = []
-        if not ajout_objet_type:
+        if not objet_type:
             erreurs.append(
                 "Veuillez renseigner le type de l'objet.")
-        if ajout_objet_type and not ajout_objet_type[0].isupper():
+        if objet_type and not objet_type[0].isupper():
             erreurs.append(
                 "Veuillez renseigner le type de l'objet avec une majuscule (ex : Montre).")
+        return erreurs
 
-        nouvel_objet = Objet.query.filter(
-            Objet.type == ajout_objet_type).count()
-        if nouvel_objet > 0:
-            erreurs.append("Cet objet existe déjà dans la base de données.")
+    @staticmethod
+    def ajout_objet(ajout_objet_type):
+        """
+        Fonctionpour ajouter un objet à la base de données
+        :param ajout_objet_type: type de l'objet à ajouter
+        """
+        erreurs = Objet.verifier_type(ajout_objet_type)
 
         if len(erreurs) > 0:
             return False, erreurs
 
-        nouvel_objet = Objet(type=ajout_objet_type)
-
+        # la contrainte UNIQUE de la colonne type refuse un type d'objet déjà enregistré
         try:
-            db.session.add(nouvel_objet)
+            id = inserer_sans_doublon(Objet, type=ajout_objet_type)
+            if id is None:
+                db.session.rollback()
+                return False, [MESSAGES_DOUBLON["objet"]]
             db.session.commit()
+            nouvel_objet = Objet.query.get(id)
+            invalider_pages(*nouvel_objet.chemins_pages())
+            invalider_references("objet")
             return True, nouvel_objet
 
         except Exception as erreur:
+            db.session.rollback()
             return False, [str(erreur)]
 
     @staticmethod
@@ -589,10 +1057,16 @@ class Objet(db.Model):
 
         try:
             db.session.add(update_objet)
-            db.session.add(Authorship(id_objet=update_objet.id, id_user=current_user.id))
+            journaliser(id_objet=update_objet.id, id_user=current_user.id)
             db.session.commit()
+            invalider_pages(*update_objet.chemins_pages())
+            invalider_references("objet")
             return True, update_objet
 
+        except IntegrityError:
+            db.session.rollback()
+            return False, [MESSAGES_DOUBLON["objet"]]
+
         except Exception as erreur:
             return False, [str(erreur)]
 
@@ -602,11 +1076,16 @@ class Objet(db.Model):
         Fonction pour supprimer un objet de la base de données
         :param id: id de l'objet à supprimer
         """
-        delete_objet = Objet.query.get(id)
+        delete_objet = Objet.query.get_or_404(id)
+
+        # on relève les pages à invalider avant que l'enregistrement ne soit supprimé
+        chemins = delete_objet.chemins_pages()
 
         try:
             db.session.delete(delete_objet)
             db.session.commit()
+            invalider_pages(*chemins)
+            invalider_references("objet")
             return True
 
         except Exception as erreur:
@@ -616,6 +1095,17 @@ class Objet(db.Model):
 # on crée une classe pour référencer la création/modification de données à son auteur
 class Authorship(db.Model):
     __tablename__ = "authorship"
+    # index de l'historique de chaque entité et du flux des modifications par date (migration 10)
+    __table_args__ = (
+        db.Index("ix_authorship_proces_verbal_date", "id_proces_verbal", "date"),
+        db.Index("ix_authorship_personne_date", "id_personne", "date"),
+        db.Index("ix_authorship_user_date", "id_user", "date"),
+        db.Index("ix_authorship_salle_theatre_date", "id_salle_theatre", "date"),
+        db.Index("ix_authorship_adresse_date", "id_adresse", "date"),
+        db.Index("ix_authorship_source_date", "id_source", "date"),
+        db.Index("ix_authorship_objet_date", "id_objet", "date"),
+        db.Index("ix_authorship_date", "date", "id"),
+    )
     id = db.Column(db.Integer, nullable=True, autoincrement=True, primary_key=True)
     id_proces_verbal = db.Column(db.Integer, db.ForeignKey('proces_verbal.id'))
     id_personne = db.Column(db.Integer, db.ForeignKey('personne.id'))
@@ -632,3 +1122,143 @@ class Authorship(db.Model):
     salle_theatre = db.relationship("SalleTheatre", back_populates="authorships")
     source = db.relationship("Source", back_populates="authorships")
     objet = db.relationship("Objet", back_populates="authorships")
+
+    # colonne qui référence chaque table dont on garde l'historique
+    COLONNES_ENTITES = {
+        "proces_verbal": "id_proces_verbal",
+        "personne": "id_personne",
+        "adresse": "id_adresse",
+        "salle_theatre": "id_salle_theatre",
+        "source": "id_source",
+        "objet": "id_objet",
+    }
+
+    @staticmethod
+    def historique(table, id):
+        """
+        Fonction qui construit la requête de l'historique des modifications d'un enregistrement, dans l'ordre
+        chronologique (index (colonne, date))
+        :param table: nom de la table (clé de COLONNES_ENTITES)
+        :param id: id de l'enregistrement
+        :returns: requête SQLAlchemy
+        """
+        colonne = getattr(Authorship, Authorship.COLONNES_ENTITES[table])
+        return Authorship.query.filter(colonne == id).order_by(Authorship.date.asc(), Authorship.id.asc())
+
+    @staticmethod
+    def modifications_depuis(date, table=None):
+        """
+        Fonction qui construit la requête des modifications enregistrées après une date, dans l'ordre chronologique
+        (index (date, id)), pour la synchronisation incrémentale des caches et des exports
+        :param date: datetime.datetime (UTC) ; None pour toutes les modifications
+        :param table: nom de la table (clé de COLONNES_ENTITES) pour ne garder que ses modifications, ou None
+        :returns: requête SQLAlchemy
+        """
+        requete = Authorship.query
+        if date is not None:
+            requete = requete.filter(Authorship.date > date)
+        if table is not None:
+            requete = requete.filter(getattr(Authorship, Authorship.COLONNES_ENTITES[table]).isnot(None))
+        return requete.order_by(Authorship.date.asc(), Authorship.id.asc())
+
+    def entites(self):
+        """
+        Fonction qui renvoie les enregistrements concernés par la modification
+        :returns: dictionnaire nom de la table -> id
+        """
+        return {table: getattr(self, colonne) for table, colonne in Authorship.COLONNES_ENTITES.items()
+                if getattr(self, colonne) is not None}
+
+
+# Insertions sans doublon
+# Les tables des personnes, adresses et procès-verbaux ont un index unique sur leur clé naturelle (migration 12), les
+# cotes des sources et les types des objets sont uniques depuis la création de la base. Les méthodes ajout_* insèrent
+# avec INSERT ... ON CONFLICT DO NOTHING au lieu de compter les lignes identiques avant l'insertion : une seule
+# instruction, et deux utilisateurs qui ajoutent la même personne en même temps ne peuvent plus l'enregistrer deux
+# fois. Une insertion ignorée est signalée par le message de MESSAGES_DOUBLON.
+MESSAGES_DOUBLON = {
+    "personne": "Cette personne existe déjà dans la base de données.",
+    "adresse": "Cette adresse existe déjà dans la base de données.",
+    "source": "Cette cote existe déjà dans la base de données",
+    "objet": "Cet objet existe déjà dans la base de données.",
+    "proces_verbal": "Ce procès-verbal existe déjà dans la base de données.",
+}
+
+
+def inserer_sans_doublon(modele, **valeurs):
+    """
+    Fonction qui insère un enregistrement avec INSERT ... ON CONFLICT DO NOTHING, dans la transaction en cours : une
+    insertion ignorée ne l'annule pas, c'est à l'appelant de la valider ou de l'annuler
+    :param modele: modèle de la table
+    :param valeurs: valeurs des colonnes (converties selon le type de leur colonne, ex : date_pv)
+    :returns: id de l'enregistrement inséré, ou None si la clé naturelle existe déjà
+    """
+    table = modele.__table__
+    instruction = db.text("INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING".format(
+        table.name, ", ".join(valeurs), ", ".join(":" + nom for nom in valeurs)))
+    instruction = instruction.bindparams(*[db.bindparam(nom, valeur, type_=table.c[nom].type)
+                                           for nom, valeur in valeurs.items()])
+    resultat = db.session.execute(instruction)
+    if resultat.rowcount == 0:
+        return None
+    return resultat.lastrowid
+
+
+def invalider_pages(*chemins):
+    """
+    Fonction qui retire du cache les pages publiques touchées par une écriture validée. Avec le cache "fichiers" et
+    TACHES_DIFFEREES, les fichiers sont retirés par une tâche de flask worker et la requête de l'éditeur n'attend pas ;
+    le cache "memoire" est propre à chaque processus et doit être vidé par celui qui écrit
+    :param chemins: chemins des pages, éventuellement terminés par * (voir cache.py)
+    """
+    config = current_app.config
+    if not (config["TACHES_DIFFEREES"] and config["CACHE_TYPE"] == "fichiers"):
+        cache.invalider(*chemins)
+        return
+    chemins = sorted(set(chemins))
+    differer("cache", cle="cache:" + " ".join(chemins), chemins=chemins)
+    db.session.commit()
+
+
+# Lignes d'audit
+# Chaque modification enregistre une ligne Authorship avec journaliser(), dans la transaction de la modification.
+# Pendant une opération groupée (bloc with audit_groupe():), les lignes sont gardées en mémoire puis insérées à la fin
+# du bloc, dans la transaction en cours, par instructions INSERT de plusieurs lignes.
+tampon_audit = threading.local()
+# nombre maximal de paramètres d'une instruction (limite de SQLite avant la version 3.32) : il fixe le nombre de
+# lignes d'audit par instruction INSERT
+PARAMETRES_PAR_INSTRUCTION = 999
+
+
+def journaliser(**colonnes):
+    """
+    Fonction qui enregistre une ligne d'audit, ou la met en attente pendant une opération groupée
+    :param colonnes: colonnes de la ligne Authorship (id_user, id_personne, id_adresse...)
+    """
+    colonnes.setdefault("date", datetime.datetime.utcnow())
+    lignes = getattr(tampon_audit, "lignes", None)
+    if lignes is None:
+        db.session.add(Authorship(**colonnes))
+    else:
+        lignes.append(colonnes)
+
+
+@contextmanager
+def audit_groupe():
+    """
+    Gestionnaire de contexte qui regroupe les lignes d'audit enregistrées dans le bloc et les insère à sa sortie, dans
+    la transaction en cours : l'appelant valide ensuite les données et leurs lignes d'audit ensemble (si le bloc lève
+    une exception, aucune ligne n'est insérée et l'appelant annule la transaction)
+    """
+    tampon_audit.lignes = []
+    try:
+        yield
+        lignes = tampon_audit.lignes
+    finally:
+        tampon_audit.lignes = None
+    noms = ["id_user", "date"] + list(Authorship.COLONNES_ENTITES.values())
+    par_insert = PARAMETRES_PAR_INSTRUCTION // len(noms)
+    for debut in range(0, len(lignes), par_insert):
+        # toutes les lignes d'un INSERT de plusieurs lignes doivent avoir les mêmes colonnes
+        paquet = [{nom: ligne.get(nom) for nom in noms} for ligne in lignes[debut:debut + par_insert]]
+        db.session.execute(Authorship.__table__.insert().values(paquet))
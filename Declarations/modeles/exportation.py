@@ -0,0 +1,234 @@
+# Export du corpus
+# Les tables de la base sont exportées en CSV, en JSON Lines (un objet JSON par ligne) ou en XML proche de la TEI. Les
+# lignes sont lues par paquets (yield_per) et écrites au fur et à mesure par des générateurs : la route /export et la
+# commande "flask export" renvoient les fichiers sans jamais charger toute la table en mémoire.
+# Les filtres (dates, théâtre, commissaire) portent sur les procès-verbaux ; pour les autres tables, ils restreignent
+# l'export aux enregistrements liés aux procès-verbaux retenus.
+import csv
+import io
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+from sqlalchemy.orm import aliased
+
+from ..app import db
+from .donnees import ProcesVerbal, Personne, Adresse, Source, Objet, Theatre, Habite
+
+
+# nombre de lignes lues à la fois dans la base
+TAILLE_PAQUET = 500
+
+# formats disponibles : type MIME et extension du fichier
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "jsonl"),
+    "xml": ("application/xml", "xml"),
+}
+
+# éléments de la liste et de chaque enregistrement dans l'export XML
+ELEMENTS_XML = {
+    "proces_verbal": ("listEvent", "event"),
+    "personne": ("listPerson", "person"),
+    "adresse": ("listPlace", "place"),
+    "source": ("listBibl", "bibl"),
+    "objet": ("list", "item"),
+    "theatre": ("listOrg", "org"),
+}
+
+# modèle de chaque table exportée
+MODELES = {
+    "proces_verbal": ProcesVerbal,
+    "personne": Personne,
+    "adresse": Adresse,
+    "source": Source,
+    "objet": Objet,
+    "theatre": Theatre,
+}
+
+ENTITES = tuple(MODELES)
+
+# la table personne est jointe deux fois aux procès-verbaux, pour le commissaire et pour la victime
+COMMISSAIRE = aliased(Personne, name="commissaire")
+VICTIME = aliased(Personne, name="victime")
+
+
+def colonnes_export(entite):
+    """
+    Fonction qui renvoie les colonnes exportées d'une table
+    :param entite: nom de la table (voir ENTITES)
+    :returns: liste de couples (nom de la colonne dans l'export, expression SQLAlchemy)
+    """
+    if entite == "proces_verbal":
+        return [("id", ProcesVerbal.id), ("date_pv", ProcesVerbal.date_pv),
+                ("id_theatre", ProcesVerbal.id_theatre), ("theatre", Theatre.institution),
+                ("id_source", ProcesVerbal.id_source), ("source", Source.cote),
+                ("id_commissaire", ProcesVerbal.id_commissaire), ("commissaire_nom", COMMISSAIRE.nom),
+                ("commissaire_prenom", COMMISSAIRE.prenom),
+                ("id_victime", ProcesVerbal.id_victime), ("victime_nom", VICTIME.nom),
+                ("victime_prenom", VICTIME.prenom), ("victime_qualite", VICTIME.qualite),
+                ("id_objet", ProcesVerbal.id_objet), ("objet", Objet.type)]
+    if entite == "personne":
+        return [("id", Personne.id), ("nom", Personne.nom), ("prenom", Personne.prenom),
+                ("qualite", Personne.qualite)]
+    if entite == "adresse":
+        return [("id", Adresse.id), ("rue", Adresse.rue), ("quartier", Adresse.quartier)]
+    if entite == "source":
+        return [("id", Source.id), ("cote", Source.cote)]
+    if entite == "objet":
+        return [("id", Objet.id), ("type", Objet.type)]
+    return [("id", Theatre.id), ("institution", Theatre.institution)]
+
+
+def convertir_filtres(debut=None, fin=None, id_theatre=None, id_commissaire=None):
+    """
+    Fonction qui convertit les filtres de l'export (reçus dans l'URL, en option de la commande ou en paramètres d'une
+    tâche) et refuse une date invalide, qui ne doit pas être ignorée : l'export contiendrait toute la table
+    :param debut: date minimale (AAAA-MM-JJ, incluse), ou None
+    :param fin: date maximale (AAAA-MM-JJ, incluse), ou None
+    :param id_theatre: id du théâtre, ou None
+    :param id_commissaire: id du commissaire, ou None
+    :returns: dictionnaire des filtres (dates converties en datetime.date, None pour un filtre absent)
+    :raises ValueError: si une date est invalide
+    """
+    filtres = {"id_theatre": id_theatre or None, "id_commissaire": id_commissaire or None}
+    for nom, valeur in (("debut", debut), ("fin", fin)):
+        filtres[nom] = ProcesVerbal.convertir_date(valeur)
+        if valeur and filtres[nom] is None:
+            raise ValueError("Date invalide pour {} : {} (format attendu : AAAA-MM-JJ)".format(nom, valeur))
+    return filtres
+
+
+def filtrer_proces_verbaux(requete, debut=None, fin=None, id_theatre=None, id_commissaire=None):
+    """
+    Fonction qui applique les filtres de l'export à une requête sur les procès-verbaux
+    :param requete: requête SQLAlchemy qui porte sur ProcesVerbal
+    :param debut: date minimale (datetime.date, incluse)
+    :param fin: date maximale (datetime.date, incluse)
+    :param id_theatre: id du théâtre
+    :param id_commissaire: id du commissaire
+    :returns: requête filtrée
+    """
+    if debut:
+        requete = requete.filter(ProcesVerbal.date_pv >= debut)
+    if fin:
+        requete = requete.filter(ProcesVerbal.date_pv <= fin)
+    if id_theatre:
+        requete = requete.filter(ProcesVerbal.id_theatre == id_theatre)
+    if id_commissaire:
+        requete = requete.filter(ProcesVerbal.id_commissaire == id_commissaire)
+    return requete
+
+
+def requete_export(entite, **filtres):
+    """
+    Fonction qui construit la requête d'export d'une table
+    :param entite: nom de la table (voir ENTITES)
+    :param filtres: debut, fin, id_theatre, id_commissaire (voir convertir_filtres)
+    :returns: tuple (noms des colonnes, requête SQLAlchemy)
+    :raises ValueError: si une date est invalide
+    """
+    filtres = convertir_filtres(**filtres)
+    colonnes = colonnes_export(entite)
+    requete = db.session.query(*[expression for nom, expression in colonnes])
+    filtre = any(valeur is not None for valeur in filtres.values())
+
+    if entite == "proces_verbal":
+        requete = requete.select_from(ProcesVerbal)\
+            .outerjoin(Theatre, Theatre.id == ProcesVerbal.id_theatre)\
+            .outerjoin(Source, Source.id == ProcesVerbal.id_source)\
+            .outerjoin(COMMISSAIRE, COMMISSAIRE.id == ProcesVerbal.id_commissaire)\
+            .outerjoin(VICTIME, VICTIME.id == ProcesVerbal.id_victime)\
+            .outerjoin(Objet, Objet.id == ProcesVerbal.id_objet)
+        requete = filtrer_proces_verbaux(requete, **filtres).order_by(ProcesVerbal.id)
+    elif entite == "adresse":
+        if filtre:
+            personnes = filtrer_proces_verbaux(db.session.query(ProcesVerbal.id_victime), **filtres)\
+                .union(filtrer_proces_verbaux(db.session.query(ProcesVerbal.id_commissaire), **filtres))
+            habitants = db.session.query(Habite.c.id_adresse).filter(Habite.c.id_personne.in_(personnes))
+            requete = requete.filter(Adresse.id.in_(habitants))
+        requete = requete.order_by(Adresse.id)
+    else:
+        modele = MODELES[entite]
+        if filtre:
+            if entite == "personne":
+                liees = filtrer_proces_verbaux(db.session.query(ProcesVerbal.id_victime), **filtres)\
+                    .union(filtrer_proces_verbaux(db.session.query(ProcesVerbal.id_commissaire), **filtres))
+            else:
+                colonne = {"source": ProcesVerbal.id_source, "objet": ProcesVerbal.id_objet,
+                           "theatre": ProcesVerbal.id_theatre}[entite]
+                liees = filtrer_proces_verbaux(db.session.query(colonne), **filtres)
+            requete = requete.filter(modele.id.in_(liees))
+        requete = requete.order_by(modele.id)
+
+    return [nom for nom, expression in colonnes], requete.yield_per(TAILLE_PAQUET)
+
+
+def exporter_csv(noms, lignes):
+    """
+    Fonction qui écrit les lignes en CSV
+    :param noms: noms des colonnes (en-tête)
+    :param lignes: itérable de tuples
+    :returns: générateur de chaînes de caractères
+    """
+    tampon = io.StringIO()
+    ecrivain = csv.writer(tampon)
+    ecrivain.writerow(noms)
+    for ligne in lignes:
+        ecrivain.writerow(ligne)
+        # on renvoie le tampon dès qu'il dépasse quelques kilo-octets, pour limiter le nombre de morceaux envoyés
+        if tampon.tell() > 8192:
+            yield tampon.getvalue()
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue()
+
+
+def exporter_ndjson(noms, lignes):
+    """
+    Fonction qui écrit les lignes en JSON Lines, un objet par ligne
+    :param noms: noms des colonnes (clés des objets)
+    :param lignes: itérable de tuples
+    :returns: générateur de chaînes de caractères
+    """
+    for ligne in lignes:
+        yield json.dumps(dict(zip(noms, ligne)), ensure_ascii=False, default=str) + "\n"
+
+
+def exporter_xml(noms, lignes, entite):
+    """
+    Fonction qui écrit les lignes en XML proche de la TEI : une liste (listEvent, listPerson...) qui contient un
+    élément par enregistrement, identifié par xml:id, et un élément ab par colonne
+    :param noms: noms des colonnes
+    :param lignes: itérable de tuples
+    :param entite: nom de la table exportée
+    :returns: générateur de chaînes de caractères
+    """
+    liste, element = ELEMENTS_XML[entite]
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<TEI xmlns="http://www.tei-c.org/ns/1.0">\n' \
+          '<teiHeader><fileDesc><titleStmt><title>Déclarations : {}</title></titleStmt>' \
+          '<publicationStmt><p>Export de la base de données</p></publicationStmt>' \
+          '<sourceDesc><p>Archives nationales, série Y</p></sourceDesc></fileDesc></teiHeader>\n' \
+          '<text><body>\n<{}>\n'.format(escape(entite), liste)
+    for ligne in lignes:
+        champs = "".join("<ab type={}>{}</ab>".format(quoteattr(nom), escape(str(valeur)))
+                         for nom, valeur in zip(noms[1:], ligne[1:]) if valeur is not None)
+        yield "<{element} xml:id={id}>{champs}</{element}>\n".format(
+            element=element, id=quoteattr("{}-{}".format(entite, ligne[0])), champs=champs)
+    yield "</{}>\n</body></text>\n</TEI>\n".format(liste)
+
+
+def exporter(entite, format_export="csv", **filtres):
+    """
+    Fonction qui exporte une table dans le format demandé
+    :param entite: nom de la table (voir ENTITES)
+    :param format_export: "csv", "ndjson" ou "xml" (voir FORMATS)
+    :param filtres: debut, fin, id_theatre, id_commissaire (voir convertir_filtres)
+    :returns: générateur de chaînes de caractères
+    :raises ValueError: si une date est invalide (avant la lecture de la base)
+    """
+    noms, lignes = requete_export(entite, **filtres)
+    if format_export == "ndjson":
+        return exporter_ndjson(noms, lignes)
+    if format_export == "xml":
+        return exporter_xml(noms, lignes, entite)
+    return exporter_csv(noms, lignes)
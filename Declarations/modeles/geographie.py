@@ -0,0 +1,137 @@
+# Index spatial des adresses
+# Les adresses portent une latitude et une longitude (colonnes REAL, en degrés). Leurs points sont rangés dans une
+# table virtuelle SQLite R*Tree, index_spatial_adresse, tenue à jour par des triggers : une requête de proximité ne
+# lit que les adresses du rectangle qui entoure le cercle cherché, sans parcourir toute la table, puis la distance
+# exacte (formule de haversine) écarte les coins du rectangle.
+#
+# La recherche du plus proche voisin agrandit le cercle (RAYON_INITIAL, puis le double...) jusqu'à trouver au moins
+# une adresse : la plus proche des adresses trouvées dans le cercle est la plus proche de toutes.
+import math
+
+from ..app import db
+
+
+# rayon moyen de la Terre, en mètres
+RAYON_TERRE = 6371008.8
+# longueur d'un degré de latitude, en mètres
+METRES_PAR_DEGRE = math.pi * RAYON_TERRE / 180
+# rayon du premier cercle de la recherche du plus proche voisin, et rayon au-delà duquel on abandonne, en mètres
+RAYON_INITIAL = 250
+RAYON_MAX = 50000
+
+# adresses des personnes selon leur rôle : sous-requêtes SQL qui renvoient les id des adresses
+ROLES = {
+    "commissaire": "SELECT habite.id_adresse FROM habite JOIN personne ON personne.id = habite.id_personne "
+                   "WHERE personne.qualite = 'commissaire de police'",
+    "victime": "SELECT habite.id_adresse FROM habite JOIN proces_verbal ON proces_verbal.id_victime = "
+               "habite.id_personne",
+}
+
+
+def creer_index_spatial(connexion):
+    """
+    Fonction qui ajoute les coordonnées aux adresses, crée l'index R*Tree et les triggers qui le tiennent à jour
+    (migration 8)
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    connexion.execute("ALTER TABLE adresse ADD COLUMN latitude REAL")
+    connexion.execute("ALTER TABLE adresse ADD COLUMN longitude REAL")
+    connexion.execute("CREATE VIRTUAL TABLE IF NOT EXISTS index_spatial_adresse USING rtree("
+                      "id, sud, nord, ouest, est)")
+    # seules les adresses localisées sont dans l'index
+    insertion = "INSERT INTO index_spatial_adresse (id, sud, nord, ouest, est) " \
+                "SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude " \
+                "WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;"
+    suppression = "DELETE FROM index_spatial_adresse WHERE id = old.id;"
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS spatial_adresse_insertion AFTER INSERT ON adresse "
+                      "BEGIN {} END".format(insertion))
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS spatial_adresse_modification AFTER UPDATE OF latitude, longitude "
+                      "ON adresse BEGIN {} {} END".format(suppression, insertion))
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS spatial_adresse_suppression AFTER DELETE ON adresse "
+                      "BEGIN {} END".format(suppression))
+
+
+def distance(latitude, longitude, latitude_point, longitude_point):
+    """
+    Fonction qui calcule la distance entre deux points (formule de haversine)
+    :param latitude: latitude du premier point, en degrés
+    :param longitude: longitude du premier point, en degrés
+    :param latitude_point: latitude du second point, en degrés
+    :param longitude_point: longitude du second point, en degrés
+    :returns: distance en mètres
+    """
+    phi, phi_point = math.radians(latitude), math.radians(latitude_point)
+    delta_phi = phi_point - phi
+    delta_lambda = math.radians(longitude_point - longitude)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi) * math.cos(phi_point) * math.sin(delta_lambda / 2) ** 2
+    return 2 * RAYON_TERRE * math.asin(min(1, math.sqrt(a)))
+
+
+def rectangle(latitude, longitude, rayon):
+    """
+    Fonction qui renvoie le rectangle (en degrés) qui contient le cercle de centre et de rayon donnés
+    :param latitude: latitude du centre, en degrés
+    :param longitude: longitude du centre, en degrés
+    :param rayon: rayon en mètres
+    :returns: tuple (sud, nord, ouest, est)
+    """
+    delta_latitude = rayon / METRES_PAR_DEGRE
+    # un degré de longitude est d'autant plus court qu'on s'éloigne de l'équateur
+    cosinus = max(math.cos(math.radians(latitude)), 1e-6)
+    delta_longitude = min(rayon / (METRES_PAR_DEGRE * cosinus), 180)
+    return latitude - delta_latitude, latitude + delta_latitude, longitude - delta_longitude, \
+        longitude + delta_longitude
+
+
+def adresses_zone(sud, nord, ouest, est, role=None):
+    """
+    Fonction qui renvoie les adresses localisées dans un rectangle, par l'index R*Tree
+    :param sud: latitude minimale
+    :param nord: latitude maximale
+    :param ouest: longitude minimale
+    :param est: longitude maximale
+    :param role: rôle des personnes qui y habitent (clé de ROLES), ou None pour toutes les adresses
+    :returns: liste de tuples (id, latitude, longitude)
+    """
+    requete = "SELECT adresse.id, adresse.latitude, adresse.longitude FROM index_spatial_adresse " \
+              "JOIN adresse ON adresse.id = index_spatial_adresse.id " \
+              "WHERE index_spatial_adresse.nord >= :sud AND index_spatial_adresse.sud <= :nord " \
+              "AND index_spatial_adresse.est >= :ouest AND index_spatial_adresse.ouest <= :est"
+    if role is not None:
+        requete += " AND adresse.id IN ({})".format(ROLES[role])
+    return db.session.execute(requete, {"sud": sud, "nord": nord, "ouest": ouest, "est": est}).fetchall()
+
+
+def adresses_rayon(latitude, longitude, rayon, role=None):
+    """
+    Fonction qui renvoie les adresses situées à moins d'une certaine distance d'un point
+    :param latitude: latitude du point, en degrés
+    :param longitude: longitude du point, en degrés
+    :param rayon: distance maximale en mètres
+    :param role: rôle des personnes qui y habitent (clé de ROLES), ou None pour toutes les adresses
+    :returns: liste de tuples (id, distance en mètres), de la plus proche à la plus éloignée
+    """
+    resultats = []
+    for id, latitude_adresse, longitude_adresse in adresses_zone(*rectangle(latitude, longitude, rayon), role=role):
+        ecart = distance(latitude, longitude, latitude_adresse, longitude_adresse)
+        if ecart <= rayon:
+            resultats.append((id, ecart))
+    resultats.sort(key=lambda resultat: resultat[1])
+    return resultats
+
+
+def adresse_plus_proche(latitude, longitude, role=None):
+    """
+    Fonction qui renvoie l'adresse la plus proche d'un point, en agrandissant le cercle de recherche
+    :param latitude: latitude du point, en degrés
+    :param longitude: longitude du point, en degrés
+    :param role: rôle des personnes qui y habitent (clé de ROLES), ou None pour toutes les adresses
+    :returns: tuple (id, distance en mètres), ou None si aucune adresse n'est à moins de RAYON_MAX
+    """
+    rayon = RAYON_INITIAL
+    while rayon <= RAYON_MAX:
+        resultats = adresses_rayon(latitude, longitude, rayon, role=role)
+        if resultats:
+            return resultats[0]
+        rayon *= 2
+    return None
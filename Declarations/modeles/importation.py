@@ -0,0 +1,341 @@
+# Import en masse de procès-verbaux
+# Les formulaires ajoutent les enregistrements un par un (une requête de vérification et un commit par ligne). Pour
+# saisir des cartons entiers de la série Y, la commande "flask import" lit un fichier CSV ou JSON ligne à ligne, sans
+# le charger entièrement en mémoire, et :
+# - vérifie chaque ligne avec les mêmes règles que les formulaires (verifier_* des modèles) ;
+# - retrouve les personnes, sources, objets et théâtres dans des dictionnaires chargés une seule fois ;
+# - écarte les procès-verbaux déjà présents dans la base ou déjà lus dans le fichier ;
+# - insère les nouvelles lignes par lots, avec une seule transaction et un executemany par table et par lot.
+# Les triggers SQLite tiennent à jour l'index de recherche, les compteurs et les versions des tables.
+#
+# Colonnes attendues (en-tête du CSV ou clés des objets JSON) : date_pv, theatre (nom de l'institution), source (cote),
+# commissaire_nom, commissaire_prenom, commissaire_qualite (facultative, "commissaire de police" par défaut),
+# victime_nom, victime_prenom, victime_qualite (facultative) et objet (type de l'objet volé).
+import csv
+import json
+import time
+import unicodedata
+
+from ..app import db, cache
+from .donnees import Personne, Theatre, Source, Objet, ProcesVerbal, Adresse, journaliser, audit_groupe
+from .rapprochement import completer_cles
+
+
+# nombre de lignes insérées par transaction
+TAILLE_LOT = 1000
+# qualité enregistrée pour les commissaires quand la colonne commissaire_qualite est absente ou vide
+QUALITE_COMMISSAIRE = "commissaire de police"
+
+
+class RapportImport:
+    """ Bilan d'un import : nombre de lignes lues, insérées, déjà présentes, erreurs par ligne et débit """
+
+    def __init__(self):
+        self.lues = 0
+        self.inserees = 0
+        self.doublons = 0
+        self.erreurs = []
+        self.debut = time.perf_counter()
+        self.duree = 0
+
+    def terminer(self):
+        self.duree = time.perf_counter() - self.debut
+
+    @property
+    def debit(self):
+        """ Nombre de lignes lues par seconde """
+        return self.lues / self.duree if self.duree else 0
+
+
+def lire_csv(fichier):
+    """
+    Fonction qui lit un fichier CSV ligne par ligne
+    :param fichier: fichier texte ouvert
+    :returns: générateur de dictionnaires (une ligne par dictionnaire, clés de l'en-tête)
+    """
+    # le séparateur (virgule, point-virgule ou tabulation) est déduit du début du fichier
+    debut = fichier.read(4096)
+    fichier.seek(0)
+    try:
+        dialecte = csv.Sniffer().sniff(debut, delimiters=",;\t")
+    except csv.Error:
+        dialecte = csv.excel
+    for ligne in csv.DictReader(fichier, dialect=dialecte):
+        yield ligne
+
+
+def lire_json(fichier, taille_bloc=65536):
+    """
+    Fonction qui lit un fichier JSON, tableau d'objets ou un objet par ligne (JSON Lines), sans le charger en entier
+    :param fichier: fichier texte ouvert
+    :param taille_bloc: nombre de caractères lus à la fois
+    :returns: générateur de dictionnaires
+    """
+    decodeur = json.JSONDecoder()
+    tampon = fichier.read(taille_bloc).lstrip()
+    fin = False
+    if tampon.startswith("["):
+        tampon = tampon[1:]
+    while True:
+        # on retire les séparateurs entre deux objets (espaces, retours à la ligne, virgules du tableau)
+        tampon = tampon.lstrip(" \t\r\n,")
+        if tampon.startswith("]"):
+            return
+        if not tampon:
+            if fin:
+                return
+            tampon = fichier.read(taille_bloc)
+            fin = not tampon
+            continue
+        try:
+            objet, position = decodeur.raw_decode(tampon)
+        except json.JSONDecodeError:
+            # objet coupé à la fin du bloc : on lit la suite du fichier
+            bloc = fichier.read(taille_bloc)
+            if not bloc:
+                raise
+            tampon += bloc
+            continue
+        tampon = tampon[position:]
+        yield objet
+
+
+def nettoyer(valeur):
+    """
+    Fonction qui normalise une valeur lue dans le fichier (espaces retirés, chaîne vide remplacée par None)
+    :param valeur: valeur lue
+    :returns: chaîne de caractères ou None
+    """
+    if valeur is None:
+        return None
+    valeur = str(valeur).strip()
+    return valeur or None
+
+
+class Importation:
+    """ Import d'un fichier de procès-verbaux, avec les tables de correspondance chargées en mémoire """
+
+    def __init__(self, taille_lot=TAILLE_LOT, suivi=None):
+        self.taille_lot = taille_lot
+        # fonction appelée avec le rapport après chaque lot (progression d'une tâche de flask worker), ou None
+        self.suivi = suivi
+        self.rapport = RapportImport()
+        self.lot = []
+        self.charger()
+
+    def charger(self):
+        """
+        Fonction qui charge en mémoire les correspondances entre les valeurs du fichier et les id de la base, et les
+        procès-verbaux existants, en une requête par table
+        """
+        self.personnes = {(nom, prenom, qualite): id for id, nom, prenom, qualite in
+                          db.session.query(Personne.id, Personne.nom, Personne.prenom, Personne.qualite)}
+        self.sources = {cote: id for id, cote in db.session.query(Source.id, Source.cote)}
+        self.objets = {type: id for id, type in db.session.query(Objet.id, Objet.type)}
+        self.theatres = {institution: id for id, institution in db.session.query(Theatre.id, Theatre.institution)}
+        # les procès-verbaux sont identifiés par les valeurs du fichier, pour reconnaître aussi les doublons dont
+        # la personne, la source ou l'objet ne sont pas encore insérés
+        personnes = {id: cle for cle, id in self.personnes.items()}
+        sources = {id: cote for cote, id in self.sources.items()}
+        objets = {id: type for type, id in self.objets.items()}
+        self.proces_verbaux = {
+            (date_pv, id_theatre, sources.get(id_source), personnes.get(id_commissaire), personnes.get(id_victime),
+             objets.get(id_objet))
+            for date_pv, id_theatre, id_source, id_commissaire, id_victime, id_objet in
+            db.session.query(ProcesVerbal.date_pv, ProcesVerbal.id_theatre, ProcesVerbal.id_source,
+                             ProcesVerbal.id_commissaire, ProcesVerbal.id_victime, ProcesVerbal.id_objet)
+        }
+
+    def verifier(self, ligne):
+        """
+        Fonction qui vérifie une ligne du fichier avec les règles des formulaires
+        :param ligne: dictionnaire lu dans le fichier
+        :returns: tuple (booléen, liste des erreurs/clé du procès-verbal)
+        """
+        valeurs = {cle: nettoyer(valeur) for cle, valeur in ligne.items() if cle}
+        date_pv = valeurs.get("date_pv")
+        theatre = valeurs.get("theatre")
+        cote = valeurs.get("source")
+        objet = valeurs.get("objet")
+        commissaire = (valeurs.get("commissaire_nom"), valeurs.get("commissaire_prenom"),
+                       valeurs.get("commissaire_qualite") or QUALITE_COMMISSAIRE)
+        victime = (valeurs.get("victime_nom"), valeurs.get("victime_prenom"), valeurs.get("victime_qualite"))
+
+        erreurs = ProcesVerbal.verifier_date(date_pv)
+        if theatre not in self.theatres:
+            erreurs.append("Le théâtre \"{}\" n'existe pas dans la base de données.".format(theatre or ""))
+        erreurs += Source.verifier_cote(cote)
+        erreurs += ["Commissaire : " + erreur for erreur in Personne.verifier_personne(*commissaire[:2])]
+        erreurs += ["Victime : " + erreur for erreur in Personne.verifier_personne(*victime[:2])]
+        erreurs += Objet.verifier_type(objet)
+        if len(erreurs) > 0:
+            return False, erreurs
+        return True, (ProcesVerbal.convertir_date(date_pv), self.theatres[theatre], cote, commissaire, victime, objet)
+
+    def ajouter(self, numero, ligne):
+        """
+        Fonction qui traite une ligne du fichier : vérification, dédoublonnage et ajout au lot en cours
+        :param numero: numéro de la ligne dans le fichier
+        :param ligne: dictionnaire lu dans le fichier
+        """
+        self.rapport.lues += 1
+        if not isinstance(ligne, dict):
+            self.rapport.erreurs.append((numero, ["La ligne n'est pas un objet JSON."]))
+            return
+        valide, resultat = self.verifier(ligne)
+        if not valide:
+            self.rapport.erreurs.append((numero, resultat))
+            return
+        if resultat in self.proces_verbaux:
+            self.rapport.doublons += 1
+            return
+        self.proces_verbaux.add(resultat)
+        self.lot.append((numero, resultat))
+        if len(self.lot) >= self.taille_lot:
+            self.enregistrer()
+
+    def inserer(self, modele, colonnes, valeurs, correspondances):
+        """
+        Fonction qui insère en une seule instruction les valeurs absentes d'une table de référence, puis ajoute leurs
+        id aux correspondances
+        :param modele: modèle de la table (Personne, Source, Objet)
+        :param colonnes: noms des colonnes qui forment la clé de correspondance
+        :param valeurs: clés de correspondance, une par ligne à insérer
+        :param correspondances: dictionnaire clé -> id à compléter
+        """
+        nouvelles = [valeur for valeur in dict.fromkeys(valeurs) if valeur not in correspondances]
+        if not nouvelles:
+            return
+        table = modele.__table__
+        dernier = db.session.query(db.func.max(table.c.id)).scalar() or 0
+        if len(colonnes) == 1:
+            db.session.execute(table.insert(), [{colonnes[0]: valeur} for valeur in nouvelles])
+        else:
+            db.session.execute(table.insert(), [dict(zip(colonnes, valeur)) for valeur in nouvelles])
+        # les id attribués par SQLite sont relus en une requête : ce sont ceux qui suivent le plus grand id existant
+        for ligne in db.session.execute(db.select([table.c.id] + [table.c[colonne] for colonne in colonnes])
+                                        .where(table.c.id > dernier)):
+            correspondances[ligne[1] if len(colonnes) == 1 else tuple(ligne[1:])] = ligne[0]
+
+    def enregistrer(self):
+        """ Fonction qui insère le lot en cours dans une seule transaction """
+        if not self.lot:
+            return
+        lot, self.lot = self.lot, []
+        try:
+            self.inserer(Personne, ("nom", "prenom", "qualite"),
+                         [cle[3] for numero, cle in lot] + [cle[4] for numero, cle in lot], self.personnes)
+            # les personnes insérées reçoivent leur clé phonétique (recherche des doublons)
+            completer_cles()
+            self.inserer(Source, ("cote",), [cle[2] for numero, cle in lot], self.sources)
+            self.inserer(Objet, ("type",), [cle[5] for numero, cle in lot], self.objets)
+            db.session.execute(ProcesVerbal.__table__.insert(), [
+                {"date_pv": date_pv, "id_theatre": id_theatre, "id_source": self.sources[cote],
+                 "id_commissaire": self.personnes[commissaire], "id_victime": self.personnes[victime],
+                 "id_objet": self.objets[objet]}
+                for numero, (date_pv, id_theatre, cote, commissaire, victime, objet) in lot
+            ])
+            db.session.commit()
+            self.rapport.inserees += len(lot)
+        except Exception as erreur:
+            db.session.rollback()
+            for numero, cle in lot:
+                self.rapport.erreurs.append((numero, [str(erreur)]))
+            # les correspondances ajoutées pendant le lot annulé ne sont plus valables
+            self.charger()
+        if self.suivi is not None:
+            self.suivi(self.rapport)
+
+    def terminer(self):
+        """
+        Fonction qui enregistre le dernier lot et vide le cache des pages publiques
+        :returns: RapportImport
+        """
+        self.enregistrer()
+        if self.rapport.inserees:
+            cache.vider()
+        self.rapport.terminer()
+        return self.rapport
+
+
+def importer(fichier, format_fichier="csv", taille_lot=TAILLE_LOT, suivi=None):
+    """
+    Fonction qui importe les procès-verbaux d'un fichier CSV ou JSON
+    :param fichier: fichier texte ouvert
+    :param format_fichier: "csv" ou "json" (tableau d'objets ou JSON Lines)
+    :param taille_lot: nombre de procès-verbaux insérés par transaction
+    :param suivi: fonction appelée avec le rapport après chaque transaction, ou None
+    :returns: RapportImport
+    """
+    lecteur = lire_json(fichier) if format_fichier == "json" else lire_csv(fichier)
+    importation = Importation(taille_lot=taille_lot, suivi=suivi)
+    # la ligne 1 du CSV est l'en-tête
+    premier = 1 if format_fichier == "json" else 2
+    try:
+        for numero, ligne in enumerate(lecteur, start=premier):
+            importation.ajouter(numero, ligne)
+    except (csv.Error, json.JSONDecodeError) as erreur:
+        importation.rapport.erreurs.append((importation.rapport.lues + premier, [str(erreur)]))
+    return importation.terminer()
+
+
+def normaliser(texte):
+    """
+    Fonction qui normalise un nom de rue ou de quartier pour le comparer : minuscules et accents composés (la base
+    contient des accents décomposés, "e" suivi de l'accent)
+    :param texte: chaîne de caractères ou None
+    :returns: chaîne de caractères
+    """
+    return unicodedata.normalize("NFC", texte or "").lower()
+
+
+def geocoder(fichier):
+    """
+    Fonction qui enregistre les coordonnées des adresses à partir d'un répertoire de rues (fichier CSV aux colonnes
+    rue, quartier (facultative), latitude et longitude). Les rues sont comparées avec normaliser() ; une ligne sans
+    quartier s'applique à toutes les adresses de la rue. L'index spatial est tenu à jour par les triggers, chaque
+    adresse localisée est enregistrée dans authorship
+    :param fichier: fichier texte ouvert
+    :returns: RapportImport (inserees : nombre d'adresses localisées)
+    """
+    rapport = RapportImport()
+    adresses = {}
+    for adresse in Adresse.query:
+        adresses.setdefault(normaliser(adresse.rue), []).append(adresse)
+    localisees = set()
+    try:
+        for numero, ligne in enumerate(lire_csv(fichier), start=2):
+            rapport.lues += 1
+            valeurs = {cle: nettoyer(valeur) for cle, valeur in ligne.items() if cle}
+            valides, coordonnees = Adresse.convertir_coordonnees(valeurs.get("latitude"), valeurs.get("longitude"))
+            if valides and coordonnees[0] is None:
+                valides, coordonnees = False, ["Veuillez renseigner la latitude et la longitude."]
+            if not valides:
+                rapport.erreurs.append((numero, coordonnees))
+                continue
+            quartier = valeurs.get("quartier")
+            trouvees = [adresse for adresse in adresses.get(normaliser(valeurs.get("rue")), [])
+                        if quartier is None or normaliser(adresse.quartier) == normaliser(quartier)]
+            if not trouvees:
+                rapport.erreurs.append((numero, ["L'adresse \"{}\" n'existe pas dans la base de données."
+                                                 .format(valeurs.get("rue") or "")]))
+                continue
+            for adresse in trouvees:
+                adresse.latitude, adresse.longitude = coordonnees
+                localisees.add(adresse.id)
+    except csv.Error as erreur:
+        rapport.erreurs.append((rapport.lues + 2, [str(erreur)]))
+    try:
+        # une ligne d'audit par adresse localisée, insérées ensemble et validées avec la mise à jour des adresses
+        with audit_groupe():
+            for id in localisees:
+                journaliser(id_adresse=id)
+        db.session.commit()
+        rapport.inserees = len(localisees)
+    except Exception as erreur:
+        db.session.rollback()
+        rapport.erreurs.append((0, [str(erreur)]))
+    if rapport.inserees:
+        cache.invalider("/adresses", "/personnes/*", "/carte*")
+    rapport.terminer()
+    return rapport
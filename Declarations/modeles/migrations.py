@@ -0,0 +1,237 @@
+# Mise à jour du schéma de la base de données
+# La base db.sqlite est livrée avec le dépôt : on ne la recrée pas avec db.create_all(), on lui applique les
+# changements de schéma (index, colonnes, tables) au démarrage de l'application. Le numéro de la dernière migration
+# appliquée est conservé dans le PRAGMA user_version de SQLite, chaque migration n'est donc exécutée qu'une fois.
+from ..app import db
+from .recherche import creer_index_recherche, creer_triggers, reconstruire_index_recherche
+from .statistiques import creer_compteurs, creer_triggers_compteur, creer_agregats, recalculer_agregats
+from .versions import creer_versions, creer_triggers_version
+from .geographie import creer_index_spatial
+from .rapprochement import creer_cles_phonetiques
+from .taches import creer_taches
+
+
+# date AAAA-MM-JJ qui existe : date() accepte le 30 février (date('1784-02-30') renvoie '1784-02-30'), mais un calcul
+# sur la date la normalise ('1784-03-01') : seule une date existante est égale à sa version normalisée
+DATE_EXISTANTE = "date({colonne}, '+0 days') IS {colonne}"
+
+
+def convertir_date_pv(connexion):
+    """
+    Fonction qui transforme la colonne date_pv (VARCHAR(10)) en colonne DATE, dont la contrainte CHECK n'accepte que
+    des dates existantes au format AAAA-MM-JJ (migration 6). SQLite ne permet pas de modifier le type d'une colonne :
+    la table est recréée, les lignes y sont copiées avec leur date normalisée par date(), puis les index et les
+    triggers de la table (recherche, compteur, version) sont recréés
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    connexion.execute("CREATE TABLE proces_verbal_date ("
+                      "id INTEGER NOT NULL, "
+                      "date_pv DATE CHECK (date(date_pv) IS date_pv), "
+                      "id_theatre INTEGER, id_source INTEGER, id_commissaire INTEGER, id_victime INTEGER, "
+                      "id_objet INTEGER, "
+                      "PRIMARY KEY (id), "
+                      "FOREIGN KEY (id_commissaire) REFERENCES personne (id), "
+                      "FOREIGN KEY (id_theatre) REFERENCES theatre (id), "
+                      "FOREIGN KEY (id_source) REFERENCES source (id), "
+                      "FOREIGN KEY (id_victime) REFERENCES personne (id), "
+                      "FOREIGN KEY (id_objet) REFERENCES objet (id))")
+    # une date invalide (ou vide) devient NULL plutôt que de bloquer la migration
+    connexion.execute("INSERT INTO proces_verbal_date (id, date_pv, id_theatre, id_source, id_commissaire, "
+                      "id_victime, id_objet) SELECT id, date(trim(date_pv)), id_theatre, id_source, id_commissaire, "
+                      "id_victime, id_objet FROM proces_verbal")
+    connexion.execute("DROP TABLE proces_verbal")
+    connexion.execute("ALTER TABLE proces_verbal_date RENAME TO proces_verbal")
+    # index de la migration 1
+    for instruction in MIGRATIONS[0]:
+        connexion.execute(instruction)
+    creer_triggers(connexion, 1)
+    creer_triggers_compteur(connexion, "proces_verbal")
+    creer_triggers_version(connexion, "proces_verbal")
+    connexion.execute("UPDATE version SET numero = numero + 1, date = strftime('%Y-%m-%d %H:%M:%S', 'now') "
+                      "WHERE nom = 'proces_verbal'")
+
+
+def recreer_proces_verbal(connexion):
+    """
+    Fonction qui recrée la table proces_verbal avec la contrainte CHECK de date_pv (SQLite ne permet pas de modifier
+    le type ni les contraintes d'une colonne) : les lignes sont copiées avec leur date normalisée par date(), puis les
+    index et les triggers de la table sont recréés à partir de leur définition enregistrée dans sqlite_master
+    :param connexion: connexion SQLAlchemy à la base de données
+    :returns: nombre de dates invalides remplacées par NULL
+    """
+    definitions = [ligne[0] for ligne in connexion.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = 'proces_verbal' AND type IN ('index', 'trigger') "
+        "AND sql IS NOT NULL ORDER BY type, name")]
+    connexion.execute("CREATE TABLE proces_verbal_date ("
+                      "id INTEGER NOT NULL, "
+                      "date_pv DATE CHECK ({}), "
+                      "id_theatre INTEGER, id_source INTEGER, id_commissaire INTEGER, id_victime INTEGER, "
+                      "id_objet INTEGER, "
+                      "PRIMARY KEY (id), "
+                      "FOREIGN KEY (id_commissaire) REFERENCES personne (id), "
+                      "FOREIGN KEY (id_theatre) REFERENCES theatre (id), "
+                      "FOREIGN KEY (id_source) REFERENCES source (id), "
+                      "FOREIGN KEY (id_victime) REFERENCES personne (id), "
+                      "FOREIGN KEY (id_objet) REFERENCES objet (id))".format(DATE_EXISTANTE.format(colonne="date_pv")))
+    # une date invalide (ou vide, ou qui n'existe pas) devient NULL plutôt que de bloquer la migration
+    connexion.execute("INSERT INTO proces_verbal_date (id, date_pv, id_theatre, id_source, id_commissaire, "
+                      "id_victime, id_objet) SELECT id, CASE WHEN {} THEN date(trim(date_pv)) END, id_theatre, "
+                      "id_source, id_commissaire, id_victime, id_objet FROM proces_verbal"
+                      .format(DATE_EXISTANTE.format(colonne="date(trim(date_pv))")))
+    invalides = connexion.execute("SELECT count(*) FROM proces_verbal_date WHERE date_pv IS NULL").scalar() - \
+        connexion.execute("SELECT count(*) FROM proces_verbal WHERE date_pv IS NULL").scalar()
+    connexion.execute("DROP TABLE proces_verbal")
+    # les triggers des autres tables (domiciles) qui lisent proces_verbal empêcheraient le renommage, qui vérifie tout
+    # le schéma : le mode historique ne renomme que la table
+    connexion.execute("PRAGMA legacy_alter_table = ON")
+    connexion.execute("ALTER TABLE proces_verbal_date RENAME TO proces_verbal")
+    connexion.execute("PRAGMA legacy_alter_table = OFF")
+    # index (migrations 1 et 12) et triggers (recherche, compteur, version, agrégats) de la table
+    for definition in definitions:
+        connexion.execute(definition)
+    connexion.execute("UPDATE version SET numero = numero + 1, date = strftime('%Y-%m-%d %H:%M:%S', 'now') "
+                      "WHERE nom = 'proces_verbal'")
+    return invalides
+
+
+def verifier_dates_pv(connexion):
+    """
+    Fonction qui applique la contrainte CHECK des dates existantes aux bases dont la migration 6 a accepté des dates
+    impossibles (30 février...) : la table est recréée, puis les agrégats et l'index de recherche sont recalculés si
+    des dates ont été retirées (migration 14)
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    definition = connexion.execute("SELECT sql FROM sqlite_master WHERE type = 'table' "
+                                   "AND name = 'proces_verbal'").scalar()
+    if DATE_EXISTANTE.format(colonne="date_pv") in definition:
+        return
+    if recreer_proces_verbal(connexion):
+        recalculer_agregats(connexion)
+        reconstruire_index_recherche(connexion)
+
+
+# clés naturelles des tables, dans l'ordre où leurs doublons sont fusionnés (les procès-verbaux en dernier, car la
+# fusion des personnes peut en créer) : table -> (nom de l'index unique, expressions de la clé, colonnes qui
+# référencent la table). Une qualité ou un quartier NULL compte comme une chaîne vide. Les colonnes source.cote et
+# objet.type sont déclarées UNIQUE depuis la création de la base
+CLES_NATURELLES = {
+    "personne": ("ux_personne_nom_prenom_qualite", "nom, prenom, ifnull(qualite, '')",
+                 [("proces_verbal", "id_commissaire"), ("proces_verbal", "id_victime"), ("habite", "id_personne"),
+                  ("authorship", "id_personne")]),
+    "adresse": ("ux_adresse_rue_quartier", "rue, ifnull(quartier, '')",
+                [("habite", "id_adresse"), ("authorship", "id_adresse")]),
+    "proces_verbal": ("ux_proces_verbal_cle", "date_pv, id_theatre, id_source, id_commissaire, id_victime, id_objet",
+                      [("authorship", "id_proces_verbal")]),
+}
+
+
+def creer_contraintes_unicite(connexion):
+    """
+    Fonction qui crée les index uniques des clés naturelles des tables (migration 12), sur lesquels s'appuient les
+    insertions INSERT ... ON CONFLICT des modèles. Les doublons exacts déjà présents sont d'abord fusionnés dans
+    l'enregistrement le plus ancien : les lignes qui les référencent lui sont rattachées, puis ils sont supprimés
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    fusions = 0
+    for table, (index, cle, references) in CLES_NATURELLES.items():
+        doublons = connexion.execute("SELECT id, premier FROM (SELECT id, min(id) OVER (PARTITION BY {cle}) AS premier "
+                                     "FROM {table}) WHERE id <> premier".format(cle=cle, table=table)).fetchall()
+        for id, premier in doublons:
+            for table_liee, colonne in references:
+                connexion.execute("UPDATE {table} SET {colonne} = ? WHERE {colonne} = ?"
+                                  .format(table=table_liee, colonne=colonne), (premier, id))
+            connexion.execute("DELETE FROM {} WHERE id = ?".format(table), (id,))
+        fusions += len(doublons)
+        connexion.execute("CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} ({cle})"
+                          .format(index=index, table=table, cle=cle))
+    if fusions:
+        # une personne et son doublon pouvaient habiter à la même adresse ; les triggers des agrégats ne suivent pas
+        # les changements de personne des domiciles, on les recalcule
+        connexion.execute("DELETE FROM habite WHERE id NOT IN (SELECT min(id) FROM habite "
+                          "GROUP BY id_personne, id_adresse)")
+        recalculer_agregats(connexion)
+
+
+# liste ordonnée des migrations : chaque élément est une liste d'instructions SQL ou une fonction qui reçoit la
+# connexion. On ajoute toujours les nouvelles migrations à la fin de la liste, sans modifier les précédentes
+MIGRATIONS = [
+    # 1 : index sur les clés étrangères et la date des procès-verbaux, pour filtrer et trier les procès-verbaux d'une
+    # source, d'un objet, d'un théâtre ou d'une personne sans parcourir toute la table
+    [
+        "CREATE INDEX IF NOT EXISTS ix_proces_verbal_date_pv ON proces_verbal (date_pv)",
+        "CREATE INDEX IF NOT EXISTS ix_proces_verbal_source_date ON proces_verbal (id_source, date_pv)",
+        "CREATE INDEX IF NOT EXISTS ix_proces_verbal_objet_date ON proces_verbal (id_objet, date_pv)",
+        "CREATE INDEX IF NOT EXISTS ix_proces_verbal_theatre_date ON proces_verbal (id_theatre, date_pv)",
+        "CREATE INDEX IF NOT EXISTS ix_proces_verbal_commissaire_date ON proces_verbal (id_commissaire, date_pv)",
+        "CREATE INDEX IF NOT EXISTS ix_proces_verbal_victime_date ON proces_verbal (id_victime, date_pv)",
+    ],
+    # 2 : index de recherche plein texte FTS5 et triggers de synchronisation (voir modeles/recherche.py)
+    creer_index_recherche,
+    # 3 : table des compteurs et triggers de mise à jour (voir modeles/statistiques.py)
+    creer_compteurs,
+    # 4 : table des versions des tables et triggers de mise à jour (voir modeles/versions.py)
+    creer_versions,
+    # 5 : index des clés de tri des index alphabétiques, pour la pagination par curseur (voir modeles/pagination.py)
+    [
+        "CREATE INDEX IF NOT EXISTS ix_personne_nom_lower ON personne (lower(nom), id)",
+        "CREATE INDEX IF NOT EXISTS ix_personne_qualite_nom ON personne (qualite, nom, id)",
+        "CREATE INDEX IF NOT EXISTS ix_adresse_rue_lower ON adresse (lower(rue), id)",
+        "CREATE INDEX IF NOT EXISTS ix_source_cote ON source (cote, id)",
+    ],
+    # 6 : la colonne proces_verbal.date_pv devient une vraie date (voir convertir_date_pv())
+    convertir_date_pv,
+    # 7 : intervalle d'occupation des salles en dates (début inclus, fin exclue) et index qui permet de retrouver la
+    # salle d'un procès-verbal par son théâtre et sa date
+    [
+        "ALTER TABLE salle_theatre ADD COLUMN debut_occupation DATE",
+        "ALTER TABLE salle_theatre ADD COLUMN fin_occupation DATE",
+        "UPDATE salle_theatre SET debut_occupation = substr(dates_occupation_salle, 1, 4) || '-01-01', "
+        "fin_occupation = substr(dates_occupation_salle, 6, 4) || '-01-01' "
+        "WHERE dates_occupation_salle GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9][0-9][0-9]'",
+        "CREATE INDEX IF NOT EXISTS ix_salle_theatre_occupation ON salle_theatre "
+        "(id_institution, debut_occupation, fin_occupation)",
+    ],
+    # 8 : coordonnées des adresses et index spatial R*Tree (voir modeles/geographie.py)
+    creer_index_spatial,
+    # 9 : table des agrégats des procès-verbaux et triggers de mise à jour (voir modeles/statistiques.py)
+    creer_agregats,
+    # 10 : index de la table authorship, pour l'historique de chaque enregistrement et le flux des modifications
+    [
+        "CREATE INDEX IF NOT EXISTS ix_authorship_proces_verbal_date ON authorship (id_proces_verbal, date)",
+        "CREATE INDEX IF NOT EXISTS ix_authorship_personne_date ON authorship (id_personne, date)",
+        "CREATE INDEX IF NOT EXISTS ix_authorship_user_date ON authorship (id_user, date)",
+        "CREATE INDEX IF NOT EXISTS ix_authorship_salle_theatre_date ON authorship (id_salle_theatre, date)",
+        "CREATE INDEX IF NOT EXISTS ix_authorship_adresse_date ON authorship (id_adresse, date)",
+        "CREATE INDEX IF NOT EXISTS ix_authorship_source_date ON authorship (id_source, date)",
+        "CREATE INDEX IF NOT EXISTS ix_authorship_objet_date ON authorship (id_objet, date)",
+        "CREATE INDEX IF NOT EXISTS ix_authorship_date ON authorship (date, id)",
+    ],
+    # 11 : clé phonétique des personnes et son index, pour la recherche des doublons (voir modeles/rapprochement.py)
+    creer_cles_phonetiques,
+    # 12 : index uniques des clés naturelles des personnes, des adresses et des procès-verbaux (voir
+    # creer_contraintes_unicite())
+    creer_contraintes_unicite,
+    # 13 : file d'attente des tâches de maintenance exécutées par flask worker (voir modeles/taches.py)
+    creer_taches,
+    # 14 : la contrainte CHECK de proces_verbal.date_pv refuse aussi les dates qui n'existent pas (voir
+    # verifier_dates_pv())
+    verifier_dates_pv,
+]
+
+
+def appliquer_migrations(engine=None):
+    """
+    Fonction qui applique à la base de données les migrations qui ne l'ont pas encore été
+    :param engine: moteur SQLAlchemy à mettre à jour (par défaut celui de l'application)
+    """
+    engine = engine or db.engine
+    with engine.begin() as connexion:
+        version = connexion.execute("PRAGMA user_version").scalar()
+        for numero, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            if callable(migration):
+                migration(connexion)
+            else:
+                for instruction in migration:
+                    connexion.execute(instruction)
+            # le PRAGMA n'accepte pas de paramètre lié, on y insère directement l'entier
+            connexion.execute("PRAGMA user_version = {:d}".format(numero))
@@ -0,0 +1,113 @@
+# Pagination par curseur (keyset)
+# .paginate() de Flask-SQLAlchemy parcourt toutes les lignes qui précèdent la page demandée (OFFSET) et compte toute
+# la table à chaque requête : les pages lointaines sont de plus en plus lentes. La pagination par curseur reprend la
+# lecture juste après (ou juste avant) le dernier élément affiché, identifié par le couple (clé de tri, id) : la base
+# descend directement dans l'index de la clé de tri, quelle que soit la profondeur de la page.
+# Le curseur transmis dans l'URL (?apres=... ou ?avant=...) est ce couple encodé en base64, opaque pour l'utilisateur.
+import base64
+import datetime
+import json
+
+from sqlalchemy import and_, or_, Date, DateTime
+
+
+class PaginationCurseur:
+    """ Page de résultats obtenue par curseur, avec les curseurs des pages précédente et suivante """
+
+    def __init__(self, items, par_page, total=None, precedent=None, suivant=None):
+        self.items = items
+        self.par_page = par_page
+        self.total = total
+        self.precedent = precedent
+        self.suivant = suivant
+
+
+def encoder_curseur(cle, identifiant):
+    """
+    Fonction qui encode la position (clé de tri, id) d'un élément en curseur opaque
+    :param cle: valeur de la clé de tri de l'élément
+    :param identifiant: id de l'élément
+    :returns: chaîne de caractères utilisable dans une URL
+    """
+    brut = json.dumps([cle, identifiant], default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(brut).decode("ascii").rstrip("=")
+
+
+def decoder_curseur(curseur):
+    """
+    Fonction qui décode un curseur produit par encoder_curseur()
+    :param curseur: chaîne reçue dans l'URL
+    :returns: tuple (clé de tri, id), ou None si le curseur est invalide
+    """
+    try:
+        brut = base64.urlsafe_b64decode(curseur + "=" * (-len(curseur) % 4))
+        cle, identifiant = json.loads(brut.decode("utf-8"))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(identifiant, int):
+        return None
+    return cle, identifiant
+
+
+def convertir_position_date(position, classe=datetime.date):
+    """
+    Fonction qui convertit la clé de tri d'une position décodée en date
+    :param position: tuple (clé, id) renvoyé par decoder_curseur(), ou None
+    :param classe: datetime.date, ou datetime.datetime pour une colonne de type DateTime
+    :returns: tuple (date, id), ou None si la position est absente ou si la clé n'est pas une date
+    """
+    if position is None:
+        return None
+    try:
+        return classe.fromisoformat(position[0]), position[1]
+    except (TypeError, ValueError):
+        return None
+
+
+def paginer_curseur(requete, cle, colonne_id, apres=None, avant=None, par_page=10, total=None):
+    """
+    Fonction qui renvoie une page de résultats triés par (clé, id), située après ou avant un curseur
+    :param requete: requête SQLAlchemy sur le modèle (les tris existants sont ignorés)
+    :param cle: expression de tri (colonne ou expression indexée, ex : func.lower(Personne.nom))
+    :param colonne_id: colonne id du modèle, qui départage les clés égales
+    :param apres: curseur du dernier élément de la page précédente
+    :param avant: curseur du premier élément de la page suivante
+    :param par_page: nombre d'éléments par page
+    :param total: nombre total d'éléments, s'il est connu sans requête supplémentaire
+    :returns: PaginationCurseur
+    """
+    position_apres = decoder_curseur(apres) if apres else None
+    position_avant = decoder_curseur(avant) if avant and not position_apres else None
+    # les dates sont encodées dans le curseur au format AAAA-MM-JJ (AAAA-MM-JJ HH:MM:SS pour une colonne DateTime) et
+    # doivent être reconverties pour être comparées à une colonne de type Date
+    if isinstance(cle.type, (Date, DateTime)):
+        classe = datetime.datetime if isinstance(cle.type, DateTime) else datetime.date
+        position_apres = convertir_position_date(position_apres, classe)
+        position_avant = convertir_position_date(position_avant, classe)
+    # la clé de tri est lue dans la base avec chaque élément, pour que les curseurs reprennent exactement la valeur
+    # comparée par SQLite (lower() de SQLite et de Python ne traitent pas les accents de la même façon)
+    requete = requete.order_by(None).add_columns(cle.label("cle_tri"))
+    # la condition (clé, id) > (valeur, identifiant) est écrite clé >= valeur AND (clé > valeur OR id > identifiant) :
+    # SQLite ne sait pas parcourir un index d'expression à partir d'une comparaison de tuples, alors que la première
+    # partie de cette condition lui permet de commencer la lecture de l'index à la bonne position
+
+    if position_avant:
+        valeur, identifiant = position_avant
+        lignes = requete.filter(and_(cle <= valeur, or_(cle < valeur, colonne_id < identifiant)))\
+            .order_by(cle.desc(), colonne_id.desc()).limit(par_page + 1).all()
+        encore = len(lignes) > par_page
+        lignes = list(reversed(lignes[:par_page]))
+        precedent = encoder_curseur(lignes[0][1], lignes[0][0].id) if encore and lignes else None
+        suivant = encoder_curseur(lignes[-1][1], lignes[-1][0].id) if lignes else None
+    else:
+        if position_apres:
+            valeur, identifiant = position_apres
+            requete = requete.filter(and_(cle >= valeur, or_(cle > valeur, colonne_id > identifiant)))
+        lignes = requete.order_by(cle.asc(), colonne_id.asc()).limit(par_page + 1).all()
+        encore = len(lignes) > par_page
+        lignes = lignes[:par_page]
+        precedent = encoder_curseur(lignes[0][1], lignes[0][0].id) if position_apres and lignes else None
+        suivant = encoder_curseur(lignes[-1][1], lignes[-1][0].id) if encore else None
+
+    return PaginationCurseur([ligne[0] for ligne in lignes], par_page, total=total, precedent=precedent,
+                             suivant=suivant)
@@ -0,0 +1,176 @@
+# Rapprochement des personnes (doublons)
+# Une même personne est parfois saisie plusieurs fois, sous des graphies différentes (« Chénu » et « Chesnu »,
+# « Dupré » et « Duprez », « de Basseux » et « Basseux »). Chaque personne reçoit une clé phonétique calculée à partir
+# de son nom par une variante française de Soundex (colonne personne.cle_phonetique, indexée, migration 11) : on ne
+# compare les noms et les prénoms (rapport de similarité de difflib) qu'entre personnes qui partagent une clé, jamais
+# toute la table deux à deux.
+# - candidats() propose, à l'ajout d'une personne, celles qui lui ressemblent (une lecture de l'index) ;
+# - grappes() regroupe les doublons probables de toute la table (commande flask doublons, page /personnes/doublons) ;
+# - Personne.fusion_personnes() (donnees.py) réunit ensuite plusieurs personnes en une seule.
+# La clé est calculée en Python : les méthodes du modèle et l'import en masse la renseignent, completer_cles() la
+# calcule pour les personnes ajoutées directement dans la base.
+import difflib
+import re
+from itertools import groupby
+
+from sqlalchemy import text
+
+from ..app import db
+from .suggestions import plier
+
+
+# similarité minimale (entre 0 et 1) pour que deux personnes soient proposées comme doublons
+SEUIL_SIMILARITE = 0.8
+# longueur de la clé phonétique
+LONGUEUR_CLE = 4
+# particules ignorées au début des noms
+PARTICULES = {"de", "du", "des", "d", "le", "la", "les", "l"}
+# remplacements appliqués au nom en majuscules avant de réduire les voyelles, dans cet ordre
+REMPLACEMENTS = [(re.compile(motif), remplacement) for motif, remplacement in [
+    ("PH", "F"),
+    ("QU?", "K"),
+    ("GN", "N"),
+    ("GU(?=[EIY])", "K"),
+    ("G(?=[EIY])", "J"),
+    ("G", "K"),
+    ("C(?=[EIY])", "S"),
+    ("C(?!H)", "K"),
+    ("W", "V"),
+    # s muet devant une consonne : « Chesnu » se prononce « Chénu »
+    ("(?<=[AEIOUY])S(?=[BCDFGHJKLMNPQRTVWXZ])", ""),
+    ("(?<=[AEIOU])S(?=[AEIOU])", "Z"),
+]]
+
+
+def cle_phonetique(nom):
+    """
+    Fonction qui calcule la clé phonétique d'un nom (variante française de Soundex) : les noms qui se prononcent de
+    la même façon ont la même clé
+    :param nom: nom de la personne
+    :returns: clé de LONGUEUR_CLE lettres au plus (chaîne vide si le nom ne contient aucune lettre)
+    """
+    mots = [mot for mot in re.split("[^a-z]+", plier(nom).replace("œ", "oe").replace("æ", "ae")) if mot]
+    while len(mots) > 1 and mots[0] in PARTICULES:
+        mots.pop(0)
+    cle = "".join(mots).upper()
+    if not cle:
+        return ""
+    for motif, remplacement in REMPLACEMENTS:
+        cle = motif.sub(remplacement, cle)
+    # toutes les voyelles deviennent A ; H ne compte qu'après C ou S, Y qu'après une voyelle
+    cle = re.sub("[EIOU]", "A", cle)
+    cle = re.sub("(?<![CS])H", "", cle)
+    cle = re.sub("(?<!A)Y", "", cle)
+    if not cle:
+        return ""
+    # finales muettes : une consonne (« Duprez », « Durand »), puis les voyelles
+    cle = cle[0] + re.sub("[DTSXZ]$", "", cle[1:]).rstrip("A")
+    cle = cle[0] + cle[1:].replace("A", "")
+    # lettres répétées
+    cle = re.sub(r"(.)\1+", r"\1", cle)
+    return cle[:LONGUEUR_CLE]
+
+
+def similarite(nom, prenom, autre_nom, autre_prenom):
+    """
+    Fonction qui mesure la ressemblance de deux personnes d'après leurs noms et leurs prénoms, sans tenir compte des
+    accents, des majuscules ni des traits d'union
+    :param nom: nom de la première personne
+    :param prenom: prénom de la première personne
+    :param autre_nom: nom de la seconde personne
+    :param autre_prenom: prénom de la seconde personne
+    :returns: nombre entre 0 et 1
+    """
+    def ratio(premier, second):
+        premier = " ".join(plier(premier).replace("-", " ").split())
+        second = " ".join(plier(second).replace("-", " ").split())
+        return difflib.SequenceMatcher(None, premier, second).ratio()
+
+    if not prenom or not autre_prenom:
+        return ratio(nom, autre_nom)
+    return 0.6 * ratio(nom, autre_nom) + 0.4 * ratio(prenom, autre_prenom)
+
+
+def candidats(nom, prenom, exclure=None, seuil=SEUIL_SIMILARITE):
+    """
+    Fonction qui renvoie les personnes enregistrées qui ressemblent à une personne (même clé phonétique et
+    similarité suffisante), les plus ressemblantes d'abord
+    :param nom: nom de la personne
+    :param prenom: prénom de la personne
+    :param exclure: id d'une personne à ne pas proposer (la personne elle-même), ou None
+    :param seuil: similarité minimale
+    :returns: liste de tuples (similarité, id, nom, prénom, qualité)
+    """
+    cle = cle_phonetique(nom)
+    if not cle:
+        return []
+    lignes = db.session.execute(text("SELECT id, nom, prenom, qualite FROM personne WHERE cle_phonetique = :cle"),
+                                {"cle": cle})
+    trouves = []
+    for id, autre_nom, autre_prenom, qualite in lignes:
+        score = similarite(nom, prenom, autre_nom, autre_prenom)
+        if id != exclure and score >= seuil:
+            trouves.append((score, id, autre_nom, autre_prenom, qualite))
+    trouves.sort(key=lambda trouve: (-trouve[0], trouve[1]))
+    return trouves
+
+
+def grappes(seuil=SEUIL_SIMILARITE):
+    """
+    Fonction qui regroupe les doublons probables de toute la table personne : deux personnes de même clé
+    phonétique assez semblables sont dans la même grappe, ainsi que les personnes semblables à l'une d'elles
+    :param seuil: similarité minimale
+    :returns: liste de grappes (listes d'au moins deux tuples (id, nom, prénom, qualité), par id croissant)
+    """
+    lignes = db.session.execute("SELECT cle_phonetique, id, nom, prenom, qualite FROM personne "
+                                "WHERE cle_phonetique IN (SELECT cle_phonetique FROM personne "
+                                "WHERE cle_phonetique != '' GROUP BY cle_phonetique HAVING count(*) > 1) "
+                                "ORDER BY cle_phonetique, id")
+    resultat = []
+    for cle, bloc in groupby(lignes, key=lambda ligne: ligne[0]):
+        bloc = [tuple(ligne[1:]) for ligne in bloc]
+        # union-find : chaque personne pointe vers la première personne de sa grappe
+        parents = list(range(len(bloc)))
+
+        def racine(position):
+            while parents[position] != position:
+                parents[position] = parents[parents[position]]
+                position = parents[position]
+            return position
+
+        for premier in range(len(bloc)):
+            for second in range(premier + 1, len(bloc)):
+                if similarite(bloc[premier][1], bloc[premier][2], bloc[second][1], bloc[second][2]) >= seuil:
+                    parents[racine(second)] = racine(premier)
+        membres = {}
+        for position, personne in enumerate(bloc):
+            membres.setdefault(racine(position), []).append(personne)
+        resultat.extend(grappe for grappe in membres.values() if len(grappe) > 1)
+    resultat.sort(key=lambda grappe: grappe[0][0])
+    return resultat
+
+
+def completer_cles(connexion=None, toutes=False):
+    """
+    Fonction qui calcule la clé phonétique des personnes qui n'en ont pas (ajoutées directement dans la base), ou de
+    toutes les personnes
+    :param connexion: connexion SQLAlchemy à la base de données (par défaut, celle de la session)
+    :param toutes: True pour recalculer toutes les clés (après un changement de cle_phonetique())
+    :returns: nombre de personnes mises à jour
+    """
+    connexion = connexion or db.session
+    requete = "SELECT id, nom FROM personne" + ("" if toutes else " WHERE cle_phonetique IS NULL")
+    valeurs = [{"id": id, "cle": cle_phonetique(nom)} for id, nom in connexion.execute(requete)]
+    if valeurs:
+        connexion.execute(text("UPDATE personne SET cle_phonetique = :cle WHERE id = :id"), valeurs)
+    return len(valeurs)
+
+
+def creer_cles_phonetiques(connexion):
+    """
+    Fonction qui ajoute la colonne des clés phonétiques à la table personne, la remplit et l'indexe (migration 11)
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    connexion.execute("ALTER TABLE personne ADD COLUMN cle_phonetique TEXT")
+    completer_cles(connexion)
+    connexion.execute("CREATE INDEX IF NOT EXISTS ix_personne_cle_phonetique ON personne (cle_phonetique, id)")
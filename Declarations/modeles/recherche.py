@@ -0,0 +1,158 @@
+# Moteur de recherche plein texte
+# Les textes recherchables de toutes les entités (date des procès-verbaux, institutions, salles, objets, personnes)
+# sont rassemblés dans une seule table virtuelle SQLite FTS5, index_recherche. Le tokenizer unicode61 avec
+# remove_diacritics ignore les accents et la casse ('Comedie' trouve 'Comédie') et l'option prefix accélère les
+# recherches sur le début des mots. La table est tenue à jour par des triggers SQLite : toute insertion, modification
+# ou suppression dans les tables indexées, depuis l'application ou non, est répercutée dans l'index.
+#
+# Le rowid de chaque ligne de l'index encode l'entité et son identifiant : rowid = id * 8 + code de l'entité. On peut
+# ainsi supprimer ou remplacer l'entrée d'un enregistrement par sa clé primaire, sans parcourir l'index.
+from flask import current_app
+from flask_sqlalchemy import Pagination
+
+from ..app import db
+
+
+# code de l'entité : (table, expression SQL du texte indexé). {ligne} est remplacé par le nom de la table ou par
+# new/old dans les triggers
+ENTITES = {
+    1: ("proces_verbal", "{ligne}.date_pv"),
+    2: ("theatre", "{ligne}.institution"),
+    3: ("salle_theatre", "{ligne}.nom_salle"),
+    4: ("objet", "{ligne}.type"),
+    5: ("personne", "coalesce({ligne}.prenom || ' ', '') || {ligne}.nom"),
+}
+
+
+def creer_index_recherche(connexion):
+    """
+    Fonction qui crée la table FTS5 et les triggers de synchronisation, puis remplit l'index (migration 2)
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    connexion.execute("CREATE VIRTUAL TABLE IF NOT EXISTS index_recherche USING fts5("
+                      "texte, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')")
+    for code in ENTITES:
+        creer_triggers(connexion, code)
+    reconstruire_index_recherche(connexion)
+
+
+def creer_triggers(connexion, code):
+    """
+    Fonction qui crée les triggers qui répercutent dans l'index les changements d'une table
+    :param connexion: connexion SQLAlchemy à la base de données
+    :param code: code de l'entité (clé du dictionnaire ENTITES)
+    """
+    table, expression = ENTITES[code]
+    insertion = "INSERT INTO index_recherche(rowid, texte) VALUES (new.id * 8 + {code}, {texte});".format(
+        code=code, texte=expression.format(ligne="new"))
+    suppression = "DELETE FROM index_recherche WHERE rowid = old.id * 8 + {code};".format(code=code)
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS recherche_{table}_insertion AFTER INSERT ON {table} "
+                      "BEGIN {insertion} END".format(table=table, insertion=insertion))
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS recherche_{table}_modification AFTER UPDATE ON {table} "
+                      "BEGIN {suppression} {insertion} END".format(table=table, suppression=suppression,
+                                                                  insertion=insertion))
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS recherche_{table}_suppression AFTER DELETE ON {table} "
+                      "BEGIN {suppression} END".format(table=table, suppression=suppression))
+
+
+def reconstruire_index_recherche(connexion=None):
+    """
+    Fonction qui vide et remplit à nouveau l'index de recherche à partir des tables
+    :param connexion: connexion SQLAlchemy à la base de données (par défaut, celle de la session)
+    """
+    connexion = connexion or db.session
+    connexion.execute("DELETE FROM index_recherche")
+    for code, (table, expression) in ENTITES.items():
+        connexion.execute("INSERT INTO index_recherche(rowid, texte) SELECT {table}.id * 8 + {code}, {texte} "
+                          "FROM {table}".format(table=table, code=code, texte=expression.format(ligne=table)))
+
+
+def expression_recherche(motclef):
+    """
+    Fonction qui traduit les mots-clefs saisis en une expression FTS5 : chaque mot devient une chaîne entre
+    guillemets (les caractères spéciaux de la syntaxe FTS5 sont ainsi neutralisés) suivie de * pour la recherche par
+    préfixe, et tous les mots doivent être présents
+    :param motclef: chaîne de caractères saisie dans le formulaire de recherche
+    :returns: expression FTS5, ou None s'il n'y a aucun mot à chercher
+    """
+    mots = [mot.replace('"', '') for mot in motclef.split()]
+    mots = ['"{}"*'.format(mot) for mot in mots if mot]
+    if not mots:
+        return None
+    return " ".join(mots)
+
+
+def rechercher(motclef, page=1, par_page=None, debut=None, fin=None):
+    """
+    Fonction qui cherche les mots-clefs dans l'index, classe les résultats par pertinence (bm25) et les pagine
+    :param motclef: chaîne de caractères saisie dans le formulaire de recherche
+    :param page: numéro de la page de résultats
+    :param par_page: nombre de résultats par page (RESULTATS_PAR_PAGE de la configuration par défaut)
+    :param debut: date minimale (datetime.date) : seuls les procès-verbaux de la période sont renvoyés
+    :param fin: date maximale (datetime.date)
+    :returns: objet Pagination dont les items sont des tuples (table, id, texte)
+    """
+    par_page = par_page or current_app.config["RESULTATS_PAR_PAGE"]
+    expression = expression_recherche(motclef or "")
+    if debut or fin:
+        return rechercher_periode(expression, debut, fin, page, par_page)
+    if expression is None:
+        return Pagination(None, page, par_page, 0, [])
+
+    total = db.session.execute(db.text("SELECT count(*) FROM index_recherche WHERE index_recherche MATCH :expression"),
+                               {"expression": expression}).scalar()
+    lignes = db.session.execute(db.text("SELECT rowid, texte FROM index_recherche "
+                                        "WHERE index_recherche MATCH :expression "
+                                        "ORDER BY bm25(index_recherche), rowid LIMIT :limite OFFSET :decalage"),
+                                {"expression": expression, "limite": par_page,
+                                 "decalage": (page - 1) * par_page}).fetchall()
+    resultats = []
+    for rowid, texte in lignes:
+        identifiant, code = divmod(rowid, 8)
+        resultats.append((ENTITES[code][0], identifiant, texte))
+    return Pagination(None, page, par_page, total, resultats)
+
+
+def rechercher_periode(expression, debut, fin, page, par_page):
+    """
+    Fonction qui cherche les procès-verbaux d'une période, éventuellement restreints à une expression FTS5. La
+    période est lue dans l'index ix_proces_verbal_date_pv (parcours d'un intervalle de l'index), puis chaque
+    procès-verbal retrouve son entrée de l'index de recherche par son rowid
+    :param expression: expression FTS5 (voir expression_recherche()), ou None pour tous les procès-verbaux de la période
+    :param debut: date minimale (datetime.date) ou None
+    :param fin: date maximale (datetime.date) ou None
+    :param page: numéro de la page de résultats
+    :param par_page: nombre de résultats par page
+    :returns: objet Pagination dont les items sont des tuples (table, id, texte)
+    """
+    conditions = []
+    parametres = {"limite": par_page, "decalage": (page - 1) * par_page}
+    if debut:
+        conditions.append("date_pv >= :debut")
+        parametres["debut"] = debut.isoformat()
+    if fin:
+        conditions.append("date_pv <= :fin")
+        parametres["fin"] = fin.isoformat()
+    periode = " AND ".join(conditions)
+
+    if expression is None:
+        # sans mot-clef, les procès-verbaux de la période sont classés dans l'ordre chronologique
+        total = db.session.execute(db.text("SELECT count(*) FROM proces_verbal WHERE " + periode),
+                                   parametres).scalar()
+        lignes = db.session.execute(db.text("SELECT id * 8 + 1, date_pv FROM proces_verbal WHERE " + periode +
+                                            " ORDER BY date_pv, id LIMIT :limite OFFSET :decalage"),
+                                    parametres).fetchall()
+    else:
+        parametres["expression"] = expression
+        filtre = "index_recherche MATCH :expression AND rowid IN (SELECT id * 8 + 1 FROM proces_verbal WHERE " + \
+                 periode + ")"
+        total = db.session.execute(db.text("SELECT count(*) FROM index_recherche WHERE " + filtre),
+                                   parametres).scalar()
+        lignes = db.session.execute(db.text("SELECT rowid, texte FROM index_recherche WHERE " + filtre +
+                                            " ORDER BY bm25(index_recherche), rowid LIMIT :limite OFFSET :decalage"),
+                                    parametres).fetchall()
+    resultats = []
+    for rowid, texte in lignes:
+        identifiant, code = divmod(rowid, 8)
+        resultats.append((ENTITES[code][0], identifiant, texte))
+    return Pagination(None, page, par_page, total, resultats)
@@ -0,0 +1,84 @@
+# Données de référence des formulaires
+# Les listes déroulantes des formulaires d'ajout et de modification (sources, institutions, commissaires, victimes,
+# personnes, objets, adresses) changent rarement mais étaient relues entièrement, en objets ORM, à chaque affichage
+# et à chaque envoi du formulaire. references() renvoie ces listes sous forme de tuples (id, libellé), gardés en
+# mémoire par l'application avec le numéro de version de leur table (voir modeles/versions.py) :
+# - les méthodes ajout_*, modification_* et suppression_* des modèles retirent immédiatement les listes de leur table
+#   avec invalider_references() ;
+# - les écritures faites par un autre processus (autre worker, commande flask) sont vues grâce au numéro de version,
+#   vérifié au plus une fois toutes les DELAI_VERIFICATION secondes.
+import time
+
+from flask import current_app
+
+from ..app import db
+from .versions import versions
+
+
+# listes disponibles : nom -> (table dont dépend la liste, requête SQL qui renvoie (id, libellé))
+REFERENCES = {
+    "sources": ("source", "SELECT id, cote FROM source ORDER BY id"),
+    "theatres": ("theatre", "SELECT id, institution FROM theatre ORDER BY id"),
+    "commissaires": ("personne", "SELECT id, coalesce(prenom || ' ', '') || nom FROM personne "
+                                 "WHERE qualite = 'commissaire de police' ORDER BY id"),
+    "victimes": ("personne", "SELECT id, coalesce(prenom || ' ', '') || nom FROM personne "
+                             "WHERE qualite != 'commissaire de police' ORDER BY id"),
+    "personnes": ("personne", "SELECT id, coalesce(prenom || ' ', '') || nom FROM personne ORDER BY id"),
+    "objets": ("objet", "SELECT id, type FROM objet ORDER BY id"),
+    "adresses": ("adresse", "SELECT id, rue FROM adresse ORDER BY id"),
+}
+# délai (en secondes) pendant lequel une liste est utilisée sans relire la version de sa table
+DELAI_VERIFICATION = 5
+
+
+def references_application():
+    """
+    Fonction qui renvoie le cache des listes de l'application courante
+    :returns: dictionnaire nom -> (numéro de version, instant de la dernière vérification, liste de tuples)
+    """
+    return current_app.extensions.setdefault("references", {})
+
+
+def references(nom):
+    """
+    Fonction qui renvoie une liste de référence, relue dans la base seulement si sa table a changé
+    :param nom: nom de la liste (clé de REFERENCES)
+    :returns: liste de tuples (id, libellé)
+    """
+    return plusieurs_references(nom)[0]
+
+
+def plusieurs_references(*noms):
+    """
+    Fonction qui renvoie plusieurs listes de référence (menus d'un même formulaire) : les versions de leurs tables
+    sont lues en une seule requête, puis seules les listes dont la table a changé sont relues
+    :param noms: noms des listes (clés de REFERENCES)
+    :returns: liste des listes de tuples (id, libellé), dans l'ordre des noms
+    """
+    cache_listes = references_application()
+    maintenant = time.monotonic()
+    a_verifier = [nom for nom in noms if nom not in cache_listes
+                  or maintenant - cache_listes[nom][1] >= DELAI_VERIFICATION]
+    if a_verifier:
+        tables = list(dict.fromkeys(REFERENCES[nom][0] for nom in a_verifier))
+        numeros = dict(zip(tables, versions(tables)[0]))
+        for nom in a_verifier:
+            table, requete = REFERENCES[nom]
+            entree = cache_listes.get(nom)
+            if entree is not None and entree[0] == numeros[table]:
+                lignes = entree[2]
+            else:
+                lignes = [tuple(ligne) for ligne in db.session.execute(requete)]
+            cache_listes[nom] = (numeros[table], maintenant, lignes)
+    return [cache_listes[nom][2] for nom in noms]
+
+
+def invalider_references(table):
+    """
+    Fonction qui retire du cache les listes construites à partir d'une table, après une écriture dans cette table
+    :param table: nom de la table modifiée
+    """
+    cache_listes = references_application()
+    for nom, (table_liste, requete) in REFERENCES.items():
+        if table_liste == table:
+            cache_listes.pop(nom, None)
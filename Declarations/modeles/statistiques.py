@@ -0,0 +1,224 @@
+# Compteurs de la base de données
+# Le nombre d'enregistrements de chaque table est conservé dans la table statistique, mise à jour par des triggers
+# SQLite à chaque insertion et suppression. Les pages qui affichent ces nombres (page d'accueil, index) lisent une
+# seule ligne au lieu de charger ou de compter toute la table.
+from ..app import db
+
+
+# tables dont on tient le compte
+TABLES_COMPTEES = ("proces_verbal", "personne", "adresse", "source", "objet", "theatre", "salle_theatre")
+
+
+class Statistique(db.Model):
+    nom = db.Column(db.Text, nullable=False, primary_key=True)
+    valeur = db.Column(db.Integer, nullable=False, default=0)
+
+
+def creer_compteurs(connexion):
+    """
+    Fonction qui crée la table des compteurs et les triggers qui la tiennent à jour (migration 3)
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    connexion.execute("CREATE TABLE IF NOT EXISTS statistique (nom TEXT NOT NULL PRIMARY KEY, "
+                      "valeur INTEGER NOT NULL DEFAULT 0)")
+    for table in TABLES_COMPTEES:
+        creer_triggers_compteur(connexion, table)
+    recompter(connexion)
+
+
+def creer_triggers_compteur(connexion, table):
+    """
+    Fonction qui crée les triggers qui incrémentent et décrémentent le compteur d'une table
+    :param connexion: connexion SQLAlchemy à la base de données
+    :param table: nom de la table comptée
+    """
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS compteur_{table}_insertion AFTER INSERT ON {table} "
+                      "BEGIN UPDATE statistique SET valeur = valeur + 1 WHERE nom = '{table}'; END"
+                      .format(table=table))
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS compteur_{table}_suppression AFTER DELETE ON {table} "
+                      "BEGIN UPDATE statistique SET valeur = valeur - 1 WHERE nom = '{table}'; END"
+                      .format(table=table))
+
+
+def recompter(connexion=None):
+    """
+    Fonction qui recalcule tous les compteurs avec COUNT(*), par exemple après une modification directe de la base
+    :param connexion: connexion SQLAlchemy à la base de données (par défaut, celle de la session)
+    """
+    connexion = connexion or db.session
+    for table in TABLES_COMPTEES:
+        connexion.execute("INSERT OR REPLACE INTO statistique (nom, valeur) SELECT '{table}', count(*) FROM {table}"
+                          .format(table=table))
+
+
+def compteur(table):
+    """
+    Fonction qui renvoie le nombre d'enregistrements d'une table
+    :param table: nom de la table (voir TABLES_COMPTEES)
+    :returns: nombre d'enregistrements
+    """
+    statistique = Statistique.query.get(table)
+    if statistique is None:
+        return 0
+    return statistique.valeur
+
+
+# Agrégats des procès-verbaux
+# Les nombres de procès-verbaux par théâtre, par type d'objet, par commissaire et par quartier du domicile de la
+# victime, pour chaque année, sont conservés dans la table agregat et mis à jour par des triggers SQLite, comme les
+# compteurs : l'ajout, la modification et la suppression d'un procès-verbal (formulaires, import en masse) ajoutent ou
+# retirent 1 aux lignes concernées, sans relire les autres procès-verbaux. Les pages de statistiques ne lisent que
+# cette table, dont la taille dépend du nombre de théâtres, d'objets, de commissaires et d'années, et non du nombre de
+# procès-verbaux. Un procès-verbal sans date est compté dans l'année 0.
+
+# dimensions simples : nom -> colonne de proces_verbal qui sert de clé
+DIMENSIONS = {
+    "theatre": "id_theatre",
+    "objet": "id_objet",
+    "commissaire": "id_commissaire",
+}
+# libellés des clés de chaque dimension : requête SQL qui renvoie (clé, libellé)
+LIBELLES = {
+    "theatre": "SELECT id, institution FROM theatre",
+    "objet": "SELECT id, type FROM objet",
+    "commissaire": "SELECT id, coalesce(prenom || ' ', '') || nom FROM personne",
+    "quartier": None,
+}
+# année d'un procès-verbal ({ligne} est remplacé par new, old ou le nom de la table)
+ANNEE = "coalesce(CAST(strftime('%Y', {ligne}.date_pv) AS INTEGER), 0)"
+# quartiers des adresses d'une victime
+QUARTIERS_VICTIME = "SELECT DISTINCT adresse.quartier FROM habite JOIN adresse ON adresse.id = habite.id_adresse " \
+                    "WHERE habite.id_personne = {ligne}.id_victime AND adresse.quartier IS NOT NULL"
+
+
+class Agregat(db.Model):
+    dimension = db.Column(db.Text, nullable=False, primary_key=True)
+    cle = db.Column(db.Text, nullable=False, primary_key=True)
+    annee = db.Column(db.Integer, nullable=False, primary_key=True)
+    nombre = db.Column(db.Integer, nullable=False, default=0)
+
+
+def instructions_agregat(ligne, signe):
+    """
+    Fonction qui renvoie les instructions SQL qui ajoutent ou retirent un procès-verbal des agrégats
+    :param ligne: "new" pour ajouter le procès-verbal inséré, "old" pour retirer le procès-verbal supprimé
+    :param signe: 1 pour ajouter, -1 pour retirer
+    :returns: chaîne d'instructions SQL (corps d'un trigger)
+    """
+    annee = ANNEE.format(ligne=ligne)
+    instructions = []
+    for dimension, colonne in DIMENSIONS.items():
+        # la clause WHERE de la sélection est nécessaire à SQLite pour reconnaître ON CONFLICT
+        instructions.append("INSERT INTO agregat (dimension, cle, annee, nombre) "
+                            "SELECT '{dimension}', {ligne}.{colonne}, {annee}, {signe} "
+                            "WHERE {ligne}.{colonne} IS NOT NULL "
+                            "ON CONFLICT (dimension, cle, annee) DO UPDATE SET nombre = nombre + {signe};"
+                            .format(dimension=dimension, ligne=ligne, colonne=colonne, annee=annee, signe=signe))
+    instructions.append("INSERT INTO agregat (dimension, cle, annee, nombre) "
+                        "SELECT 'quartier', quartier, {annee}, {signe} FROM ({quartiers}) WHERE 1 "
+                        "ON CONFLICT (dimension, cle, annee) DO UPDATE SET nombre = nombre + {signe};"
+                        .format(annee=annee, signe=signe, quartiers=QUARTIERS_VICTIME.format(ligne=ligne)))
+    return " ".join(instructions)
+
+
+def creer_agregats(connexion):
+    """
+    Fonction qui crée la table des agrégats et les triggers qui la tiennent à jour, puis la remplit (migration 9)
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    connexion.execute("CREATE TABLE IF NOT EXISTS agregat (dimension TEXT NOT NULL, cle TEXT NOT NULL, "
+                      "annee INTEGER NOT NULL, nombre INTEGER NOT NULL DEFAULT 0, "
+                      "PRIMARY KEY (dimension, cle, annee))")
+    creer_triggers_agregat(connexion)
+    recalculer_agregats(connexion)
+
+
+def creer_triggers_agregat(connexion):
+    """
+    Fonction qui crée les triggers qui répercutent dans les agrégats les changements des procès-verbaux et des
+    domiciles des victimes
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS agregat_proces_verbal_insertion AFTER INSERT ON proces_verbal "
+                      "BEGIN {} END".format(instructions_agregat("new", 1)))
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS agregat_proces_verbal_modification AFTER UPDATE OF date_pv, "
+                      "id_theatre, id_objet, id_commissaire, id_victime ON proces_verbal "
+                      "BEGIN {} {} END".format(instructions_agregat("old", -1), instructions_agregat("new", 1)))
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS agregat_proces_verbal_suppression AFTER DELETE ON proces_verbal "
+                      "BEGIN {} END".format(instructions_agregat("old", -1)))
+    # une nouvelle adresse de la victime ne compte que si aucune autre de ses adresses n'est dans le même quartier
+    autre_adresse = "SELECT 1 FROM habite AS autre JOIN adresse AS autre_adresse ON autre_adresse.id = " \
+                    "autre.id_adresse WHERE autre.id_personne = {ligne}.id_personne AND autre.id <> {ligne}.id " \
+                    "AND autre_adresse.quartier = {quartier}"
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS agregat_habite_insertion AFTER INSERT ON habite BEGIN "
+                      "INSERT INTO agregat (dimension, cle, annee, nombre) "
+                      "SELECT 'quartier', adresse.quartier, {annee}, count(*) FROM proces_verbal, adresse "
+                      "WHERE adresse.id = new.id_adresse AND proces_verbal.id_victime = new.id_personne "
+                      "AND adresse.quartier IS NOT NULL AND NOT EXISTS ({autre}) GROUP BY 3 "
+                      "ON CONFLICT (dimension, cle, annee) DO UPDATE SET nombre = nombre + excluded.nombre; END"
+                      .format(annee=ANNEE.format(ligne="proces_verbal"),
+                              autre=autre_adresse.format(ligne="new", quartier="adresse.quartier")))
+    connexion.execute("CREATE TRIGGER IF NOT EXISTS agregat_habite_suppression AFTER DELETE ON habite BEGIN "
+                      "UPDATE agregat SET nombre = nombre - (SELECT count(*) FROM proces_verbal "
+                      "WHERE proces_verbal.id_victime = old.id_personne AND {annee} = agregat.annee) "
+                      "WHERE dimension = 'quartier' AND cle = (SELECT quartier FROM adresse WHERE id = old.id_adresse) "
+                      "AND NOT EXISTS ({autre}); END"
+                      .format(annee=ANNEE.format(ligne="proces_verbal"),
+                              autre=autre_adresse.format(ligne="old", quartier="agregat.cle")))
+
+
+def recalculer_agregats(connexion=None):
+    """
+    Fonction qui vide et recalcule tous les agrégats à partir des procès-verbaux, par exemple après une modification
+    directe de la base (commande flask statistiques)
+    :param connexion: connexion SQLAlchemy à la base de données (par défaut, celle de la session)
+    """
+    connexion = connexion or db.session
+    annee = ANNEE.format(ligne="proces_verbal")
+    connexion.execute("DELETE FROM agregat")
+    for dimension, colonne in DIMENSIONS.items():
+        connexion.execute("INSERT INTO agregat (dimension, cle, annee, nombre) "
+                          "SELECT '{dimension}', {colonne}, {annee}, count(*) FROM proces_verbal "
+                          "WHERE {colonne} IS NOT NULL GROUP BY {colonne}, {annee}"
+                          .format(dimension=dimension, colonne=colonne, annee=annee))
+    connexion.execute("INSERT INTO agregat (dimension, cle, annee, nombre) "
+                      "SELECT 'quartier', adresse.quartier, {annee}, count(DISTINCT proces_verbal.id) "
+                      "FROM proces_verbal JOIN habite ON habite.id_personne = proces_verbal.id_victime "
+                      "JOIN adresse ON adresse.id = habite.id_adresse WHERE adresse.quartier IS NOT NULL "
+                      "GROUP BY adresse.quartier, {annee}".format(annee=annee))
+
+
+def lire_libelles(dimension, lignes):
+    """
+    Fonction qui lit les libellés des clés d'une dimension
+    :param dimension: nom de la dimension (clé de LIBELLES)
+    :param lignes: dictionnaire des lignes du tableau, indexé par clé
+    :returns: liste de tuples (clé, libellé)
+    """
+    ids = ", ".join(str(int(cle)) for cle in lignes if cle.isdigit())
+    if not ids:
+        return []
+    return db.session.execute("{} WHERE id IN ({})".format(LIBELLES[dimension], ids)).fetchall()
+
+
+def tableau_agregat(dimension):
+    """
+    Fonction qui renvoie le tableau croisé d'une dimension : une ligne par clé, une colonne par année
+    :param dimension: nom de la dimension (clé de LIBELLES)
+    :returns: tuple (liste des années, liste de dictionnaires (cle, libelle, annees : {année: nombre}, total)
+              triée par total décroissant)
+    """
+    lignes = {}
+    annees = set()
+    for cle, annee, nombre in db.session.query(Agregat.cle, Agregat.annee, Agregat.nombre)\
+            .filter(Agregat.dimension == dimension, Agregat.nombre > 0):
+        ligne = lignes.setdefault(cle, {"cle": cle, "libelle": cle, "annees": {}, "total": 0})
+        ligne["annees"][annee] = nombre
+        ligne["total"] += nombre
+        annees.add(annee)
+    if LIBELLES[dimension] and lignes:
+        # les libellés ne sont lus que pour les clés présentes dans le tableau
+        for cle, libelle in lire_libelles(dimension, lignes):
+            lignes[str(cle)]["libelle"] = libelle
+    return sorted(annees), sorted(lignes.values(), key=lambda ligne: (-ligne["total"], ligne["libelle"]))
+
@@ -0,0 +1,93 @@
+# Suggestions pendant la saisie
+# Les champs des formulaires qui désignent une personne, une adresse, une source... proposent les enregistrements
+# dont un mot du libellé commence par le texte saisi (/suggest/<liste>?q=, voir static/js/suggestions.js). Pour chaque
+# liste de référence (modeles/references.py), un index en mémoire range par ordre alphabétique les clés de tous les
+# mots de chaque libellé, sans accents ni majuscules (« Chénu » -> « chenu ») : une recherche par bisect trouve le
+# premier mot qui commence par le préfixe, puis lit les suivants tant qu'ils le partagent.
+# L'index est reconstruit quand la liste de référence est relue, c'est-à-dire après une écriture dans sa table.
+import bisect
+import unicodedata
+
+from flask import current_app
+
+from .references import references, REFERENCES
+
+
+# nombre maximal de suggestions renvoyées
+SUGGESTIONS_MAX = 10
+# nombre maximal de mots lus dans l'index pour classer les suggestions d'un préfixe très court
+MOTS_MAX = 1000
+
+
+def plier(texte):
+    """
+    Fonction qui retire les accents et les majuscules d'un texte, pour comparer les saisies et les libellés
+    :param texte: chaîne de caractères
+    :returns: chaîne sans signes diacritiques, en minuscules
+    """
+    decompose = unicodedata.normalize("NFKD", texte or "")
+    return "".join(caractere for caractere in decompose if not unicodedata.combining(caractere)).casefold()
+
+
+class IndexPrefixes:
+    """ Index des mots des libellés d'une liste de référence, trié pour la recherche par préfixe """
+
+    def __init__(self, lignes):
+        self.lignes = lignes
+        self.cles_libelles = []
+        entrees = []
+        for position, (id, libelle) in enumerate(lignes):
+            cle_libelle = plier(libelle)
+            self.cles_libelles.append(cle_libelle)
+            debut = 0
+            for mot in cle_libelle.replace("-", " ").replace("'", " ").split():
+                debut = cle_libelle.index(mot, debut)
+                # la clé va du mot jusqu'à la fin du libellé : "gilles chenu" donne "gilles chenu" et "chenu"
+                entrees.append((cle_libelle[debut:], debut, position))
+                debut += len(mot)
+        entrees.sort()
+        self.cles = [entree[0] for entree in entrees]
+        self.entrees = entrees
+
+    def chercher(self, saisie, nombre=SUGGESTIONS_MAX):
+        """
+        Fonction qui renvoie les libellés dont un mot commence par la saisie, les libellés qui commencent par la
+        saisie d'abord, puis les plus courts
+        :param saisie: texte saisi
+        :param nombre: nombre maximal de suggestions
+        :returns: liste de tuples (id, libellé)
+        """
+        prefixe = " ".join(plier(saisie).split())
+        if not prefixe:
+            return []
+        trouves = {}
+        position_cle = bisect.bisect_left(self.cles, prefixe)
+        for cle, debut, position in self.entrees[position_cle:position_cle + MOTS_MAX]:
+            if not cle.startswith(prefixe):
+                break
+            cle_libelle = self.cles_libelles[position]
+            rang = (debut > 0, len(cle_libelle), cle_libelle)
+            if position not in trouves or rang < trouves[position]:
+                trouves[position] = rang
+        meilleurs = sorted(trouves, key=lambda position: trouves[position])[:nombre]
+        return [self.lignes[position] for position in meilleurs]
+
+
+def suggestions(nom, saisie, nombre=SUGGESTIONS_MAX):
+    """
+    Fonction qui renvoie les suggestions d'une liste de référence pour un texte saisi
+    :param nom: nom de la liste (clé de REFERENCES)
+    :param saisie: texte saisi
+    :param nombre: nombre maximal de suggestions
+    :returns: liste de tuples (id, libellé)
+    """
+    if nom not in REFERENCES:
+        raise KeyError(nom)
+    lignes = references(nom)
+    index_application = current_app.extensions.setdefault("suggestions", {})
+    index = index_application.get(nom)
+    # references() renvoie la même liste tant que sa table n'a pas changé
+    if index is None or index.lignes is not lignes:
+        index = IndexPrefixes(lignes)
+        index_application[nom] = index
+    return index.chercher(saisie, nombre)
@@ -0,0 +1,426 @@
+# File d'attente des tâches de maintenance
+# Les traitements longs (import en masse, localisation des adresses, exports, reconstruction de l'index de recherche,
+# recalcul des statistiques) ne doivent pas occuper une requête HTTP. Ils sont enregistrés dans la table tache
+# (migration 13) avec differer(), puis exécutés par la commande "flask worker" (voir lancer_worker()), qui fait
+# tourner plusieurs fils d'exécution ou processus :
+# - chaque fil réserve la plus ancienne tâche en attente par une seule instruction UPDATE (SQLite n'accepte qu'un
+#   écrivain à la fois : deux fils ne peuvent pas réserver la même tâche), l'exécute et enregistre son résultat ;
+# - une tâche en erreur est relancée après TACHES_DELAI_REESSAI secondes (délai doublé à chaque essai), jusqu'à
+#   tentatives_max essais ; une tâche en cours dont la progression n'a pas bougé depuis TACHES_EXPIRATION secondes
+#   (worker arrêté brutalement) est reprise par un autre fil, ou passe en échec si elle a épuisé ses essais ; le
+#   résultat n'est enregistré que si la tâche porte encore le jeton de sa réservation ;
+# - une clé (colonne cle) évite d'enregistrer deux fois la même tâche tant qu'elle est en attente.
+# Chaque type de tâche est une fonction enregistrée dans TACHES par le décorateur @tache, qui reçoit un objet
+# Progression et les paramètres de la tâche, et renvoie un résultat sérialisable en JSON. L'état, la progression et le
+# résultat des tâches sont affichés par la page /admin/jobs.
+import json
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import text
+
+from ..app import db
+
+
+# types de tâches : nom -> fonction(progression, **parametres)
+TACHES = {}
+# états d'une tâche
+ETATS = ("en_attente", "en_cours", "terminee", "echec")
+# instant présent, au format des colonnes de dates de la table (UTC)
+MAINTENANT = "strftime('%Y-%m-%d %H:%M:%S', 'now')"
+# nombre de tâches affichées par la page /admin/jobs
+TACHES_AFFICHEES = 50
+
+
+def creer_taches(connexion):
+    """
+    Fonction qui crée la table des tâches et ses index (migration 13)
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    connexion.execute("CREATE TABLE IF NOT EXISTS tache ("
+                      "id INTEGER PRIMARY KEY, "
+                      "nom TEXT NOT NULL, "
+                      "parametres TEXT NOT NULL DEFAULT '{{}}', "
+                      "cle TEXT, "
+                      "etat TEXT NOT NULL DEFAULT 'en_attente' CHECK (etat IN {etats}), "
+                      "tentatives INTEGER NOT NULL DEFAULT 0, "
+                      "tentatives_max INTEGER NOT NULL DEFAULT 1, "
+                      "progression REAL NOT NULL DEFAULT 0, "
+                      "message TEXT, "
+                      "resultat TEXT, "
+                      "jeton TEXT, "
+                      "id_user INTEGER REFERENCES user (id), "
+                      "date_creation TEXT NOT NULL DEFAULT ({maintenant}), "
+                      "executer_apres TEXT NOT NULL DEFAULT ({maintenant}), "
+                      "date_debut TEXT, date_progression TEXT, date_fin TEXT)"
+                      .format(etats=str(ETATS), maintenant=MAINTENANT))
+    # réservation de la plus ancienne tâche prête
+    connexion.execute("CREATE INDEX IF NOT EXISTS ix_tache_etat ON tache (etat, executer_apres, id)")
+    connexion.execute("CREATE INDEX IF NOT EXISTS ix_tache_jeton ON tache (jeton)")
+    # une seule tâche en attente par clé
+    connexion.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_tache_cle ON tache (cle) WHERE etat = 'en_attente'")
+
+
+def tache(nom):
+    """
+    Décorateur qui enregistre une fonction comme type de tâche
+    :param nom: nom du type de tâche
+    :returns: décorateur
+    """
+    def enregistrer(fonction):
+        TACHES[nom] = fonction
+        return fonction
+    return enregistrer
+
+
+def differer(nom, cle=None, tentatives_max=None, id_user=None, **parametres):
+    """
+    Fonction qui enregistre une tâche dans la file d'attente, dans la transaction en cours (l'appelant la valide)
+    :param nom: type de la tâche (clé de TACHES)
+    :param cle: clé de la tâche : si une tâche de même clé est déjà en attente, la nouvelle n'est pas enregistrée
+    :param tentatives_max: nombre maximal d'essais (par défaut TACHES_TENTATIVES)
+    :param id_user: id de l'utilisateur qui demande la tâche, ou None
+    :param parametres: paramètres de la tâche, sérialisables en JSON
+    :returns: id de la tâche, ou None si une tâche de même clé est déjà en attente
+    """
+    if nom not in TACHES:
+        raise KeyError(nom)
+    resultat = db.session.execute(text("INSERT INTO tache (nom, parametres, cle, tentatives_max, id_user) "
+                                       "VALUES (:nom, :parametres, :cle, :tentatives_max, :id_user) "
+                                       "ON CONFLICT DO NOTHING"),
+                                  {"nom": nom, "parametres": json.dumps(parametres, sort_keys=True), "cle": cle,
+                                   "tentatives_max": tentatives_max or current_app.config["TACHES_TENTATIVES"],
+                                   "id_user": id_user})
+    return resultat.lastrowid if resultat.rowcount else None
+
+
+class TacheReprise(Exception):
+    """ Exception levée quand une tâche a été reprise par un autre fil (elle a dépassé TACHES_EXPIRATION) """
+
+
+class Progression:
+    """ Suivi d'une tâche en cours : la fonction de la tâche indique son avancement avec avancer() """
+
+    def __init__(self, id, jeton):
+        self.id = id
+        self.jeton = jeton
+        self.dernier = time.monotonic()
+
+    def avancer(self, fraction=None, message=None, intervalle=0):
+        """
+        Fonction qui enregistre l'avancement de la tâche, par une connexion distincte de celle de la tâche : on
+        l'appelle quand la tâche n'a pas d'écriture en cours (après chaque lot d'un import, pendant un export...). Une
+        tâche qui dure plus de TACHES_EXPIRATION secondes doit l'appeler régulièrement, sans quoi elle est reprise
+        par un autre fil
+        :param fraction: part du travail effectuée, entre 0 et 1, ou None si elle n'est pas connue
+        :param message: description de l'étape en cours, ou None
+        :param intervalle: délai minimal (en secondes) depuis le dernier enregistrement, pour les appels faits dans
+                           une boucle : l'appel est ignoré si le délai n'est pas écoulé
+        """
+        maintenant = time.monotonic()
+        if intervalle and maintenant - self.dernier < intervalle:
+            return
+        self.dernier = maintenant
+        with db.engine.begin() as connexion:
+            resultat = connexion.execute(
+                text("UPDATE tache SET progression = coalesce(:progression, progression), message = :message, "
+                     "date_progression = {} WHERE id = :id AND jeton = :jeton".format(MAINTENANT)),
+                {"progression": None if fraction is None else min(max(fraction, 0), 1), "message": message,
+                 "id": self.id, "jeton": self.jeton})
+        if not resultat.rowcount:
+            raise TacheReprise("La tâche {} a été reprise par un autre fil".format(self.id))
+
+
+def reserver():
+    """
+    Fonction qui réserve la plus ancienne tâche prête : en attente et dont le délai est passé, ou en cours mais
+    abandonnée (progression immobile depuis TACHES_EXPIRATION secondes). Une tâche abandonnée qui a épuisé ses essais
+    passe en échec au lieu d'être reprise
+    :returns: tuple (id, nom, paramètres, tentatives, tentatives_max, jeton), ou None s'il n'y a aucune tâche prête
+    """
+    jeton = uuid.uuid4().hex
+    expiration = "-{:d} seconds".format(current_app.config["TACHES_EXPIRATION"])
+    db.session.execute(text("UPDATE tache SET etat = 'echec', jeton = NULL, date_fin = {maintenant}, "
+                            "message = 'Tâche abandonnée (worker arrêté ?) après son dernier essai' "
+                            "WHERE etat = 'en_cours' AND date_progression <= datetime('now', :expiration) "
+                            "AND tentatives >= tentatives_max".format(maintenant=MAINTENANT)),
+                       {"expiration": expiration})
+    db.session.execute(text("UPDATE tache SET etat = 'en_cours', jeton = :jeton, tentatives = tentatives + 1, "
+                            "message = NULL, date_debut = {maintenant}, date_progression = {maintenant} "
+                            "WHERE id = (SELECT id FROM tache WHERE (etat = 'en_attente' AND executer_apres <= "
+                            "{maintenant}) OR (etat = 'en_cours' AND date_progression <= datetime('now', :expiration) "
+                            "AND tentatives < tentatives_max) ORDER BY id LIMIT 1)".format(maintenant=MAINTENANT)),
+                       {"jeton": jeton, "expiration": expiration})
+    db.session.commit()
+    ligne = db.session.execute(text("SELECT id, nom, parametres, tentatives, tentatives_max, jeton FROM tache "
+                                    "WHERE jeton = :jeton"), {"jeton": jeton}).first()
+    db.session.commit()
+    return tuple(ligne) if ligne else None
+
+
+def executer(id, nom, parametres, tentatives, tentatives_max, jeton):
+    """
+    Fonction qui exécute une tâche réservée et enregistre son résultat, ou la reprogramme si elle a échoué. Les
+    mises à jour ne touchent la tâche que si elle porte encore le jeton de la réservation : un fil dont la tâche a été
+    reprise par un autre n'écrase pas l'état enregistré par celui-ci
+    :param id: id de la tâche
+    :param nom: type de la tâche
+    :param parametres: paramètres de la tâche (JSON)
+    :param tentatives: numéro de l'essai en cours
+    :param tentatives_max: nombre maximal d'essais
+    :param jeton: jeton de la réservation
+    :returns: booléen, True si la tâche a réussi
+    """
+    try:
+        if nom not in TACHES:
+            raise KeyError("Type de tâche inconnu : {}".format(nom))
+        resultat = TACHES[nom](Progression(id, jeton), **json.loads(parametres))
+        db.session.commit()
+    except TacheReprise:
+        db.session.rollback()
+        current_app.logger.warning("Tâche %s (%s) reprise par un autre fil : essai %s abandonné", id, nom, tentatives)
+        return False
+    except Exception as erreur:
+        db.session.rollback()
+        current_app.logger.exception("Échec de la tâche %s (%s), essai %s sur %s", id, nom, tentatives, tentatives_max)
+        if tentatives < tentatives_max and not isinstance(erreur, KeyError):
+            # nouvel essai plus tard, sauf si une tâche identique attend déjà
+            delai = current_app.config["TACHES_DELAI_REESSAI"] * 2 ** (tentatives - 1)
+            db.session.execute(text("UPDATE tache SET etat = CASE WHEN cle IS NOT NULL AND EXISTS (SELECT 1 FROM "
+                                    "tache AS autre WHERE autre.cle = tache.cle AND autre.etat = 'en_attente') "
+                                    "THEN 'echec' ELSE 'en_attente' END, jeton = NULL, message = :message, "
+                                    "executer_apres = datetime('now', :delai) WHERE id = :id AND jeton = :jeton"),
+                               {"message": str(erreur), "delai": "+{:d} seconds".format(int(delai)), "id": id,
+                                "jeton": jeton})
+        else:
+            db.session.execute(text("UPDATE tache SET etat = 'echec', jeton = NULL, message = :message, "
+                                    "date_fin = {} WHERE id = :id AND jeton = :jeton".format(MAINTENANT)),
+                               {"message": str(erreur), "id": id, "jeton": jeton})
+        db.session.commit()
+        return False
+    mise_a_jour = db.session.execute(text("UPDATE tache SET etat = 'terminee', jeton = NULL, progression = 1, "
+                                          "resultat = :resultat, date_fin = {} WHERE id = :id AND jeton = :jeton"
+                                          .format(MAINTENANT)),
+                                     {"resultat": json.dumps(resultat), "id": id, "jeton": jeton})
+    db.session.commit()
+    if not mise_a_jour.rowcount:
+        current_app.logger.warning("Tâche %s (%s) reprise par un autre fil : résultat de l'essai %s ignoré", id, nom,
+                                   tentatives)
+        return False
+    return True
+
+
+def travailler(app, arret, une_fois=False):
+    """
+    Fonction exécutée par chaque fil (ou processus) du worker : elle réserve et exécute les tâches jusqu'à l'arrêt
+    :param app: application Flask
+    :param arret: événement (threading ou multiprocessing) qui demande l'arrêt après la tâche en cours
+    :param une_fois: True pour s'arrêter dès qu'il n'y a plus de tâche prête
+    """
+    with app.app_context():
+        while not arret.is_set():
+            try:
+                reservee = reserver()
+            except Exception:
+                # base verrouillée trop longtemps par un autre écrivain : on réessaie au tour suivant
+                db.session.rollback()
+                app.logger.exception("Impossible de réserver une tâche")
+                reservee = None
+            if reservee is None:
+                if une_fois:
+                    return
+                arret.wait(app.config["TACHES_ATTENTE"])
+                continue
+            executer(*reservee)
+            db.session.remove()
+
+
+def travailler_processus(app, arret, une_fois=False):
+    """
+    Fonction exécutée par chaque processus du worker : Ctrl+C n'interrompt pas la tâche en cours, c'est le processus
+    principal qui demande l'arrêt
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    travailler(app, arret, une_fois)
+
+
+def lancer_worker(app, nombre, processus=False, une_fois=False):
+    """
+    Fonction qui exécute les tâches de la file d'attente avec plusieurs fils d'exécution ou processus, jusqu'à
+    Ctrl+C ou SIGTERM (la tâche en cours de chaque fil est terminée avant l'arrêt)
+    :param app: application Flask
+    :param nombre: nombre de fils ou de processus
+    :param processus: True pour des processus (tâches qui calculent beaucoup en Python), False pour des fils
+    :param une_fois: True pour s'arrêter quand il n'y a plus de tâche prête
+    """
+    if processus:
+        contexte = multiprocessing.get_context("fork")
+        arret = contexte.Event()
+        # les connexions ouvertes ne doivent pas passer aux processus créés : chacun ouvrira les siennes
+        for moteur in db.moteurs(app):
+            moteur.dispose()
+        travailleurs = [contexte.Process(target=travailler_processus, args=(app, arret, une_fois))
+                        for numero in range(nombre)]
+    else:
+        arret = threading.Event()
+        travailleurs = [threading.Thread(target=travailler, args=(app, arret, une_fois)) for numero in range(nombre)]
+    signal.signal(signal.SIGTERM, lambda numero, cadre: arret.set())
+    for travailleur in travailleurs:
+        travailleur.start()
+    try:
+        while any(travailleur.is_alive() for travailleur in travailleurs):
+            for travailleur in travailleurs:
+                travailleur.join(timeout=1)
+    except KeyboardInterrupt:
+        arret.set()
+        for travailleur in travailleurs:
+            travailleur.join()
+
+
+def lister_taches(nombre=TACHES_AFFICHEES):
+    """
+    Fonction qui renvoie les dernières tâches enregistrées et le nombre de tâches de chaque état
+    :param nombre: nombre de tâches renvoyées
+    :returns: tuple (liste de dictionnaires, de la plus récente à la plus ancienne ; dictionnaire état -> nombre)
+    """
+    colonnes = ("id", "nom", "parametres", "etat", "tentatives", "tentatives_max", "progression", "message",
+                "resultat", "date_creation", "executer_apres", "date_debut", "date_fin")
+    lignes = db.session.execute(text("SELECT {} FROM tache ORDER BY id DESC LIMIT :nombre"
+                                     .format(", ".join(colonnes))), {"nombre": nombre})
+    taches = []
+    for ligne in lignes:
+        valeurs = dict(zip(colonnes, ligne))
+        valeurs["parametres"] = json.loads(valeurs["parametres"])
+        valeurs["resultat"] = json.loads(valeurs["resultat"]) if valeurs["resultat"] else None
+        taches.append(valeurs)
+    etats = dict.fromkeys(ETATS, 0)
+    etats.update(db.session.execute("SELECT etat, count(*) FROM tache GROUP BY etat").fetchall())
+    return taches, etats
+
+
+def relancer(id):
+    """
+    Fonction qui remet en attente une tâche en échec, pour un nouvel essai immédiat
+    :param id: id de la tâche
+    :returns: booléen, True si la tâche a été remise en attente
+    """
+    # OR IGNORE : la tâche reste en échec si une tâche de même clé est déjà en attente
+    resultat = db.session.execute(text("UPDATE OR IGNORE tache SET etat = 'en_attente', tentatives = 0, "
+                                       "message = NULL, date_fin = NULL, executer_apres = {} "
+                                       "WHERE id = :id AND etat = 'echec'".format(MAINTENANT)), {"id": id})
+    return bool(resultat.rowcount)
+
+
+def repertoire_resultats():
+    """
+    Fonction qui renvoie le répertoire des fichiers produits par les tâches (exports), créé si nécessaire
+    :returns: chemin du répertoire
+    """
+    repertoire = current_app.config["TACHES_REPERTOIRE"] or os.path.join(tempfile.gettempdir(), "declarations-taches")
+    os.makedirs(repertoire, exist_ok=True)
+    return repertoire
+
+
+# Types de tâches
+# Les modules des traitements sont importés dans les fonctions : ils importent eux-mêmes les modèles, qui
+# enregistrent des tâches avec differer().
+
+@tache("cache")
+def tache_cache(progression, chemins=None):
+    """
+    Tâche qui retire des pages du cache (toutes si chemins est None) : utile avec le cache "fichiers", partagé par
+    les processus de l'application
+    """
+    from ..app import cache
+    if chemins is None:
+        cache.vider()
+    else:
+        cache.invalider(*chemins)
+    return {"chemins": chemins}
+
+
+@tache("statistiques")
+def tache_statistiques(progression):
+    """ Tâche qui recalcule les compteurs et les agrégats des statistiques à partir des tables """
+    from ..app import cache
+    from .statistiques import recompter, recalculer_agregats
+    recompter()
+    db.session.commit()
+    progression.avancer(0.5, "Compteurs recalculés")
+    recalculer_agregats()
+    db.session.commit()
+    cache.vider()
+    return {}
+
+
+@tache("recherche")
+def tache_recherche(progression):
+    """ Tâche qui reconstruit l'index de recherche plein texte à partir des tables """
+    from ..app import cache
+    from .recherche import reconstruire_index_recherche
+    reconstruire_index_recherche()
+    db.session.commit()
+    cache.invalider("/recherche")
+    return {}
+
+
+def bilan(rapport):
+    """
+    Fonction qui convertit le rapport d'un import ou d'une localisation en résultat de tâche
+    :param rapport: RapportImport
+    :returns: dictionnaire (les 100 premières erreurs seulement)
+    """
+    return {"lues": rapport.lues, "inserees": rapport.inserees, "doublons": rapport.doublons,
+            "erreurs": [[numero, erreurs] for numero, erreurs in rapport.erreurs[:100]],
+            "nombre_erreurs": len(rapport.erreurs), "duree": round(rapport.duree, 2)}
+
+
+@tache("import")
+def tache_import(progression, chemin, format_fichier="csv", taille_lot=None):
+    """ Tâche qui importe un fichier de procès-verbaux (voir modeles/importation.py) """
+    import io
+    from .importation import importer, TAILLE_LOT
+    taille = os.path.getsize(chemin) or 1
+    with open(chemin, "rb") as binaire:
+        fichier = io.TextIOWrapper(binaire, encoding="utf-8-sig", newline="")
+        # la position dans le fichier binaire avance par blocs : c'est une estimation de la part lue
+        rapport = importer(fichier, format_fichier=format_fichier, taille_lot=taille_lot or TAILLE_LOT,
+                           suivi=lambda rapport: progression.avancer(binaire.tell() / taille,
+                                                                     "{} lignes lues".format(rapport.lues)))
+    return bilan(rapport)
+
+
+@tache("geocoder")
+def tache_geocoder(progression, chemin):
+    """ Tâche qui localise les adresses à partir d'un répertoire de rues (voir modeles/importation.py) """
+    from .importation import geocoder
+    with open(chemin, encoding="utf-8-sig", newline="") as fichier:
+        rapport = geocoder(fichier)
+    return bilan(rapport)
+
+
+@tache("export")
+def tache_export(progression, entite, format_export="csv", **filtres):
+    """ Tâche qui exporte une table dans un fichier du répertoire des résultats (voir modeles/exportation.py) """
+    from .exportation import exporter, FORMATS
+    chemin = os.path.join(repertoire_resultats(), "export-{}-{}.{}".format(progression.id, entite,
+                                                                          FORMATS[format_export][1]))
+    # le fichier est écrit sous un nom provisoire, puis renommé : un essai interrompu ne laisse pas d'export tronqué
+    provisoire = chemin + ".partiel"
+    # l'avancement est enregistré pendant l'écriture pour que la tâche ne soit pas reprise comme abandonnée
+    intervalle = current_app.config["TACHES_EXPIRATION"] / 4
+    taille = 0
+    with open(provisoire, "w", encoding="utf-8") as fichier:
+        for morceau in exporter(entite, format_export, **filtres):
+            fichier.write(morceau)
+            taille += len(morceau)
+            progression.avancer(message="{} caractères écrits".format(taille), intervalle=intervalle)
+    os.replace(provisoire, chemin)
+    return {"fichier": chemin, "caracteres": taille}
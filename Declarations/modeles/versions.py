@@ -0,0 +1,74 @@
+# Versions des tables
+# Chaque table affichée par les pages publiques a une ligne dans la table version : un numéro incrémenté et la date
+# (UTC) de la dernière insertion, modification ou suppression, tenus à jour par des triggers SQLite. Ces versions
+# servent à calculer les en-têtes ETag et Last-Modified des pages (voir revalidation.py) : la page n'a pas changé tant
+# que les tables dont elle dépend n'ont pas changé. La table Authorship ne garde la trace que des modifications, pas
+# des ajouts ni des suppressions : elle ne sert qu'à dater les versions lors de leur création.
+import datetime
+
+from ..app import db
+
+
+# tables suivies et colonne de la table authorship qui les référence (None : pas de trace dans authorship)
+TABLES_VERSIONNEES = {
+    "proces_verbal": "id_proces_verbal",
+    "personne": "id_personne",
+    "adresse": "id_adresse",
+    "source": "id_source",
+    "objet": "id_objet",
+    "theatre": None,
+    "salle_theatre": "id_salle_theatre",
+    "habite": None,
+}
+
+# format des dates enregistrées par les triggers
+FORMAT_DATE = "%Y-%m-%d %H:%M:%S"
+
+
+class Version(db.Model):
+    nom = db.Column(db.Text, nullable=False, primary_key=True)
+    numero = db.Column(db.Integer, nullable=False, default=0)
+    date = db.Column(db.Text, nullable=False)
+
+
+def creer_versions(connexion):
+    """
+    Fonction qui crée la table des versions et les triggers qui la tiennent à jour (migration 4). La date initiale
+    de chaque table est celle de sa dernière modification enregistrée dans authorship, ou à défaut la date courante
+    :param connexion: connexion SQLAlchemy à la base de données
+    """
+    connexion.execute("CREATE TABLE IF NOT EXISTS version (nom TEXT NOT NULL PRIMARY KEY, "
+                      "numero INTEGER NOT NULL DEFAULT 0, date TEXT NOT NULL)")
+    for table, colonne in TABLES_VERSIONNEES.items():
+        if colonne:
+            date = "coalesce((SELECT substr(max(date), 1, 19) FROM authorship WHERE {} IS NOT NULL), " \
+                   "strftime('{}', 'now'))".format(colonne, FORMAT_DATE)
+        else:
+            date = "strftime('{}', 'now')".format(FORMAT_DATE)
+        connexion.execute("INSERT OR IGNORE INTO version (nom, numero, date) VALUES ('{}', 0, {})".format(table, date))
+        creer_triggers_version(connexion, table)
+
+
+def creer_triggers_version(connexion, table):
+    """
+    Fonction qui crée les triggers qui changent la version d'une table à chaque écriture
+    :param connexion: connexion SQLAlchemy à la base de données
+    :param table: nom de la table suivie
+    """
+    for evenement in ("INSERT", "UPDATE", "DELETE"):
+        connexion.execute("CREATE TRIGGER IF NOT EXISTS version_{table}_{nom} AFTER {evenement} ON {table} "
+                          "BEGIN UPDATE version SET numero = numero + 1, date = strftime('{format}', 'now') "
+                          "WHERE nom = '{table}'; END".format(table=table, nom=evenement.lower(),
+                                                              evenement=evenement, format=FORMAT_DATE))
+
+
+def versions(tables):
+    """
+    Fonction qui renvoie les versions des tables demandées, en une seule requête
+    :param tables: noms des tables
+    :returns: tuple (liste des numéros dans l'ordre des tables, date de la modification la plus récente ou None)
+    """
+    lignes = {version.nom: version for version in Version.query.filter(Version.nom.in_(tables))}
+    numeros = [lignes[table].numero if table in lignes else 0 for table in tables]
+    dates = [datetime.datetime.strptime(lignes[table].date, FORMAT_DATE) for table in tables if table in lignes]
+    return numeros, max(dates) if dates else None
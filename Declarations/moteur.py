@@ -0,0 +1,98 @@
+# Connexions à la base de données
+# Flask-SQLAlchemy ouvre par défaut une nouvelle connexion SQLite à chaque requête (NullPool) avec les réglages par
+# défaut de SQLite (journal "delete" : un écrivain bloque tous les lecteurs). BaseDeDonnees :
+# - garde les connexions ouvertes dans un pool (QueuePool, taille POOL_TAILLE) ;
+# - applique à chaque nouvelle connexion les PRAGMA de SQLITE_PRAGMAS (journal WAL, busy_timeout...) ;
+# - envoie les lectures des requêtes GET et HEAD à la base "lecture" (SQLALCHEMY_BINDS, voir configuration.py) : le
+#   fichier principal ouvert en lecture seule, ou une copie répliquée. Les écritures (flush) vont toujours à la base
+#   principale, de même que tout ce qui se passe hors d'une requête (commandes flask, migrations).
+from flask import has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool
+
+
+# PRAGMA qui ne concernent que les connexions qui écrivent
+PRAGMAS_ECRITURE = ("journal_mode", "synchronous")
+
+
+def lecture_seule(app):
+    """
+    Fonction qui indique si la requête en cours peut lire la base des lectures
+    :param app: application Flask
+    :returns: booléen
+    """
+    return bool(app.config.get("SQLALCHEMY_BINDS")) and has_request_context() and request.method in ("GET", "HEAD")
+
+
+class SessionLecture(SignallingSession):
+    """ Session qui lit dans la base des lectures pendant les requêtes GET et HEAD """
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and lecture_seule(self.app):
+            return self.app.extensions["sqlalchemy"].db.get_engine(self.app, bind="lecture")
+        return super().get_bind(mapper, clause)
+
+
+class BaseDeDonnees(SQLAlchemy):
+    """ Extension Flask-SQLAlchemy avec pool de connexions SQLite, PRAGMA et base des lectures """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=SessionLecture, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        # Flask-SQLAlchemy préfixe le chemin de la base par le répertoire de l'application, ce qui casse les URI
+        # "file:...?mode=ro&uri=true" de la base des lectures, dont le chemin est déjà absolu
+        chemin = info.database
+        super().apply_driver_hacks(app, info, options)
+        if info.drivername != "sqlite":
+            return
+        if info.query.get("uri"):
+            info.database = chemin
+        if options.get("pool_size") and options.get("poolclass") is not QueuePool and info.database:
+            # SQLAlchemy choisit NullPool pour un fichier SQLite : on garde les connexions ouvertes, et on les autorise
+            # à passer d'un fil d'exécution à l'autre (une connexion n'est utilisée que par un fil à la fois)
+            options["poolclass"] = QueuePool
+            options.setdefault("connect_args", {})["check_same_thread"] = False
+
+    def installer_pragmas(self, app):
+        """
+        Fonction qui applique les PRAGMA de SQLITE_PRAGMAS à chaque nouvelle connexion des moteurs SQLite
+        :param app: application Flask
+        """
+        moteurs = {None: self.get_engine(app)}
+        for bind in app.config.get("SQLALCHEMY_BINDS") or ():
+            moteurs[bind] = self.get_engine(app, bind=bind)
+        for bind, moteur in moteurs.items():
+            if moteur.dialect.name != "sqlite":
+                continue
+            pragmas = dict(app.config["SQLITE_PRAGMAS"] or {})
+            if bind is not None:
+                for nom in PRAGMAS_ECRITURE:
+                    pragmas.pop(nom, None)
+            event.listen(moteur, "connect", appliquer_pragmas(pragmas))
+
+    def moteurs(self, app):
+        """
+        Fonction qui renvoie tous les moteurs de l'application (base principale et base des lectures)
+        :param app: application Flask
+        :returns: liste de moteurs SQLAlchemy
+        """
+        return [self.get_engine(app)] + [self.get_engine(app, bind=bind)
+                                         for bind in app.config.get("SQLALCHEMY_BINDS") or ()]
+
+
+def appliquer_pragmas(pragmas):
+    """
+    Fonction qui construit l'écouteur de l'événement "connect" qui applique des PRAGMA à une connexion
+    :param pragmas: dictionnaire nom -> valeur
+    :returns: fonction (connexion DB-API, enregistrement du pool)
+    """
+    def connexion_ouverte(connexion, enregistrement):
+        curseur = connexion.cursor()
+        for nom, valeur in pragmas.items():
+            # les noms et les valeurs viennent de la configuration, pas des utilisateurs ; le PRAGMA n'accepte pas de
+            # paramètre lié
+            curseur.execute("PRAGMA {} = {}".format(nom, valeur))
+        curseur.close()
+    return connexion_ouverte
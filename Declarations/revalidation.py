@@ -0,0 +1,53 @@
+# Requêtes HTTP conditionnelles
+# Les pages publiques envoient les en-têtes ETag et Last-Modified, calculés à partir des versions des tables qu'elles
+# affichent (voir modeles/versions.py). Quand le navigateur ou le proxy renvoie l'ETag qu'il a conservé
+# (If-None-Match) ou la date de sa copie (If-Modified-Since) et que rien n'a changé, on répond 304 sans exécuter la
+# route ni rendre le template.
+import hashlib
+from functools import wraps
+
+from flask import request, session, make_response
+from flask_login import current_user
+
+from .modeles.versions import versions
+
+
+def conditionnel(*tables):
+    """
+    Décorateur des routes publiques qui gère les requêtes conditionnelles
+    :param tables: noms des tables dont dépend le contenu de la page
+    """
+    def decorateur(vue):
+        @wraps(vue)
+        def vue_conditionnelle(*args, **kwargs):
+            # une page qui affiche un message flash doit être rendue
+            if request.method != "GET" or session.get("_flashes"):
+                return vue(*args, **kwargs)
+
+            numeros, derniere_modification = versions(tables)
+            # la barre de navigation dépend de l'utilisateur connecté, qui fait donc partie de l'ETag
+            empreinte = "{}|{}".format(current_user.get_id() or "anonyme", ",".join(str(n) for n in numeros))
+            etag = hashlib.sha1(empreinte.encode("utf-8")).hexdigest()[:20]
+
+            if request.if_none_match:
+                inchangee = request.if_none_match.contains(etag)
+            else:
+                inchangee = derniere_modification is not None and request.if_modified_since is not None \
+                    and derniere_modification <= request.if_modified_since.replace(tzinfo=None)
+
+            if inchangee:
+                reponse = make_response("", 304)
+            else:
+                reponse = make_response(vue(*args, **kwargs))
+                if reponse.status_code != 200:
+                    return reponse
+            reponse.set_etag(etag)
+            if derniere_modification is not None:
+                reponse.last_modified = derniere_modification
+            # la réponse dépend du cookie de session (utilisateur connecté)
+            reponse.vary.add("Cookie")
+            # le navigateur doit revalider la page à chaque consultation
+            reponse.cache_control.no_cache = True
+            return reponse
+        return vue_conditionnelle
+    return decorateur
@@ -0,0 +1,81 @@
+# Routes d'administration : file d'attente des tâches de maintenance (voir modeles/taches.py), réservées aux
+# utilisateurs connectés
+# Import des librairies
+import json
+import os
+
+from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, send_file
+from flask_login import login_required, current_user
+
+# Import de la base de données et des tâches
+from ..app import db
+from ..modeles.taches import differer, lister_taches, relancer
+from ..modeles.exportation import ENTITES, FORMATS
+
+
+admin = Blueprint("admin", __name__)
+
+# tâches qui peuvent être lancées depuis la page : nom -> libellé
+TACHES_MANUELLES = {
+    "statistiques": "Recalculer les statistiques",
+    "recherche": "Reconstruire l'index de recherche",
+    "export": "Exporter une table",
+}
+
+
+# route de la liste des tâches : état, progression, nombre d'essais et résultat des dernières tâches
+@admin.route("/admin/jobs")
+@login_required
+def taches():
+    liste, etats = lister_taches()
+    return render_template("pages/taches.html", nom="Tâches", taches=liste, etats=etats,
+                           manuelles=TACHES_MANUELLES, entites=ENTITES, formats=FORMATS)
+
+
+# route pour enregistrer une tâche dans la file d'attente : elle sera exécutée par flask worker
+@admin.route("/admin/jobs", methods=["POST"])
+@login_required
+def ajout_tache():
+    nom = request.form.get("nom", None)
+    if nom not in TACHES_MANUELLES:
+        abort(400)
+    parametres = {}
+    if nom == "export":
+        parametres["entite"] = request.form.get("entite", None)
+        parametres["format_export"] = request.form.get("format_export", "csv")
+        if parametres["entite"] not in ENTITES or parametres["format_export"] not in FORMATS:
+            abort(400)
+    # une seule tâche de chaque sorte en attente : une demande répétée ne relance pas le même travail deux fois
+    cle = ":".join([nom] + [parametres[parametre] for parametre in sorted(parametres)])
+    id = differer(nom, cle=cle, id_user=current_user.id, **parametres)
+    db.session.commit()
+    if id is None:
+        flash("Cette tâche est déjà en attente", "warning")
+    else:
+        flash("Tâche {} enregistrée : elle sera exécutée par flask worker".format(id), "success")
+    return redirect(url_for("admin.taches"))
+
+
+# route pour relancer une tâche en échec
+@admin.route("/admin/jobs/<int:id>/relancer", methods=["POST"])
+@login_required
+def relancer_tache(id):
+    statut = relancer(id)
+    db.session.commit()
+    if statut:
+        flash("Tâche {} remise en attente".format(id), "success")
+    else:
+        flash("La tâche {} n'est pas en échec, ou une tâche identique est déjà en attente".format(id), "danger")
+    return redirect(url_for("admin.taches"))
+
+
+# route pour télécharger le fichier produit par une tâche terminée (export)
+@admin.route("/admin/jobs/<int:id>/resultat")
+@login_required
+def resultat_tache(id):
+    ligne = db.session.execute("SELECT resultat FROM tache WHERE id = :id AND etat = 'terminee'", {"id": id}).first()
+    resultat = json.loads(ligne[0]) if ligne is not None and ligne[0] else None
+    chemin = resultat.get("fichier") if isinstance(resultat, dict) else None
+    if chemin is None or not os.path.isfile(chemin):
+        abort(404)
+    return send_file(chemin, as_attachment=True, download_name=os.path.basename(chemin))
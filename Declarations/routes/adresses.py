@@ -0,0 +1,67 @@
+# Routes des adresses
+# Import des librairies
+from flask import Blueprint, render_template, request, flash, redirect
+from flask_login import login_required
+# tri alphabétique sans tenir compte de la casse avec lower()
+from sqlalchemy import func
+
+# Import du cache des pages
+from ..app import cache
+# Import des modèles de la base de données
+from ..modeles.donnees import Adresse
+from ..modeles.statistiques import compteur
+from ..revalidation import conditionnel
+from .communs import paginer_index
+
+
+adresses = Blueprint("adresses", __name__)
+
+
+# on crée une route pour faire un index des noms de rue enregistrés
+@adresses.route("/adresses")
+@conditionnel("adresse")
+@cache.page
+def adresses_liste():
+    # on affiche les rues dans l'ordre alphabétique sans tenir compte de la casse grâce à func.lower(), avec l'index
+    # d'expression ix_adresse_rue_lower
+    adresses = paginer_index(Adresse.query, func.lower(Adresse.rue), Adresse.id, total=compteur("adresse"))
+    return render_template("pages/adresses.html", nom="Adresses", adresses=adresses)
+
+
+@adresses.route("/ajout_adresse", methods=["GET", "POST"])
+@login_required
+def ajout_adresse():
+    # Ajout d'une adresse
+    if request.method == "POST":
+        statut, informations = Adresse.ajout_adresse(
+            ajout_adresse_rue=request.form.get("ajout_adresse_rue", None),
+            ajout_adresse_quartier=request.form.get("ajout_adresse_quartier", None),
+            ajout_adresse_latitude=request.form.get("ajout_adresse_latitude", None),
+            ajout_adresse_longitude=request.form.get("ajout_adresse_longitude", None))
+
+        if statut is True:
+            flash("Ajout d'une nouvelle adresse. Vous pouvez à présent la lier à une personne en vous rendant sur la "
+                  "page de la personne et en cliquant sur le bouton pour modifier les informations.", "success")
+            return redirect("/")
+        else:
+            flash("L'ajout a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/ajout/ajout_adresse.html", nom="Ajouter une adresse")
+    else:
+        return render_template("pages/ajout/ajout_adresse.html", nom="Ajouter une adresse")
+
+
+@adresses.route("/adresses/<int:id>/delete", methods=["POST", "GET"])
+@login_required
+def suppression_adresse(id):
+    delete_adresse = Adresse.query.get(id)
+    if request.method == "POST":
+        statut = Adresse.suppression_adresse(id=id)
+
+        if statut is True:
+            flash("Suppression réussie.", "success")
+            return redirect("/")
+        else:
+            flash("Échec de la suppression.", "danger")
+            return redirect("/")
+    else:
+        return render_template("pages/suppression/delete_adresse.html", nom="Supprimer une adresse",  adresse=delete_adresse)
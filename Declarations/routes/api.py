@@ -0,0 +1,359 @@
+# API JSON en lecture seule (version 1)
+# Chaque modèle de modeles/donnees.py est exposé sous /api/v1/<ressource> (liste) et /api/v1/<ressource>/<id>. Les
+# paramètres permettent aux clients (carte, tableaux de bord, notebooks) de récupérer exactement ce dont ils ont besoin
+# en un seul aller-retour :
+# - ?champs=nom,prenom : seules ces colonnes sont lues et renvoyées (l'id est toujours présent) ;
+# - ?inclure=adresses,proces_verbaux_victime : les relations sont chargées avec la ressource (jointure pour les
+#   relations vers un seul enregistrement, une requête IN (...) par relation vers plusieurs enregistrements) ;
+# - ?ids=1,2,3 : plusieurs enregistrements d'un coup, sans pagination ;
+# - ?from=1780-01-01&to=1785-12-31 : procès-verbaux d'une période (index de date_pv) ;
+# - ?apres=<curseur>, ?avant=<curseur> et ?par_page= : pagination par curseur, triée par id (voir
+#   modeles/pagination.py).
+# /api/v1/salles/<id>/proces_verbaux renvoie les procès-verbaux rédigés pendant l'occupation d'une salle, triés par
+# date, en une seule jointure indexée.
+# /api/v1/proximite et /api/v1/proximite/salles interrogent l'index spatial des adresses (voir modeles/geographie.py).
+# /api/v1/<ressource>/<id>/historique renvoie les modifications d'un enregistrement et /api/v1/modifications?depuis=
+# celles de toute la base après une date, pour la synchronisation incrémentale (table authorship).
+import datetime
+
+from flask import Blueprint, jsonify, request
+from sqlalchemy.orm import joinedload, selectinload, load_only
+
+from ..modeles.donnees import ProcesVerbal, Theatre, Source, Personne, SalleTheatre, Adresse, Objet, Authorship
+from ..modeles.pagination import paginer_curseur
+from ..modeles.statistiques import compteur
+from ..modeles.geographie import ROLES, RAYON_MAX
+from ..revalidation import conditionnel
+
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+# nombre d'éléments par page par défaut et maximal, et nombre maximal d'id pour ?ids=
+PAR_PAGE = 50
+PAR_PAGE_MAX = 200
+IDS_MAX = 200
+# rayon par défaut des recherches de proximité, en mètres
+RAYON = 500
+
+# tables lues par l'API, dont dépendent les ETag de ses réponses
+TABLES_API = ("proces_verbal", "personne", "adresse", "source", "objet", "theatre", "salle_theatre", "habite")
+
+# description des ressources : modèle, table (pour les compteurs), colonnes exposées et relations, sous la forme
+# nom dans l'API -> (attribut de la relation, ressource liée, relation vers plusieurs enregistrements)
+RESSOURCES = {
+    "proces_verbaux": {
+        "modele": ProcesVerbal, "table": "proces_verbal",
+        "champs": ("id", "date_pv", "id_theatre", "id_source", "id_commissaire", "id_victime", "id_objet"),
+        "relations": {"theatre": ("salles_theatre", "theatres", False), "source": ("sources", "sources", False),
+                      "commissaire": ("commissaires", "personnes", False),
+                      "victime": ("victimes", "personnes", False), "objet": ("objets", "objets", False),
+                      "salle": ("salle", "salles", False)},
+    },
+    "personnes": {
+        "modele": Personne, "table": "personne",
+        "champs": ("id", "nom", "prenom", "qualite"),
+        "relations": {"adresses": ("adresses", "adresses", True),
+                      "proces_verbaux_commissaire": ("proces_verbaux_commissaires", "proces_verbaux", True),
+                      "proces_verbaux_victime": ("proces_verbaux_victimes", "proces_verbaux", True)},
+    },
+    "adresses": {
+        "modele": Adresse, "table": "adresse",
+        "champs": ("id", "rue", "quartier", "latitude", "longitude"),
+        "relations": {"personnes": ("personnes", "personnes", True)},
+    },
+    "sources": {
+        "modele": Source, "table": "source",
+        "champs": ("id", "cote"),
+        "relations": {"proces_verbaux": ("proces_verbaux_sources", "proces_verbaux", True)},
+    },
+    "objets": {
+        "modele": Objet, "table": "objet",
+        "champs": ("id", "type"),
+        "relations": {"proces_verbaux": ("proces_verbaux_objets", "proces_verbaux", True)},
+    },
+    "theatres": {
+        "modele": Theatre, "table": "theatre",
+        "champs": ("id", "institution"),
+        "relations": {"salles": ("salles_theatre", "salles", True),
+                      "proces_verbaux": ("proces_verbaux", "proces_verbaux", True)},
+    },
+    "salles": {
+        "modele": SalleTheatre, "table": "salle_theatre",
+        "champs": ("id", "nom_salle", "dates_occupation_salle", "debut_occupation", "fin_occupation", "id_institution",
+                   "latitude", "longitude"),
+        "relations": {"theatre": ("theatres", "theatres", False),
+                      "proces_verbaux": ("proces_verbaux", "proces_verbaux", True)},
+    },
+}
+
+
+def erreur(message, code=400):
+    """
+    Fonction qui renvoie une erreur au format JSON
+    :param message: description de l'erreur
+    :param code: code HTTP
+    :returns: réponse Flask
+    """
+    reponse = jsonify({"erreur": message})
+    reponse.status_code = code
+    return reponse
+
+
+def liste_parametre(nom):
+    """
+    Fonction qui lit un paramètre de l'URL composé de valeurs séparées par des virgules
+    :param nom: nom du paramètre
+    :returns: liste de valeurs (vide si le paramètre est absent)
+    """
+    return [valeur.strip() for valeur in request.args.get(nom, "").split(",") if valeur.strip()]
+
+
+def options_requete(ressource):
+    """
+    Fonction qui lit ?champs= et ?inclure= et renvoie les options de chargement correspondantes
+    :param ressource: description de la ressource (valeur de RESSOURCES)
+    :returns: tuple (booléen, message d'erreur/tuple (champs, relations, options SQLAlchemy))
+    """
+    champs = liste_parametre("champs") or list(ressource["champs"])
+    inconnus = [champ for champ in champs if champ not in ressource["champs"]]
+    if inconnus:
+        return False, "Champs inconnus : {}. Champs disponibles : {}."\
+            .format(", ".join(inconnus), ", ".join(ressource["champs"]))
+    if "id" not in champs:
+        champs.insert(0, "id")
+
+    relations = liste_parametre("inclure")
+    inconnues = [relation for relation in relations if relation not in ressource["relations"]]
+    if inconnues:
+        return False, "Relations inconnues : {}. Relations disponibles : {}."\
+            .format(", ".join(inconnues), ", ".join(ressource["relations"]) or "aucune")
+
+    modele = ressource["modele"]
+    options = [load_only(*champs)]
+    for relation in relations:
+        attribut, liee, multiple = ressource["relations"][relation]
+        chargeur = selectinload if multiple else joinedload
+        options.append(chargeur(getattr(modele, attribut)).load_only(*RESSOURCES[liee]["champs"]))
+    return True, (champs, relations, options)
+
+
+def serialiser(objet, champs, relations=(), ressource=None):
+    """
+    Fonction qui transforme un enregistrement en dictionnaire
+    :param objet: enregistrement SQLAlchemy
+    :param champs: colonnes à renvoyer
+    :param relations: relations à inclure
+    :param ressource: description de la ressource (pour les relations)
+    :returns: dictionnaire
+    """
+    donnees = {}
+    for champ in champs:
+        valeur = getattr(objet, champ)
+        # jsonify écrit les dates au format HTTP ("Sun, 22 Feb 1784 ...") : on les renvoie au format AAAA-MM-JJ
+        donnees[champ] = valeur.isoformat() if isinstance(valeur, datetime.date) else valeur
+    for relation in relations:
+        attribut, liee, multiple = ressource["relations"][relation]
+        champs_lies = RESSOURCES[liee]["champs"]
+        valeur = getattr(objet, attribut)
+        if multiple:
+            donnees[relation] = [serialiser(element, champs_lies) for element in valeur]
+        else:
+            donnees[relation] = serialiser(valeur, champs_lies) if valeur is not None else None
+    return donnees
+
+
+@api.route("/")
+def index():
+    return jsonify({nom: {"champs": list(ressource["champs"]), "relations": list(ressource["relations"])}
+                    for nom, ressource in RESSOURCES.items()})
+
+
+@api.route("/<ressource>")
+@conditionnel(*TABLES_API)
+def liste(ressource):
+    if ressource not in RESSOURCES:
+        return erreur("Ressource inconnue : {}.".format(ressource), 404)
+    description = RESSOURCES[ressource]
+    modele = description["modele"]
+    valide, resultat = options_requete(description)
+    if not valide:
+        return erreur(resultat)
+    champs, relations, options = resultat
+    requete = modele.query.options(*options)
+    total = compteur(description["table"])
+    if modele is ProcesVerbal and ("from" in request.args or "to" in request.args):
+        debut = ProcesVerbal.convertir_date(request.args.get("from", None))
+        fin = ProcesVerbal.convertir_date(request.args.get("to", None))
+        if debut:
+            requete = requete.filter(ProcesVerbal.date_pv >= debut)
+        if fin:
+            requete = requete.filter(ProcesVerbal.date_pv <= fin)
+        total = requete.count()
+
+    # récupération groupée : ?ids=1,2,3
+    if "ids" in request.args:
+        ids = liste_parametre("ids")
+        if not all(identifiant.isdigit() for identifiant in ids) or len(ids) > IDS_MAX:
+            return erreur("Le paramètre ids doit contenir au plus {} id numériques séparés par des virgules."
+                          .format(IDS_MAX))
+        objets = requete.filter(modele.id.in_([int(identifiant) for identifiant in ids])).order_by(modele.id).all()
+        return jsonify({"donnees": [serialiser(objet, champs, relations, description) for objet in objets]})
+
+    par_page = request.args.get("par_page", PAR_PAGE, type=int)
+    par_page = min(max(par_page, 1), PAR_PAGE_MAX)
+    page = paginer_curseur(requete, modele.id, modele.id, apres=request.args.get("apres", None),
+                           avant=request.args.get("avant", None), par_page=par_page, total=total)
+    return jsonify({"donnees": [serialiser(objet, champs, relations, description) for objet in page.items],
+                    "total": page.total, "precedent": page.precedent, "suivant": page.suivant})
+
+
+@api.route("/<ressource>/<int:id>")
+@conditionnel(*TABLES_API)
+def detail(ressource, id):
+    if ressource not in RESSOURCES:
+        return erreur("Ressource inconnue : {}.".format(ressource), 404)
+    description = RESSOURCES[ressource]
+    valide, resultat = options_requete(description)
+    if not valide:
+        return erreur(resultat)
+    champs, relations, options = resultat
+    objet = description["modele"].query.options(*options).get(id)
+    if objet is None:
+        return erreur("Aucun enregistrement {} avec l'id {}.".format(ressource, id), 404)
+    return jsonify({"donnees": serialiser(objet, champs, relations, description)})
+
+
+@api.route("/salles/<int:id>/proces_verbaux")
+@conditionnel(*TABLES_API)
+def proces_verbaux_salle(id):
+    description = RESSOURCES["proces_verbaux"]
+    valide, resultat = options_requete(description)
+    if not valide:
+        return erreur(resultat)
+    champs, relations, options = resultat
+    par_page = request.args.get("par_page", PAR_PAGE, type=int)
+    par_page = min(max(par_page, 1), PAR_PAGE_MAX)
+    page = paginer_curseur(SalleTheatre.requete_proces_verbaux(id).options(*options), ProcesVerbal.date_pv,
+                           ProcesVerbal.id, apres=request.args.get("apres", None),
+                           avant=request.args.get("avant", None), par_page=par_page)
+    # une page vide peut venir d'une salle inexistante : on ne le vérifie que dans ce cas
+    if not page.items and SalleTheatre.query.get(id) is None:
+        return erreur("Aucun enregistrement salles avec l'id {}.".format(id), 404)
+    return jsonify({"donnees": [serialiser(objet, champs, relations, description) for objet in page.items],
+                    "precedent": page.precedent, "suivant": page.suivant})
+
+
+def lire_role():
+    """
+    Fonction qui lit le paramètre ?role= des recherches de proximité
+    :returns: tuple (booléen, message d'erreur/rôle ou None)
+    """
+    role = request.args.get("role", None) or None
+    if role is not None and role not in ROLES:
+        return False, "Rôle inconnu : {}. Rôles disponibles : {}.".format(role, ", ".join(ROLES))
+    return True, role
+
+
+@api.route("/proximite")
+@conditionnel(*TABLES_API)
+def proximite():
+    # centre de la recherche : ?lat=&lon= ou ?salle=<id>
+    if "salle" in request.args:
+        salle = SalleTheatre.query.get(request.args.get("salle", 0, type=int))
+        if salle is None or salle.latitude is None or salle.longitude is None:
+            return erreur("Aucune salle localisée avec l'id {}.".format(request.args.get("salle")), 404)
+        latitude, longitude = salle.latitude, salle.longitude
+    else:
+        latitude = request.args.get("lat", None, type=float)
+        longitude = request.args.get("lon", None, type=float)
+        if latitude is None or longitude is None:
+            return erreur("Indiquez le centre de la recherche avec ?lat=&lon= ou ?salle=<id>.")
+    rayon = request.args.get("rayon", RAYON, type=float)
+    if not 0 < rayon <= RAYON_MAX:
+        return erreur("Le rayon doit être compris entre 0 et {} mètres.".format(RAYON_MAX))
+    valide, role = lire_role()
+    if not valide:
+        return erreur(role)
+    description = RESSOURCES["adresses"]
+    valide, resultat = options_requete(description)
+    if not valide:
+        return erreur(resultat)
+    champs, relations, options = resultat
+    adresses = Adresse.proches(latitude, longitude, rayon, role=role, options=options)
+    return jsonify({"donnees": [dict(serialiser(adresse, champs, relations, description), distance=round(ecart, 1))
+                                for adresse, ecart in adresses]})
+
+
+@api.route("/proximite/salles")
+@conditionnel(*TABLES_API)
+def proximite_salles():
+    # adresse la plus proche de chaque salle localisée (ex : ?role=commissaire pour l'hôtel du commissaire le plus
+    # proche de chaque théâtre)
+    valide, role = lire_role()
+    if not valide:
+        return erreur(role)
+    description = RESSOURCES["adresses"]
+    valide, resultat = options_requete(description)
+    if not valide:
+        return erreur(resultat)
+    champs, relations, options = resultat
+    donnees = []
+    for salle in SalleTheatre.query.filter(SalleTheatre.latitude.isnot(None), SalleTheatre.longitude.isnot(None))\
+            .order_by(SalleTheatre.id):
+        resultat = salle.adresse_plus_proche(role=role)
+        adresse = None
+        if resultat is not None:
+            adresse = dict(serialiser(resultat[0], champs, relations, description), distance=round(resultat[1], 1))
+        donnees.append({"salle": serialiser(salle, ("id", "nom_salle", "latitude", "longitude")),
+                        "adresse": adresse})
+    return jsonify({"donnees": donnees})
+
+
+def serialiser_modification(modification):
+    """
+    Fonction qui transforme une ligne d'audit en dictionnaire
+    :param modification: enregistrement Authorship
+    :returns: dictionnaire (id, date et enregistrements concernés ; l'API étant publique, l'auteur n'est affiché que
+              par la page /historique, réservée aux utilisateurs connectés)
+    """
+    return {"id": modification.id, "date": modification.date.isoformat(), "entites": modification.entites()}
+
+
+def page_modifications(requete):
+    """
+    Fonction qui pagine des lignes d'audit par curseur, dans l'ordre chronologique (index sur la date)
+    :param requete: requête Authorship
+    :returns: réponse Flask
+    """
+    par_page = request.args.get("par_page", PAR_PAGE, type=int)
+    par_page = min(max(par_page, 1), PAR_PAGE_MAX)
+    page = paginer_curseur(requete, Authorship.date, Authorship.id, apres=request.args.get("apres", None),
+                           avant=request.args.get("avant", None), par_page=par_page)
+    return jsonify({"donnees": [serialiser_modification(modification) for modification in page.items],
+                    "precedent": page.precedent, "suivant": page.suivant})
+
+
+# les routes de l'historique ne passent pas par conditionnel() : la table authorship n'a pas de version
+@api.route("/<ressource>/<int:id>/historique")
+def historique(ressource, id):
+    table = RESSOURCES[ressource]["table"] if ressource in RESSOURCES else None
+    if table not in Authorship.COLONNES_ENTITES:
+        return erreur("Pas d'historique pour la ressource : {}.".format(ressource), 404)
+    return page_modifications(Authorship.historique(table, id))
+
+
+@api.route("/modifications")
+def modifications():
+    # ?depuis=2022-03-01T12:00:00 (UTC) : modifications enregistrées après cette date ; ?table=personne pour ne
+    # garder que celles d'une table
+    depuis = request.args.get("depuis", None)
+    if depuis:
+        try:
+            depuis = datetime.datetime.fromisoformat(depuis)
+        except ValueError:
+            return erreur("Le paramètre depuis doit être une date ISO 8601 (ex : 2022-03-01T12:00:00).")
+    table = request.args.get("table", None) or None
+    if table is not None and table not in Authorship.COLONNES_ENTITES:
+        return erreur("Table inconnue : {}. Tables disponibles : {}."
+                      .format(table, ", ".join(Authorship.COLONNES_ENTITES)))
+    return page_modifications(Authorship.modifications_depuis(depuis or None, table=table))
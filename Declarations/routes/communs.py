@@ -0,0 +1,63 @@
+# Fonctions communes aux routes des pages
+# Les pages consultables sans compte sont mises en cache pour les visiteurs anonymes avec @cache.page (voir cache.py)
+# et répondent aux requêtes conditionnelles avec @conditionnel, qui reçoit les tables affichées par la page (voir
+# revalidation.py). Les formulaires d'ajout, de modification et de suppression sont réservés aux comptes enregistrés
+# (@login_required) : quand le formulaire est envoyé, flash informe du succès et redirige vers l'accueil, ou informe
+# des erreurs.
+from flask import request, current_app
+
+from ..modeles.donnees import ProcesVerbal
+from ..modeles.pagination import paginer_curseur
+
+# Import de la constante pour la pagination
+
+
+def paginer_index(requete, cle, colonne_id, total=None):
+    """
+    Fonction qui pagine un index trié par (clé, id). Par défaut, la pagination se fait par curseur (paramètres
+    ?apres= et ?avant=, voir modeles/pagination.py) ; le paramètre ?page= des anciens liens reste accepté et renvoie
+    la page correspondante avec .paginate()
+    :param requete: requête SQLAlchemy à paginer
+    :param cle: expression de tri
+    :param colonne_id: colonne id du modèle
+    :param total: nombre total d'éléments, s'il est connu sans requête (table des compteurs)
+    :returns: PaginationCurseur ou Pagination
+    """
+    par_page = current_app.config["RESULTATS_PAR_PAGE"]
+    page = request.args.get("page", None)
+    if page is not None:
+        page = int(page) if page.isdigit() else 1
+        return requete.order_by(cle.asc(), colonne_id.asc()).paginate(page=page, per_page=par_page)
+    return paginer_curseur(requete, cle, colonne_id, apres=request.args.get("apres", None),
+                           avant=request.args.get("avant", None), par_page=par_page, total=total)
+
+
+def lire_periode():
+    """
+    Fonction qui lit la période demandée dans l'URL (?from=1780-01-01&to=1785-12-31), pour filtrer les
+    procès-verbaux par un parcours de l'index de leur date
+    :returns: tuple (date de début ou None, date de fin ou None, paramètres à conserver dans les liens de pagination)
+    """
+    debut = ProcesVerbal.convertir_date(request.args.get("from", None))
+    fin = ProcesVerbal.convertir_date(request.args.get("to", None))
+    parametres = {}
+    if debut:
+        parametres["from"] = debut.isoformat()
+    if fin:
+        parametres["to"] = fin.isoformat()
+    return debut, fin, parametres
+
+
+def filtrer_periode(requete, debut, fin):
+    """
+    Fonction qui restreint une requête sur les procès-verbaux à une période
+    :param requete: requête SQLAlchemy sur ProcesVerbal
+    :param debut: date minimale (incluse) ou None
+    :param fin: date maximale (incluse) ou None
+    :returns: requête filtrée
+    """
+    if debut:
+        requete = requete.filter(ProcesVerbal.date_pv >= debut)
+    if fin:
+        requete = requete.filter(ProcesVerbal.date_pv <= fin)
+    return requete
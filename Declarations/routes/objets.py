@@ -0,0 +1,136 @@
+# Routes des types d'objets volés
+# Import des librairies
+from flask import Blueprint, render_template, request, flash, redirect, current_app
+from flask_login import login_required
+from sqlalchemy import func
+from flask_sqlalchemy import Pagination
+
+# Import de la base de données et du cache des pages
+from ..app import db, cache
+# Import des modèles de la base de données
+from ..modeles.donnees import ProcesVerbal, Objet
+from ..modeles.chargements import chargement
+from ..modeles.statistiques import compteur
+from ..revalidation import conditionnel
+from .communs import lire_periode, filtrer_periode
+
+# Import de la constante pour la pagination
+
+
+objets = Blueprint("objets", __name__)
+
+
+# on crée un index des types d'objets volés
+@objets.route("/objets_voles")
+@conditionnel("objet", "proces_verbal")
+@cache.page
+def objets_voles_liste():
+    page = request.args.get("page", 1)
+    if isinstance(page, str) and page.isdigit():
+        page = int(page)
+    else:
+        page = 1
+    par_page = current_app.config["RESULTATS_PAR_PAGE"]
+    # le nombre total d'objets est lu dans la table des compteurs, on ne demande à la base que les objets de la page
+    objets = Pagination(None, page, par_page, compteur("objet"),
+                        Objet.query.order_by(Objet.id).limit(par_page).offset((page - 1) * par_page).all())
+    ids_objets = [objet.id for objet in objets.items]
+
+    # on compte les procès-verbaux de chaque objet de la page en une seule requête groupée
+    nombres = dict(db.session.query(ProcesVerbal.id_objet, func.count(ProcesVerbal.id))
+                   .filter(ProcesVerbal.id_objet.in_(ids_objets))
+                   .group_by(ProcesVerbal.id_objet).all())
+
+    # on ne récupère que les premiers procès-verbaux (ordre chronologique) de chaque objet : la fonction de fenêtre
+    # row_number() numérote les procès-verbaux de chaque objet en suivant l'index (id_objet, date_pv)
+    rang = func.row_number().over(partition_by=ProcesVerbal.id_objet, order_by=ProcesVerbal.date_pv).label("rang")
+    premiers = db.session.query(ProcesVerbal.id, ProcesVerbal.id_objet, ProcesVerbal.date_pv, rang)\
+        .filter(ProcesVerbal.id_objet.in_(ids_objets)).subquery()
+    proces_verbaux = {}
+    for ligne in db.session.query(premiers).filter(premiers.c.rang <= par_page)\
+            .order_by(premiers.c.id_objet, premiers.c.rang):
+        proces_verbaux.setdefault(ligne.id_objet, []).append(ligne)
+
+    return render_template("pages/objets_voles.html", nom="Objets volés", objets=objets,
+                           proces_verbaux=proces_verbaux, nombres=nombres)
+
+
+# on crée une route vers les pages individuelles des objets
+@objets.route("/objets_voles/<int:id>")
+@conditionnel("objet", "proces_verbal")
+@cache.page
+def objet_vole_type(id):
+    """
+    Fonction qui permet de générer la page html pour chaque id enregistré
+    :param id: id de l'objet
+    :return: render_template
+    """
+    page = request.args.get("page", 1)
+    if isinstance(page, str) and page.isdigit():
+        page = int(page)
+    else:
+        page = 1
+    objet = Objet.query.get_or_404(id)
+    debut, fin, periode = lire_periode()
+    proces_verbaux = filtrer_periode(ProcesVerbal.query.options(*chargement("liste_proces_verbaux"))
+                                     .filter(ProcesVerbal.id_objet == id), debut, fin)\
+        .order_by(ProcesVerbal.date_pv.asc()).paginate(page=page, per_page=current_app.config["RESULTATS_PAR_PAGE"])
+    return render_template("pages/objet_vole_type.html", nom="Objet volé", objet=objet,
+                            proces_verbaux=proces_verbaux, periode=periode)
+
+
+@objets.route("/ajout_objet", methods=["GET", "POST"])
+@login_required
+def ajout_objet():
+    # Ajout d'un objet
+    if request.method == "POST":
+        statut, informations = Objet.ajout_objet(
+            ajout_objet_type=request.form.get("ajout_objet_type", None)
+        )
+
+        if statut is True:
+            flash("Ajout d'un nouvel objet", "success")
+            return redirect("/")
+        else:
+            flash("L'ajout a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/ajout/ajout_objet.html", nom="Ajouter un objet")
+    else:
+        return render_template("pages/ajout/ajout_objet.html", nom="Ajouter un objet")
+
+
+@objets.route("/objets_voles/<int:id>/update", methods=["GET", "POST"])
+@login_required
+def modification_objet(id):
+    update_objet = Objet.query.get_or_404(id)
+    if request.method == "GET":
+        return render_template("pages/modification/update_objet.html", nom="Modifier un objet", objet=update_objet)
+
+    else:
+        statut, informations = Objet.modification_objet(
+            id=id,
+            objet_type=request.form.get("type", None)
+        )
+
+        if statut is True:
+            flash("Modification du type de l'objet enregistré", "success")
+            return redirect("/")
+        else:
+            flash("La modification a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/modification/update_objet.html", nom="Modifier un objet", objet=update_objet)
+
+
+@objets.route("/objets_voles/<int:id>/delete", methods=["POST", "GET"])
+@login_required
+def suppression_objet(id):
+    delete_objet = Objet.query.get_or_404(id)
+    if request.method == "POST":
+        statut = Objet.suppression_objet(id=id)
+
+        if statut is True:
+            flash("Suppression réussie.", "success")
+            return redirect("/")
+        else:
+            flash("Échec de la suppression.", "danger")
+            return redirect("/objets_voles/<int:id>")
+    else:
+        return render_template("pages/suppression/delete_objet.html", nom="Supprimer un objet",  objet=delete_objet)
@@ -0,0 +1,203 @@
+# Routes des personnes (victimes et commissaires) et de leurs domiciles
+# Import des librairies
+from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask_login import login_required, current_user
+# l'import de func permet d'utiliser la fonction lower() dans les requêtes cette dernière est utile pour faire
+# apparaître des index dans l'ordre alphabétique sans tenir compte des majuscules et minuscules alors que python est
+# sensible à la casse
+from sqlalchemy import func
+
+# Import du cache des pages
+from ..app import cache
+# Import des modèles de la base de données
+from ..modeles.donnees import Personne, Adresse
+from ..modeles.chargements import chargement
+from ..modeles.rapprochement import candidats, grappes
+from ..modeles.references import references
+from ..modeles.statistiques import compteur
+from ..revalidation import conditionnel
+from .communs import paginer_index
+
+
+personnes = Blueprint("personnes", __name__)
+
+
+# on crée un index des personnes, par ordre alphabétique de nom
+@personnes.route("/personnes")
+@conditionnel("personne")
+@cache.page
+def personnes_liste():
+    # le tri sur lower(nom) utilise l'index d'expression ix_personne_nom_lower
+    personnes = paginer_index(Personne.query, func.lower(Personne.nom), Personne.id, total=compteur("personne"))
+    return render_template("pages/personnes.html", nom="Personnes", personnes=personnes)
+
+
+# on crée une route vers les pages individuelles des personnes
+@personnes.route("/personnes/<int:id>")
+@conditionnel("personne", "adresse", "habite", "proces_verbal")
+@cache.page
+def personne(id):
+    """
+    Fonction qui permet de générer la page html pour chaque id enregistré
+    :param id: id de l'individu
+    :return: render_template
+    """
+    personne = Personne.query.options(*chargement("personne")).get_or_404(id)
+    adresses = personne.adresses
+    proces_verbaux = (personne.proces_verbaux_commissaires or personne.proces_verbaux_victimes)
+    return render_template("pages/personne.html", nom="Personne", personne=personne,
+                            adresses=adresses, proces_verbaux=proces_verbaux)
+
+
+# on crée un index des commissaires de police, par ordre alphabétique
+@personnes.route("/commissaires")
+@conditionnel("personne")
+@cache.page
+def commissaires_liste():
+    # le filtre et le tri utilisent l'index ix_personne_qualite_nom
+    requete = Personne.query.filter(Personne.qualite == 'commissaire de police')
+    commissaires = paginer_index(requete, Personne.nom, Personne.id, total=requete.count())
+    return render_template("pages/commissaires.html", nom="Commissaires", commissaires=commissaires)
+
+
+@personnes.route("/ajout_personne", methods=["GET", "POST"])
+@login_required
+def ajout_personne():
+    # Ajout d'une personne
+    if request.method == "POST":
+        statut, informations = Personne.ajout_personne(
+            ajout_personne_nom=request.form.get("ajout_personne_nom", None),
+            ajout_personne_prenom=request.form.get("ajout_personne_prenom", None),
+            ajout_personne_qualite=request.form.get("ajout_personne_qualite", None),
+            confirmer=bool(request.form.get("ajout_personne_confirmer"))
+        )
+
+        if statut is True:
+            flash("Ajout d'une nouvelle personne", "success")
+            return redirect("/")
+        else:
+            flash("L'ajout a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            # on affiche les personnes semblables sous le formulaire, qui propose alors de confirmer l'ajout
+            semblables = candidats(request.form.get("ajout_personne_nom", ""),
+                                   request.form.get("ajout_personne_prenom", ""))
+            return render_template("pages/ajout/ajout_personne.html", nom="Ajouter une personne",
+                                   semblables=semblables)
+    else:
+        return render_template("pages/ajout/ajout_personne.html", nom="Ajouter une personne")
+
+
+# route pour créer un lien entre un individu de Personne et une adresse de Adresse
+@personnes.route("/personnes/<int:id>/adresse", methods=["GET", "POST"])
+@login_required
+def lien_adresse_personne(id):
+    personne = Personne.query.get(id)
+    adresses = references("adresses")
+    if request.method == "GET":
+        return render_template("pages/ajout/ajout_domicile.html", nom="Ajouter un domicile", personne=personne,
+                               adresses=adresses)
+
+    if request.method == "POST":
+        statut, informations = Personne.lier_personne_adresse(id=id,
+                                                              adresse_id=request.form.get("adresse_id", None))
+
+        if statut is True:
+            flash("Ajout d'un domicile pour l'individu enregistré", "success")
+            return redirect("/")
+        else:
+            flash("La modification a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/ajout/ajout_domicile.html", nom="Ajouter un domicile", personne=personne,
+                                   adresses=adresses)
+
+    else:
+        return render_template("pages/ajout/ajout_domicile.html", nom="Ajouter un domicile",  personne=personne,
+                               adresses=adresses)
+
+
+@personnes.route("/personnes/<int:id>/update", methods=["GET", "POST"])
+@login_required
+def modification_personne(id):
+    update_personne = Personne.query.get(id)
+    if request.method == "GET":
+        return render_template("pages/modification/update_personne.html", nom="Modifier une personne", personne=update_personne)
+
+    else:
+        statut, informations = Personne.modification_personne(
+            id=id,
+            update_nom=request.form.get("update_nom", None),
+            update_prenom=request.form.get("update_prenom", None),
+            update_qualite=request.form.get("update_qualite", None)
+        )
+
+        if statut is True:
+            flash("Modification des informations sur la personne enregistrée", "success")
+            return redirect("/")
+        else:
+            flash("La modification a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/modification/update_personne.html", nom="Modifier une personne", personne=update_personne)
+
+
+@personnes.route("/personnes/<int:id>/delete", methods=["POST", "GET"])
+@login_required
+def suppression_personne(id):
+    delete_personne = Personne.query.get(id)
+    if request.method == "POST":
+        statut = Personne.suppression_personne(id=id)
+
+        if statut is True:
+            flash("Suppression réussie.", "success")
+            return redirect("/")
+        else:
+            flash("Échec de la suppression.", "danger")
+            return redirect("/personnes/<int:id>")
+    else:
+        return render_template("pages/suppression/delete_personne.html", nom="Supprimer une personne",  personne=delete_personne)
+
+
+# route pour supprimer un lien entre un individu de Personne et une adresse de Adresse
+@personnes.route("/personnes/<int:id>/adresse/delete/<int:adresse_id>", methods=["GET", "POST"])
+@login_required
+def suppression_adresse_personne(id, adresse_id):
+    personne = Personne.query.get(id) # on récupère l'id de la personne pour laquelle on supprime l'adresse
+    adresse = Adresse.query.get(adresse_id) # on récupère l'id de l'adresse qu'on délie de la personne
+
+    if request.method == "GET":
+        return render_template("pages/suppression/delete_domicile.html", nom="Supprimer un domicile", personne=personne,
+                               adresse=adresse)
+
+    if request.method == "POST":
+        statut, informations = Personne.delier_personne_adresse(id=id, adresse_id=adresse_id)
+
+        if statut is True:
+            flash("Suppression d'un domicile pour l'individu enregistrée", "success")
+            return redirect("/")
+        else:
+            flash("La modification a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/suppression/delete_domicile.html", nom="Supprimer un domicile", personne=personne,
+                                   adresse=adresse)
+
+    else:
+        return render_template("pages/suppression/delete_domicile.html", nom="Ajouter un domicile",  personne=personne,
+                               adresse=adresse)
+
+
+# liste des doublons probables (personnes de même clé phonétique aux noms et prénoms semblables), à fusionner
+@personnes.route("/personnes/doublons")
+@login_required
+def doublons():
+    return render_template("pages/doublons.html", nom="Doublons des personnes", grappes=grappes())
+
+
+# route pour fusionner des doublons dans une personne conservée
+@personnes.route("/personnes/fusion", methods=["POST"])
+@login_required
+def fusion_personnes():
+    id = request.form.get("id", type=int)
+    # chaque personne de la grappe est cochée par défaut : la personne conservée est retirée des doublons
+    ids_doublons = [id_doublon for id_doublon in request.form.getlist("doublons") if id_doublon != str(id)]
+    statut, informations = Personne.fusion_personnes(id=id, ids_doublons=ids_doublons, id_user=current_user.id)
+    if statut is True:
+        flash("Fusion des personnes enregistrée", "success")
+        return redirect(url_for("personnes.personne", id=informations.id))
+    else:
+        flash("La fusion a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+        return redirect(url_for("personnes.doublons"))
@@ -0,0 +1,142 @@
+# Routes des procès-verbaux : index chronologique, pages individuelles, ajout, modification et suppression
+# Import des librairies
+from flask import Blueprint, render_template, request, flash, redirect
+from flask_login import login_required
+
+# Import du cache des pages
+from ..app import cache
+# Import des modèles de la base de données
+from ..modeles.donnees import ProcesVerbal
+from ..modeles.references import plusieurs_references
+from ..modeles.chargements import chargement
+from ..modeles.statistiques import compteur
+from ..revalidation import conditionnel
+from .communs import paginer_index, lire_periode, filtrer_periode
+
+
+proces_verbaux = Blueprint("proces_verbaux", __name__)
+
+
+# Route qui liste les procès-verbaux dans l'ordre chronologique avec 10 résultats par page
+@proces_verbaux.route("/proces_verbaux")
+@conditionnel("proces_verbal")
+@cache.page
+def proces_verbaux_liste():
+    # ?from= et ?to= restreignent la liste à une période : la base ne lit que cet intervalle de l'index de date_pv
+    debut, fin, periode = lire_periode()
+    requete = ProcesVerbal.query.options(*chargement("liste_proces_verbaux")).filter(ProcesVerbal.date_pv.isnot(None))
+    if periode:
+        requete = filtrer_periode(requete, debut, fin)
+        total = requete.count()
+    else:
+        total = compteur("proces_verbal")
+    proces_verbaux = paginer_index(requete, ProcesVerbal.date_pv, ProcesVerbal.id, total=total)
+    return render_template("pages/proces_verbaux.html", nom="Procès-verbaux", proces_verbaux=proces_verbaux,
+                           periode=periode)
+
+
+# on crée une route vers les pages individuelles des procès-verbaux
+@proces_verbaux.route("/proces_verbaux/<int:id>")
+@conditionnel("proces_verbal", "source", "personne", "theatre", "salle_theatre", "objet")
+@cache.page
+def proces_verbal(id):
+    """
+    Fonction qui permet de générer la page html pour chaque id enregistré
+    :param id: id du procès-verbal
+    :return: render_template
+    """
+    # les entités liées sont chargées avec le procès-verbal (voir modeles/chargements.py)
+    proces_verbal = ProcesVerbal.query.options(*chargement("proces_verbal")).get_or_404(id)
+    source = proces_verbal.sources
+    victime = proces_verbal.victimes
+    commissaire = proces_verbal.commissaires
+    institution_theatre = proces_verbal.salles_theatre
+    salle = proces_verbal.salle
+    objet = proces_verbal.objets
+
+    return render_template("pages/proces_verbal.html", nom="Procès-verbal", proces_verbal=proces_verbal,
+                           source=source, victime=victime,
+                           commissaire=commissaire, institution=institution_theatre,
+                           salle=salle, objet=objet)
+
+
+@proces_verbaux.route("/ajout_proces_verbal", methods=["GET", "POST"])
+@login_required
+def ajout_proces_verbal():
+    # Ajout d'un procès-verbal
+    # listes des menus déroulants : tuples (id, libellé) gardés en mémoire (voir modeles/references.py)
+    sources, theatres, commissaires, victimes, objets = plusieurs_references("sources", "theatres", "commissaires",
+                                                                             "victimes", "objets")
+
+    if request.method == "POST":
+        statut, informations = ProcesVerbal.ajout_proces_verbal(
+            ajout_proces_verbal_date=request.form.get("ajout_proces_verbal_date", None),
+            ajout_pv_id_source=request.form.get("ajout_pv_id_source", None),
+            ajout_pv_id_theatre=request.form.get("ajout_pv_id_theatre", None),
+            ajout_pv_id_commissaire=request.form.get("ajout_pv_id_commissaire", None),
+            ajout_pv_id_victime=request.form.get("ajout_pv_id_victime", None),
+            ajout_pv_id_objet=request.form.get("ajout_pv_id_objet", None),
+
+        )
+
+        if statut is True:
+            flash("Ajout d'un nouveau procès-verbal", "success")
+            return redirect("/")
+        else:
+            flash("L'ajout a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/ajout/ajout_proces_verbal.html", nom="Ajouter un procès-verbal", sources=sources,
+                                   theatres=theatres, commissaires=commissaires, victimes=victimes, objets=objets)
+    else:
+        return render_template("pages/ajout/ajout_proces_verbal.html", nom="Ajouter un procès-verbal", sources=sources,
+                               theatres=theatres, commissaires=commissaires, victimes=victimes, objets=objets)
+
+
+@proces_verbaux.route("/proces_verbaux/<int:id>/update", methods=["GET", "POST"])
+@login_required
+def modification_proces_verbal(id):
+    update_proces_verbal = ProcesVerbal.query.get_or_404(id)
+    # listes des menus déroulants : tuples (id, libellé) gardés en mémoire (voir modeles/references.py)
+    sources, theatres, commissaires, victimes, objets = plusieurs_references("sources", "theatres", "commissaires",
+                                                                             "victimes", "objets")
+
+    if request.method == "GET":
+        return render_template("pages/modification/update_proces_verbal.html", nom="Modifier un procès-verbal",
+                               proces_verbal=update_proces_verbal, sources=sources, theatres=theatres,
+                               commissaires=commissaires, victimes=victimes, objets=objets)
+    else:
+        statut, informations = ProcesVerbal.modification_proces_verbal(
+            id=id,
+            update_date=request.form.get("date_pv", None),
+            update_id_source=request.form.get("id_source", None),
+            update_id_theatre=request.form.get("id_theatre", None),
+            update_id_commissaire=request.form.get("id_commissaire", None),
+            update_id_victime=request.form.get("id_victime", None),
+            update_id_objet=request.form.get("id_objet", None)
+            )
+
+        if statut is True:
+            flash("Modification du procès-verbal enregistré", "success")
+            return redirect("/")
+        else:
+            flash("La modification a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/modification/update_proces_verbal.html", nom="Modifier un procès-verbal",
+                                   proces_verbal=update_proces_verbal,sources=sources, theatres=theatres,
+                                   commissaires=commissaires, victimes=victimes, objets=objets)
+
+
+@proces_verbaux.route("/proces_verbaux/<int:id>/delete", methods=["POST", "GET"])
+@login_required
+def suppression_proces_verbal(id):
+    delete_proces_verbal = ProcesVerbal.query.get(id)
+    if request.method == "POST":
+        statut = ProcesVerbal.suppression_proces_verbal(id=id)
+
+        if statut is True:
+            flash("Suppression réussie.", "success")
+            return redirect("/")
+        else:
+            flash("Échec de la suppression.", "danger")
+            return redirect("/proces_verbaux/<int:id>")
+    else:
+        return render_template("pages/suppression/delete_proces_verbal.html", nom="Supprimer un procès-verbal",
+                               proces_verbal=delete_proces_verbal)
@@ -0,0 +1,90 @@
+# Routes des sources (cotes d'archives)
+# Import des librairies
+from flask import Blueprint, render_template, request, flash, redirect, current_app
+from flask_login import login_required
+
+# Import du cache des pages
+from ..app import cache
+# Import des modèles de la base de données
+from ..modeles.donnees import ProcesVerbal, Source
+from ..modeles.chargements import chargement
+from ..modeles.statistiques import compteur
+from ..revalidation import conditionnel
+from .communs import paginer_index, lire_periode, filtrer_periode
+
+# Import de la constante pour la pagination
+
+
+sources = Blueprint("sources", __name__)
+
+
+# on crée une route pour faire un index des cotes
+@sources.route("/sources")
+@conditionnel("source")
+@cache.page
+def sources_liste():
+    sources = paginer_index(Source.query, Source.cote, Source.id, total=compteur("source"))
+    return render_template("pages/sources.html", nom="Sources", sources=sources)
+
+
+# on crée une route vers la page individuelle d'une source
+@sources.route("/sources/<int:id>")
+@conditionnel("source", "proces_verbal")
+@cache.page
+def source(id):
+    """
+    Fonction qui permet de générer la page html pour chaque id enregistré
+    :param id: id de la cote
+    :return: render_template
+    """
+    page = request.args.get("page", 1)
+    if isinstance(page, str) and page.isdigit():
+        page = int(page)
+    else:
+        page = 1
+    source = Source.query.get_or_404(id)
+    debut, fin, periode = lire_periode()
+    proces_verbaux = filtrer_periode(ProcesVerbal.query.options(*chargement("liste_proces_verbaux"))
+                                     .filter(ProcesVerbal.id_source == id), debut, fin)\
+        .order_by(ProcesVerbal.date_pv.asc()).paginate(page=page, per_page=current_app.config["RESULTATS_PAR_PAGE"])
+    return render_template("pages/source.html", nom="Source", source=source, proces_verbaux=proces_verbaux,
+                           periode=periode)
+
+
+@sources.route("/ajout_source", methods=["GET", "POST"])
+@login_required
+def ajout_source():
+    # Ajout d'une référence archivistique
+    # on récupère les données à enregistrer dans la base
+    if request.method == "POST":
+        statut, informations = Source.ajout_source(
+            ajout_source_cote=request.form.get("ajout_source_cote", None)
+        )
+
+        # on informe du succès et on redirige vers la page d'accueil
+        if statut is True:
+            flash("Ajout d'une nouvelle source", "success")
+            return redirect("/")
+        # sinon, on informe des erreurs et on reste sur la page
+        else:
+            flash("L'ajout a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/ajout/ajout_source.html", nom="Ajouter une source")
+    else:
+        return render_template("pages/ajout/ajout_source.html", nom="Ajouter une source")
+
+
+@sources.route("/sources/<int:id>/delete", methods=["POST", "GET"])
+@login_required
+def suppression_source(id):
+    delete_source = Source.query.get(id)
+    if request.method == "POST":
+        statut = Source.suppression_source(id=id)
+
+        if statut is True:
+            flash("Suppression réussie.", "success")
+            return redirect("/")
+        else:
+            flash("Échec de la suppression.", "danger")
+            return redirect("/sources/<int:id>")
+    else:
+        return render_template("pages/suppression/delete_source.html", nom="Supprimer une source",  source=delete_source)
@@ -0,0 +1,93 @@
+# Routes des institutions théâtrales et de leurs salles
+# Import des librairies
+from flask import Blueprint, render_template, request, flash, redirect, current_app
+from flask_login import login_required
+
+# Import du cache des pages
+from ..app import cache
+# Import des modèles de la base de données
+from ..modeles.donnees import Theatre, SalleTheatre
+from ..modeles.chargements import chargement
+from ..modeles.references import references
+from ..revalidation import conditionnel
+
+# Import de la constante pour la pagination
+
+
+theatres = Blueprint("theatres", __name__)
+
+
+# on crée un index des institutions théâtrales
+@theatres.route("/theatres")
+@conditionnel("theatre")
+@cache.page
+def theatre_liste():
+    theatres = Theatre.query.all()
+    return render_template("pages/theatres.html", nom="Théâtres", theatres=theatres)
+
+
+# on crée une route vers les pages individuelles des institutions théâtrales
+@theatres.route("/theatres/<int:id>")
+@conditionnel("theatre", "salle_theatre", "proces_verbal")
+@cache.page
+def theatre(id):
+    """
+    Fonction qui permet de générer la page html pour chaque id enregistré
+    :param id: id de l'institution théâtrale
+    :return: render_template
+    """
+    theatre = Theatre.query.options(*chargement("theatre")).get_or_404(id)
+    salles = theatre.salles_theatre
+    proces_verbaux = theatre.proces_verbaux
+    return render_template("pages/theatre.html", nom="Théâtre", theatre=theatre, salles=salles,
+                           proces_verbaux=proces_verbaux)
+
+
+# on crée une route vers les pages individuelles des salles de théâtre
+@theatres.route("/salles/<int:id>")
+@conditionnel("salle_theatre", "theatre", "proces_verbal")
+@cache.page
+def salle_theatre(id):
+    """
+    Fonction qui permet de générer la page html pour chaque id enregistré
+    :param id: id de la salle de théâtre
+    :return: render_template
+    """
+    page = request.args.get("page", 1)
+    if isinstance(page, str) and page.isdigit():
+        page = int(page)
+    else:
+        page = 1
+    salle = SalleTheatre.query.get_or_404(id)
+    institution = salle.theatres
+    # seuls les procès-verbaux de l'institution pendant l'occupation de la salle sont demandés à la base
+    proces_verbaux = SalleTheatre.requete_proces_verbaux(id).options(*chargement("liste_proces_verbaux"))\
+        .paginate(page=page, per_page=current_app.config["RESULTATS_PAR_PAGE"])
+    return render_template("pages/salle.html", nom="Salle de théâtre", salle=salle, proces_verbaux=proces_verbaux,
+                           institution=institution)
+
+
+@theatres.route("/theatres/<int:id>/update", methods=["GET", "POST"])
+@login_required
+def modification_salle(id):
+    update_salle = SalleTheatre.query.get(id)
+    institutions_theatrales = references("theatres")
+    if request.method == "GET":
+        return render_template("pages/modification/update_salle.html", nom="Modifier une salle", salle=update_salle,
+                               theatres=institutions_theatrales)
+
+    else:
+        statut, informations = SalleTheatre.modification_salle(
+            id=id,
+            update_nom=request.form.get("update_nom", None),
+            update_dates=request.form.get("update_dates", None),
+            id_institution=request.form.get("id_institution", None)
+        )
+
+        if statut is True:
+            flash("Modification de la salle de théâtre enregistrée", "success")
+            return redirect("/")
+        else:
+            flash("La modification a échoué pour les raisons suivantes : " + ", ".join(informations), "danger")
+            return render_template("pages/modification/update_salle.html", nom="Modifier un théâtre", salle=update_salle,
+                                   theatres=institutions_theatrales)
@@ -0,0 +1,64 @@
+# Routes des comptes utilisateurs : inscription, connexion et déconnexion
+# Import des librairies
+from flask import Blueprint, render_template, request, flash, redirect
+from flask_login import login_user, current_user, logout_user
+
+# Import des modèles de la base de données
+from ..modeles.utilisateurs import User
+
+
+utilisateurs = Blueprint("utilisateurs", __name__)
+
+
+# Route pour le formulaire d'inscription
+# Le succès et les erreurs sont gérés avec flash
+@utilisateurs.route("/inscription", methods=["GET", "POST"])
+def inscription():
+    if request.method == "POST":
+        statut, donnees = User.creer(
+            login=request.form.get("login", None),
+            email=request.form.get("email", None),
+            nom=request.form.get("nom", None),
+            motdepasse=request.form.get("motdepasse", None)
+        )
+        if statut is True:
+            flash("Enregistrement effectué. Identifiez-vous maintenant", "success")
+            return redirect("/")
+        else:
+            flash("Les erreurs suivantes ont été rencontrées : " + ",".join(donnees), "error")
+            return render_template("pages/inscription.html")
+    else:
+        return render_template("pages/inscription.html")
+
+
+# Route pour permettre la connexion de l'utilisateur
+# On vérifie d'abord que l'utilisateur n'est pas déjà connecté, il en est informé avec flash
+# Quand le formulaire est envoyé, flash informe du succès ou des erreurs survenues
+# Si la connexion est effectuée, l'utilisateur est renvoyé vers la page d'accueil
+@utilisateurs.route("/connexion", methods=["POST", "GET"])
+def connexion():
+    if current_user.is_authenticated is True:
+        flash("Vous êtes déjà connecté-e", "info")
+        return redirect("/")
+    if request.method == "POST":
+        utilisateur = User.identification(
+            login=request.form.get("login", None),
+            motdepasse=request.form.get("motdepasse", None)
+        )
+        if utilisateur:
+            flash("Vous êtes à présent connecté-e", "success")
+            login_user(utilisateur)
+            return redirect("/")
+        else:
+            flash("Les identifiants n'ont pas été reconnus", "error")
+
+    return render_template("pages/connexion.html")
+
+
+# Route pour permettre la déconnexion
+@utilisateurs.route("/deconnexion", methods=["POST", "GET"])
+def deconnexion():
+    if current_user.is_authenticated is True:
+        logout_user()
+    flash("Vous êtes déconnecté-e", "info")
+    return redirect("/")
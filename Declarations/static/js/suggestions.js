@@ -0,0 +1,60 @@
+// Suggestions pendant la saisie des champs qui désignent un enregistrement (macro champ_reference,
+// templates/partials/reference.html) : le texte saisi est envoyé à /suggest/<liste>?q= et les libellés renvoyés sont
+// proposés sous le champ ; un clic sur un libellé inscrit son id dans le champ caché envoyé avec le formulaire. Tant
+// qu'aucune suggestion n'est choisie, le champ est invalide et le navigateur bloque l'envoi du formulaire.
+document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll("input.suggestion").forEach(function (saisie) {
+        var champ = document.getElementById(saisie.dataset.champ);
+        var liste = saisie.nextElementSibling;
+        var minuterie = null;
+        var demande = 0;
+
+        function vider() {
+            liste.innerHTML = "";
+        }
+
+        // le champ caché n'est pas vérifié par le navigateur : c'est le champ saisi qui porte l'erreur
+        function verifier() {
+            saisie.setCustomValidity(champ.value ? "" : "Choisissez une suggestion dans la liste.");
+        }
+        verifier();
+
+        saisie.addEventListener("input", function () {
+            // le texte modifié ne désigne plus l'enregistrement choisi
+            champ.value = "";
+            verifier();
+            clearTimeout(minuterie);
+            var texte = saisie.value.trim();
+            if (!texte) {
+                vider();
+                return;
+            }
+            // on attend une courte pause dans la frappe avant d'interroger le serveur
+            minuterie = setTimeout(function () {
+                var numero = ++demande;
+                fetch(saisie.dataset.url + "?q=" + encodeURIComponent(texte))
+                    .then(function (reponse) { return reponse.json(); })
+                    .then(function (resultats) {
+                        // une réponse arrivée après celle d'une saisie plus récente est ignorée
+                        if (numero !== demande) {
+                            return;
+                        }
+                        vider();
+                        resultats.forEach(function (resultat) {
+                            var bouton = document.createElement("button");
+                            bouton.type = "button";
+                            bouton.className = "list-group-item list-group-item-action";
+                            bouton.textContent = resultat.libelle;
+                            bouton.addEventListener("click", function () {
+                                champ.value = resultat.id;
+                                saisie.value = resultat.libelle;
+                                verifier();
+                                vider();
+                            });
+                            liste.appendChild(bouton);
+                        });
+                    });
+            }, 150);
+        });
+    });
+});
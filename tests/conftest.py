@@ -0,0 +1,96 @@
+# Fixtures des tests
+# Chaque test reçoit une application créée sur une copie de db.sqlite (les migrations y sont appliquées par
+# create_app()), en mode test : une page qui dépasse NB_MAX_SELECT requêtes SELECT lève TropDeRequetes (voir
+# instrumentation.py). Le cache des pages est désactivé pour que chaque requête soit réellement exécutée.
+# La base livrée contient peu de procès-verbaux : la copie en reçoit PROCES_VERBAUX_AJOUTES de plus, tous liés au même
+# commissaire, au même théâtre et à la même source, pour qu'une relation chargée ligne par ligne dépasse le budget.
+import os
+import shutil
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from Declarations.app import create_app, db
+
+
+BASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db.sqlite")
+# procès-verbaux ajoutés à la copie de la base (plus de trois fois NB_MAX_SELECT)
+PROCES_VERBAUX_AJOUTES = 40
+
+
+def peupler(nombre):
+    """
+    Fonction qui ajoute des procès-verbaux, chacun avec une nouvelle victime, un nouvel objet et une ligne d'audit
+    d'un nouvel utilisateur, au commissaire, au théâtre et à la source du premier procès-verbal
+    :param nombre: nombre de procès-verbaux ajoutés
+    """
+    id_theatre, id_source, id_commissaire = db.session.execute(
+        "SELECT id_theatre, id_source, id_commissaire FROM proces_verbal ORDER BY id LIMIT 1").first()
+    for numero in range(nombre):
+        id_victime = db.session.execute("INSERT INTO personne (nom, prenom, qualite) VALUES (:nom, 'Jean', 'acteur')",
+                                        {"nom": "Victime{}".format(numero)}).lastrowid
+        id_objet = db.session.execute("INSERT INTO objet (type) VALUES (:type)",
+                                      {"type": "objet {}".format(numero)}).lastrowid
+        # chaque procès-verbal est enregistré par un utilisateur différent (historique du commissaire)
+        id_user = db.session.execute("INSERT INTO user (nom, login, email, password) VALUES (:nom, :nom, :email, '')",
+                                     {"nom": "auteur{}".format(numero),
+                                      "email": "auteur{}@exemple.fr".format(numero)}).lastrowid
+        db.session.execute("INSERT INTO authorship (id_user, id_personne, date) VALUES (:id_user, :id_personne, "
+                           "datetime('now'))", {"id_user": id_user, "id_personne": id_commissaire})
+        db.session.execute("INSERT INTO proces_verbal (date_pv, id_theatre, id_source, id_commissaire, id_victime, "
+                           "id_objet) VALUES (:date_pv, :id_theatre, :id_source, :id_commissaire, :id_victime, "
+                           ":id_objet)",
+                           {"date_pv": "1785-01-{:02d}".format(numero % 28 + 1), "id_theatre": id_theatre,
+                            "id_source": id_source, "id_commissaire": id_commissaire, "id_victime": id_victime,
+                            "id_objet": id_objet})
+    db.session.commit()
+
+
+@pytest.fixture
+def app(tmp_path):
+    chemin = tmp_path / "db.sqlite"
+    shutil.copyfile(BASE, chemin)
+    application = create_app({"BASE_DE_DONNEES": "sqlite:///{}".format(chemin), "TESTING": True, "CACHE_TYPE": None,
+                              "SECRET_KEY": "essai", "TACHES_REPERTOIRE": str(tmp_path / "taches")})
+    with application.app_context():
+        peupler(PROCES_VERBAUX_AJOUTES)
+    return application
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def client_connecte(client):
+    client.post("/inscription", data={"login": "essai", "email": "essai@exemple.fr", "nom": "Essai",
+                                      "motdepasse": "motdepasse"})
+    client.post("/connexion", data={"login": "essai", "motdepasse": "motdepasse"})
+    return client
+
+
+@pytest.fixture
+def compteur_select(app):
+    """
+    Fixture qui renvoie un gestionnaire de contexte : dans le bloc with, la liste reçue contient les requêtes SELECT
+    envoyées à la base (principale et lectures)
+    """
+    @contextmanager
+    def compter():
+        instructions = []
+
+        def enregistrer(connexion, curseur, instruction, parametres, contexte, executemany):
+            if instruction.lstrip().upper().startswith("SELECT"):
+                instructions.append(instruction)
+
+        moteurs = db.moteurs(app)
+        for moteur in moteurs:
+            event.listen(moteur, "before_cursor_execute", enregistrer)
+        try:
+            yield instructions
+        finally:
+            for moteur in moteurs:
+                event.remove(moteur, "before_cursor_execute", enregistrer)
+    return compter
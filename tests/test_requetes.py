@@ -0,0 +1,65 @@
+# Nombre de requêtes SELECT par page
+# Les pages d'index et les pages individuelles ne doivent pas charger leurs relations une par une (problème N+1) :
+# chacune doit rester sous NB_MAX_SELECT requêtes, quel que soit le nombre d'enregistrements liés. Les pages
+# individuelles sont testées sur les enregistrements qui ont le plus de procès-verbaux.
+import pytest
+
+from Declarations.app import db
+from Declarations.instrumentation import TropDeRequetes
+
+
+# pages d'index publiques
+INDEX = ["/", "/proces_verbaux", "/personnes", "/commissaires", "/theatres", "/adresses", "/objets_voles", "/sources",
+         "/statistiques", "/recherche?keyword=chenu", "/api/v1/proces_verbaux", "/api/v1/personnes"]
+# pages individuelles : modèle de chemin -> requête qui renvoie l'id de l'enregistrement le plus lié
+DETAILS = {
+    "/proces_verbaux/{}": "SELECT min(id) FROM proces_verbal",
+    "/personnes/{}": "SELECT id_commissaire FROM proces_verbal GROUP BY id_commissaire ORDER BY count(*) DESC",
+    "/theatres/{}": "SELECT id_theatre FROM proces_verbal GROUP BY id_theatre ORDER BY count(*) DESC",
+    "/objets_voles/{}": "SELECT id_objet FROM proces_verbal GROUP BY id_objet ORDER BY count(*) DESC",
+    "/sources/{}": "SELECT id_source FROM proces_verbal GROUP BY id_source ORDER BY count(*) DESC",
+    "/salles/{}": "SELECT min(id) FROM salle_theatre",
+    "/api/v1/proces_verbaux/{}": "SELECT min(id) FROM proces_verbal",
+    "/api/v1/personnes/{}": "SELECT id_victime FROM proces_verbal GROUP BY id_victime ORDER BY count(*) DESC",
+}
+# pages réservées aux utilisateurs connectés ({pv} : premier procès-verbal, {personne} : son commissaire)
+CONNECTEES = ["/ajout_proces_verbal", "/proces_verbaux/{pv}/update", "/ajout_personne", "/personnes/doublons",
+              "/admin/jobs", "/historique/personne/{personne}", "/api/v1/personnes/{personne}/historique",
+              "/api/v1/modifications"]
+
+
+def identifiant(app, requete):
+    with app.app_context():
+        ligne = db.session.execute(requete).first()
+    return ligne[0] if len(ligne) == 1 else tuple(ligne)
+
+
+def verifier_budget(app, client, compteur_select, chemin):
+    with compteur_select() as instructions:
+        reponse = client.get(chemin)
+    assert reponse.status_code == 200, chemin
+    assert len(instructions) <= app.config["NB_MAX_SELECT"], "\n".join([chemin] + instructions)
+
+
+@pytest.mark.parametrize("chemin", INDEX)
+def test_index(app, client, compteur_select, chemin):
+    verifier_budget(app, client, compteur_select, chemin)
+
+
+@pytest.mark.parametrize("modele", DETAILS)
+def test_details(app, client, compteur_select, modele):
+    verifier_budget(app, client, compteur_select, modele.format(identifiant(app, DETAILS[modele])))
+
+
+@pytest.mark.parametrize("modele", CONNECTEES)
+def test_pages_connectees(app, client_connecte, compteur_select, modele):
+    pv, personne = identifiant(app, "SELECT id, id_commissaire FROM proces_verbal ORDER BY id LIMIT 1")
+    chemin = modele.format(pv=pv, personne=personne)
+    verifier_budget(app, client_connecte, compteur_select, chemin)
+
+
+def test_depassement(app, client):
+    # en mode test, une page qui dépasse le budget fait échouer la requête
+    app.config["NB_MAX_SELECT"] = 1
+    with pytest.raises(TropDeRequetes):
+        client.get("/proces_verbaux/{}".format(identifiant(app, "SELECT min(id) FROM proces_verbal")))
@@ -0,0 +1,101 @@
+# File d'attente des tâches
+# Réservation par une seule instruction UPDATE (deux fils ne prennent jamais la même tâche), reprise des tâches
+# abandonnées puis échec quand leurs essais sont épuisés, jeton de réservation qui protège l'état enregistré par le fil
+# qui a repris la tâche, et clé qui n'enregistre qu'une tâche en attente à la fois (voir modeles/taches.py).
+import threading
+
+import pytest
+
+from Declarations.app import db
+from Declarations.modeles.taches import tache, differer, reserver, executer, Progression, TacheReprise
+
+
+# tâche d'essai, sans effet sur la base
+@tache("essai")
+def tache_essai(progression, valeur=None):
+    return {"valeur": valeur}
+
+
+def etat(id):
+    return tuple(db.session.execute("SELECT etat, tentatives, jeton FROM tache WHERE id = :id", {"id": id}).first())
+
+
+def abandonner(id):
+    # la progression de la tâche n'a pas bougé depuis plus de TACHES_EXPIRATION secondes
+    db.session.execute("UPDATE tache SET date_progression = datetime('now', '-1 hour') WHERE id = :id", {"id": id})
+    db.session.commit()
+
+
+def test_reservation_par_un_seul_fil(app):
+    with app.app_context():
+        ids = [differer("essai", valeur=numero) for numero in range(3)]
+        db.session.commit()
+
+    depart = threading.Barrier(6)
+    reservees = []
+
+    def fil():
+        with app.app_context():
+            depart.wait()
+            reservees.append(reserver())
+            db.session.remove()
+
+    fils = [threading.Thread(target=fil) for numero in range(6)]
+    for un_fil in fils:
+        un_fil.start()
+    for un_fil in fils:
+        un_fil.join()
+
+    obtenues = sorted(reservee[0] for reservee in reservees if reservee is not None)
+    assert obtenues == sorted(ids)
+    assert reservees.count(None) == 3
+
+
+def test_tache_abandonnee_reprise_puis_en_echec(app):
+    with app.app_context():
+        id = differer("essai", tentatives_max=2)
+        db.session.commit()
+        premiere = reserver()
+        assert premiere[0] == id and premiere[3] == 1
+
+        abandonner(id)
+        seconde = reserver()
+        assert seconde[0] == id and seconde[3] == 2
+        assert seconde[5] != premiere[5]
+
+        # essais épuisés : la tâche passe en échec au lieu d'être reprise
+        abandonner(id)
+        assert reserver() is None
+        assert etat(id) == ("echec", 2, None)
+
+
+def test_jeton_perime_ignore(app):
+    with app.app_context():
+        id = differer("essai", valeur=1)
+        db.session.commit()
+        ancienne = reserver()
+        abandonner(id)
+        nouvelle = reserver()
+
+        # le fil qui a perdu la tâche ne peut plus enregistrer ni sa progression, ni son résultat
+        with pytest.raises(TacheReprise):
+            Progression(id, ancienne[5]).avancer(0.5)
+        assert executer(*ancienne) is False
+        assert etat(id) == ("en_cours", 2, nouvelle[5])
+
+        assert executer(*nouvelle) is True
+        assert etat(id)[0] == "terminee"
+
+
+def test_cle_une_seule_tache_en_attente(app):
+    with app.app_context():
+        id = differer("essai", cle="essai:1")
+        assert differer("essai", cle="essai:1") is None
+        # une tâche sans clé n'est jamais fusionnée
+        assert differer("essai") is not None
+        db.session.commit()
+
+        # l'index unique ne porte que sur les tâches en attente : une fois la tâche réservée, la clé est libre
+        assert reserver()[0] == id
+        assert differer("essai", cle="essai:1") is not None
+        db.session.commit()
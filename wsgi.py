@@ -0,0 +1,18 @@
+# Point d'entrée WSGI de production, prévu pour être chargé une seule fois avant la création des workers :
+#     gunicorn --preload --workers 4 wsgi:app
+# Avec --preload, le processus maître crée l'application (imports, migrations, templates compilés) puis crée les
+# workers par fork : ils partagent ces pages de mémoire en copie sur écriture au lieu de tout recharger chacun. Les
+# connexions à la base de données ne sont ouvertes qu'ensuite, par chaque worker (voir create_app()).
+import gc
+
+from Declarations.app import create_app
+
+app = create_app()
+
+# On compile tous les templates dans le processus maître plutôt qu'à la première page de chaque worker
+for nom_template in app.jinja_env.list_templates():
+    app.jinja_env.get_template(nom_template)
+
+# Les objets créés jusqu'ici ne seront jamais libérés : on les retire du ramasse-miettes, dont les parcours
+# écriraient dans leurs pages de mémoire et les recopieraient dans chaque worker
+gc.freeze()